@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+"""This module defines the batch mode: statements are run without the interactive
+shell and query results are streamed in a machine readable format
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license: GNU GPL V3
+"""
+
+# Python imports:
+import os
+import sys
+
+# Pysql imports:
+from .pysqlexception import PysqlException
+from .pysqlhelpers import splitScript
+from .pysqlwriters import newWriter, writeQuery, WRITERS
+
+# Exit codes
+EXIT_OK = 0  # All statements succeeded
+EXIT_SQL_ERROR = 1  # A statement failed. Following statements were not executed
+EXIT_CONNECT_ERROR = 2  # Cannot connect to database
+EXIT_USAGE_ERROR = 3  # Invalid arguments or unreadable script
+
+# Number of rows fetched by round trip
+BATCH_FETCH_SIZE = 500
+
+
+def readStatements(sql=None, fileName=None):
+    """Reads statements to execute from the command line, a script or standard input
+    @param sql: statements given on command line
+    @param fileName: script path. "-" is standard input
+    @return: list of (kind, statement) (see splitScript)"""
+    if sql is not None:
+        lines = sql.splitlines()
+    elif fileName is None or fileName == "-":
+        lines = sys.stdin.readlines()
+    else:
+        try:
+            script = open(fileName, mode="r", encoding="utf-8")
+            try:
+                lines = script.readlines()
+            finally:
+                script.close()
+        except IOError as e:
+            raise PysqlException(_("Cannot read script %s: %s") % (fileName, e))
+    return [(kind, statement) for (kind, statement) in splitScript(lines) if kind in ("sql", "plsql")]
+
+
+def runBatch(connectString, statements, format="tsv", header=True, output=None):
+    """Executes statements one after the other. Query results are written to output
+    as they are fetched. Errors are written to standard error. Execution stops at the
+    first error and work not committed by the statements is rolled back
+    @param connectString: Oracle connection string to database
+    @param statements: list of (kind, statement) (see readStatements)
+    @param format: output format of query results (see pysqlwriters.WRITERS)
+    @param header: writes column names before the rows of each query
+    @param output: text file like object with a binary buffer attribute (default is standard output)
+    @return: exit code"""
+    from .pysqldb import PysqlDb  # Needs cx_Oracle
+    if output is None:
+        output = sys.stdout
+    try:
+        if WRITERS[format].binary:
+            writer = newWriter(format, output.buffer, header)
+        else:
+            writer = newWriter(format, output, header)
+    except PysqlException as e:
+        sys.stderr.write("pysql: %s\n" % e)
+        return EXIT_USAGE_ERROR
+    try:
+        db = PysqlDb(connectString)
+    except PysqlException as e:
+        sys.stderr.write("pysql: %s\n" % e)
+        return EXIT_CONNECT_ERROR
+    try:
+        for kind, statement in statements:
+            try:
+                writeQuery(db, statement, writer, BATCH_FETCH_SIZE)
+            except PysqlException as e:
+                sys.stderr.write("pysql: %s\n%s\n" % (e, statement))
+                return EXIT_SQL_ERROR
+    except BrokenPipeError:
+        # Reader is gone (head for example). Not an error
+        sys.stdout = open(os.devnull, mode="w")
+    finally:
+        # Results already written stay readable after an error (arrow footer for example)
+        try:
+            writer.close()
+        except BrokenPipeError:
+            sys.stdout = open(os.devnull, mode="w")
+        try:
+            db.close()
+        except PysqlException:
+            pass
+    return EXIT_OK
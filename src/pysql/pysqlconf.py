@@ -9,15 +9,54 @@ that handles all pysql configuration stuff
 # Python imports:
 import sys
 import os
-from os.path import expandvars, join
-import pickle
+from os.path import expandvars, isfile, join
 from configparser import ConfigParser
-import readline
+from weakref import ref, WeakMethod
 
 # Pysql imports:
 from .pysqlexception import PysqlException
 from .pysqlcolor import BOLD, CYAN, GREEN, RED, RESET
 
+# Number of history commands recalled with readline at startup
+HISTORY_RECALL_SIZE = 1000
+
+# Parameter name => (default value, type, allowed values)
+# Type is int or float (allowed values are a (min, max) range, "auto" may be allowed too),
+# choice (allowed values are listed) or str (allowed is True if value cannot be empty)
+YES_NO = ("yes", "no")
+
+PARAMETERS = {
+    "case_sensitive"     : ("no", "choice", YES_NO),
+    "completionlistsize" : (100, "int", (2, 10000)),
+    "fetchsize"          : (30, "int", (2, 10000)),
+    "termwidth"          : ("auto", "int", (2, 10000, "auto")),
+    "widthmin"           : (5, "int", (2, 10000)),
+    "transpose"          : ("no", "choice", YES_NO),
+    "colsep"             : ("space", "str", True),
+    "shrink"             : ("yes", "choice", YES_NO),
+    "echo"               : ("no", "choice", YES_NO),
+    "roundtrips"         : ("no", "choice", YES_NO),
+    "lob_preview"        : (100, "int", (0, 100000)),  # Zero displays whole LOB
+    "sampler_interval"   : (5, "int", (1, 3600)),  # Seconds
+    "sampler_size"       : (720, "int", (2, 10000)),
+    "unit"               : ("mb", "choice", ("b", "kb", "mb", "gb", "tb", "pb")),
+    "compress_thread"    : ("yes", "choice", YES_NO),  # Compresses exported files in a separate thread
+    "graph_program"      : ("auto", "choice", ("auto", "circo", "dot", "dotty", "fdp", "lefty", "neato", "twopi")),
+    "graph_format"       : ("png", "choice", ("dia", "dot", "gif", "jpg", "jpeg", "mp", "pcl", "pic",
+                                              "plain", "png", "ps", "ps2", "svg", "svgz", "wbmp")),
+    "graph_fontname"     : ("courier", "choice", ("arial", "courier", "times-roman", "verdana")),
+    "graph_fontsize"     : (10.0, "float", (2, 10000)),
+    "graph_fontcolor"    : ("black", "str", False),
+    "graph_tablecolor"   : ("ivory", "str", False),
+    "graph_linkcolor"    : ("black", "str", False),
+    "graph_indexcolor"   : ("skyblue", "str", False),
+    "graph_bordercolor"  : ("black", "str", False),
+    "graph_linklabel"    : ("no", "choice", YES_NO),
+    "graph_depmaxdepth"  : (8, "int", (2, 10000)),
+    "graph_depmaxnodes"  : (100, "int", (2, 10000)),
+    "graph_viewer"       : ("auto", "str", True)
+    }
+
 
 class PysqlConf:
     """ Handles configuration stuff"""
@@ -44,61 +83,38 @@ class PysqlConf:
         # Config file path
         self.configPath = join(basePath, "pysqlrc")
 
-        # Cache file path
+        # Cache directory path
         self.cachePath = join(basePath, "pysqlcache")
 
-        # History file path
+        # History file path (readline format of previous versions, imported once in history database)
         self.historyPath = join(basePath, "pysqlhistory")
 
+        # History database path
+        self.historyDbPath = join(basePath, "pysqlhistory.db")
+
         # User SQL library file path
         self.sqlLibPath = join(basePath, "pysqlsqllibrary")
 
+        # User SQL library database path (previous versions pickled library to sqlLibPath)
+        self.sqlLibDbPath = join(basePath, "pysqllibrary.db")
+
         # Config changed flag
         self.changed = False
 
-        # User defined sql Library
-        self.sqlLibrary = {}
+        # User defined sql Library. Loaded on first use (see sqlLibrary property)
+        self.__sqlLibrary = None
 
-        # Tries to load previous history list from disk
-        try:
-            readline.read_history_file(self.historyPath)
-        except Exception as e:
-            # Cannot load any previous history. Start from a clear one
-            pass
-
-        # Tries to load previous sqlLibrary from disk
-        try:
-            self.sqlLibrary = pickle.load(open(self.sqlLibPath, mode="rb"))
-        except Exception as e:
-            # Cannot load any previous sqlLibrary, start from a clear one
-            pass
+        # Shell history. Opened by interactive sessions only (see loadHistory)
+        self.history = None
 
         # Load default value for all parameters
-        self.default = {
-            "case_sensitive"     : "no",
-            "completionlistsize" : 100,
-            "fetchsize"          : 30,
-            "termwidth"          : "auto",
-            "widthmin"           : 5,
-            "transpose"          : "no",
-            "colsep"             : "space",
-            "shrink"             : "yes",
-            "echo"               : "no",
-            "unit"               : "mb",
-            "graph_program"      : "auto",
-            "graph_format"       : "png",
-            "graph_fontname"     : "courier",
-            "graph_fontsize"     : "10.0",
-            "graph_fontcolor"    : "black",
-            "graph_tablecolor"   : "ivory",
-            "graph_linkcolor"    : "black",
-            "graph_indexcolor"   : "skyblue",
-            "graph_bordercolor"  : "black",
-            "graph_linklabel"    : "off",
-            "graph_depmaxdepth"  : 8,
-            "graph_depmaxnodes"  : 100,
-            "graph_viewer"       : "auto"
-            }
+        self.default = dict([(key, parameter[0]) for (key, parameter) in list(PARAMETERS.items())])
+
+        # Parameter values parsed according to their type (see PARAMETERS)
+        self.values = {}
+
+        # Functions called when a parameter is set (weak references)
+        self.listeners = []
 
         # Searches for config file in $HOME (Unix) or %HOMEPATH% (Windows)
 
@@ -120,6 +136,9 @@ class PysqlConf:
         # Host codec used to display on and read from string on terminal
         self.codec = None
 
+        # Parses all values once for all
+        self.__loadValues()
+
     def getConfig(cls):
         """Factory for configuration instance singleton
         @return: PysqlConf instance"""
@@ -133,26 +152,25 @@ class PysqlConf:
         """ Gets the value of the parameter key
         @param key: parameter name
         @type key: string
-        @return: str or int (if cast if possible)
+        @return: str, int or float according to parameter type
         """
-        key = key.lower()
-        if self.configParser is not None:
-            try:
-                value = self.configParser.get("PYSQL", key)
-            except Exception:
-                value = self.getDefault(key)
-        else:
-            value = self.getDefault(key)
-
-        # Tries to cast to numeric. If it does not work, we assume the value is a string
         try:
-            value = int(value)
-        except (ValueError, TypeError):
-            try:
-                value = float(value)
-            except (ValueError, TypeError):
-                pass
-        return value
+            return self.values[key]
+        except KeyError:
+            key = key.lower()
+            if key in self.values:
+                return self.values[key]
+            return self.getDefault(key)
+
+    def addListener(self, listener):
+        """Registers a function called with (key, value) each time a parameter is set.
+        Listener is weakly referenced: registering does not keep its object alive
+        @param listener: function or bound method"""
+        self.listeners = [i for i in self.listeners if i() is not None]
+        if hasattr(listener, "__self__"):
+            self.listeners.append(WeakMethod(listener))
+        else:
+            self.listeners.append(ref(listener))
 
     def getAll(self):
         """Gets all defined parameters
@@ -198,69 +216,55 @@ class PysqlConf:
         @param key: key parameter to be tested
         @param value: value to be tested
         @return: True if value is correct, else False"""
+        try:
+            self.__parse(key, value)
+            return True
+        except (ValueError, TypeError):
+            return False
+        except KeyError:
+            print("(DEBUG) Key %s does not exist or does not have a verify routine !" % key)
+            return False
+
+    def __parse(self, key, value):
+        """Converts a parameter value to the parameter type
+        @return: str, int or float
+        @raise ValueError: if value is not allowed for this parameter
+        @raise KeyError: if parameter does not exist"""
+        (default, kind, allowed) = PARAMETERS[key]
         # Expanding shell variables
         if isinstance(value, str):
             value = os.path.expandvars(value)
-
-        # Integer parameter
-        if key == "termwidth" and value == "auto":
-            return True
-        elif key in ("termwidth",
-                     "fetchsize",
-                     "widthmin",
-                     "completionlistsize",
-                     "graph_fontsize",
-                     "graph_depmaxdepth",
-                     "graph_depmaxnodes"):
-            try:
+        if kind == "int" and value == "auto" and "auto" in allowed:
+            return value
+        if kind in ("int", "float"):
+            if kind == "int":
                 value = int(value)
-            except (ValueError, TypeError):
-                return False
-            if value > 10000:
-                return False
-            if value > 1:
-                return True
-            else:
-                return False
-        # Boolean parameter
-        elif key in ("transpose", "shrink", "echo", "graph_linklabel", "case_sensitive"):
-            if value in ("yes", "no"):
-                return True
-            else:
-                return False
-        # String parameter
-        elif key in ("colsep", "graph_viewer"):
-            if len(value) > 0:
-                return True
             else:
-                return False
-        # Lists defined string parameter
-        elif key == "unit":
-            if value in ("b", "kb", "mb", "gb", "tb", "pb"):
-                return True
-            else:
-                return False
-        elif key == "graph_program":
-            if value in ("auto", "circo", "dot", "dotty", "fdp", "lefty", "neato", "twopi"):
-                return True
-            else:
-                return False
-        elif key == "graph_format":
-            if value in ("dia", "dot", "gif", "jpg", "jpeg", "mp", "pcl", "pic", \
-                         "plain", "png", "ps", "ps2", "svg", "svgz", "wbmp"):
-                return True
-            else:
-                return False
-        elif key == "graph_fontname":
-            if value in ("arial", "courier", "times-roman", "verdana"):
-                return True
-            else:
-                return False
-        elif key in ("graph_bordercolor", "graph_linkcolor", "graph_indexcolor", "graph_tablecolor"):
-            return True
-        else:
-            print("(DEBUG) Key %s does not exist or does not have a verify routine !" % key)
-            return False
+                value = float(value)
+            if not allowed[0] <= value <= allowed[1]:
+                raise ValueError(value)
+        elif kind == "choice":
+            if value not in allowed:
+                raise ValueError(value)
+        elif kind == "str":
+            value = str(value)
+            if allowed and not value:
+                raise ValueError(value)
+        return value
+
+    def __loadValues(self):
+        """Parses default and user values of all parameters. Invalid user values are ignored"""
+        for key, default in list(self.default.items()):
+            self.values[key] = self.__parse(key, default)
+        if self.configParser is not None and self.configParser.has_section("PYSQL"):
+            for (key, value) in self.configParser.items("PYSQL"):
+                try:
+                    self.values[key] = self.__parse(key, value)
+                except (ValueError, TypeError):
+                    print(RED + _("Ignoring invalid value %s of parameter %s") % (value, key) + RESET)
+                except KeyError:
+                    # Unknown parameter. Keep it for get()
+                    self.values[key] = value
 
     def set(self, key, value):
         """Sets the parameter « key » to « value »"""
@@ -272,12 +276,24 @@ class PysqlConf:
                 print(GREEN + _("(Config file created)") + RESET)
             if self.verify(key, value):
                 self.configParser.set("PYSQL", key, value)
+                self.values[key] = self.__parse(key, value)
                 self.setChanged(True)
+                self.__notify(key, self.values[key])
             else:
                 raise PysqlException(_("Sorry, value %s is not valid for parameter %s") % (value, key))
         else:
             raise PysqlException(_("Cannot set config, no configParser exist !"))
 
+    def __notify(self, key, value):
+        """Calls listeners of parameter changes. Dead listeners are forgotten"""
+        listeners = []
+        for listener in self.listeners:
+            function = listener()
+            if function is not None:
+                function(key, value)
+                listeners.append(listener)
+        self.listeners = listeners
+
     def write(self):
         """Writes config to disk"""
         if self.changed:
@@ -292,25 +308,88 @@ class PysqlConf:
         else:
             print(CYAN + _("(no need to save)") + RESET)
 
-    def writeSqlLibrary(self):
-        """Writes user sql library to disk"""
+    def getSqlLibrary(self):
+        """Opens user sql library the first time it is used
+        @return: PysqlLibrary instance"""
+        if self.__sqlLibrary is None:
+            from .pysqllibrary import PysqlLibrary
+            library = None  # Library of previous versions, imported in a new library database
+            if not isfile(self.sqlLibDbPath) and isfile(self.sqlLibPath):
+                import pickle
+                try:
+                    libraryFile = open(self.sqlLibPath, mode="rb")
+                    try:
+                        library = pickle.load(libraryFile)
+                    finally:
+                        libraryFile.close()
+                except Exception as e:
+                    raise PysqlException(_("Fail to read user sql library %s. Error was:\n\t%s")
+                                % (self.sqlLibPath, e))
+            self.__sqlLibrary = PysqlLibrary(self.sqlLibDbPath)
+            if library:
+                self.__sqlLibrary.importDict(library)
+        return self.__sqlLibrary
+    sqlLibrary = property(getSqlLibrary)
+
+    def closeSqlLibrary(self):
+        """Closes user sql library if it has been opened. Changes are already on disk"""
+        if self.__sqlLibrary is not None:
+            self.__sqlLibrary.close()
+            self.__sqlLibrary = None
+
+    def readCache(self, name, key):
+        """Reads an object previously saved with writeCache
+        @param name: cache name (file name prefix)
+        @param key: any object with a stable repr identifying the cached object
+        @return: cached object or None if not found or unreadable"""
+        import pickle
         try:
-            pickle.dump(self.sqlLibrary, open(self.sqlLibPath, mode="wb"))
-        except Exception as e:
-            raise PysqlException(_("Fail to save user sql library to %s. Error was:\n\t%s")
-                        % (self.sqlLibPath, e))
+            cacheFile = open(self.__getCacheFile(name, key), mode="rb")
+            try:
+                (cachedKey, value) = pickle.load(cacheFile)
+            finally:
+                cacheFile.close()
+        except Exception:
+            return None
+        if cachedKey != key:
+            # Unlikely hash collision
+            return None
+        return value
 
-    def writeHistory(self):
-        """Writes shell history to disk"""
+    def writeCache(self, name, key, value):
+        """Saves an object in pysql cache directory
+        @param name: cache name (file name prefix)
+        @param key: any object with a stable repr identifying the cached object
+        @param value: picklable object to save"""
+        import pickle
         try:
-            # Open r/w and close file to create one if needed
-            historyFile = open(self.historyPath, mode="w", encoding="utf-8")
-            historyFile.close()
-            readline.set_history_length(1000)
-            readline.write_history_file(self.historyPath)
+            if not os.path.isdir(self.cachePath):
+                os.mkdir(self.cachePath)
+            cacheFile = open(self.__getCacheFile(name, key), mode="wb")
+            try:
+                pickle.dump((key, value), cacheFile, pickle.HIGHEST_PROTOCOL)
+            finally:
+                cacheFile.close()
         except Exception as e:
-            raise PysqlException(_("Fail to save history to %s. Error was:\n\t%s")
-                        % (self.historyPath, e))
+            raise PysqlException(_("Fail to write cache to %s. Error was:\n\t%s") % (self.cachePath, e))
+
+    def __getCacheFile(self, name, key):
+        """@return: path of the cache file of the given name and key"""
+        from hashlib import md5
+        return join(self.cachePath, "%s_%s" % (name, md5(repr(key).encode("utf-8")).hexdigest()))
+
+    def loadHistory(self):
+        """Opens shell history and recalls last commands with readline. Only interactive sessions need it
+        @return: PysqlHistory instance"""
+        import readline
+        from .pysqlhistory import PysqlHistory
+        self.history = PysqlHistory(self.historyDbPath)
+        if self.history.isEmpty() and isfile(self.historyPath):
+            # First start with history database
+            self.history.importFile(self.historyPath)
+        for entry in self.history.getLast(HISTORY_RECALL_SIZE):
+            readline.add_history(entry[4])
+        return self.history
 
     def setChanged(self, state):
         """Indicates if config data has changed. This is used
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 
-""" Database related stuff: Oracle interface (PysqlDb)
-and backgound queries (BgQuery)
+""" Database related stuff: Oracle interface (PysqlDb),
+round trip accounting (RoundTripCounter), session pool (PysqlDbPool) and backgound queries (BgQuery)
 @author: Sébastien Renard (sebastien.renard@digitalfox.org)
 @license: GNU GPL V3
 """
@@ -10,8 +10,13 @@ and backgound queries (BgQuery)
 
 # Python imports:
 from cx_Oracle import connect, DatabaseError, InterfaceError, LOB, STRING, SYSDBA, SYSOPER
+from cx_Oracle import BLOB, CLOB, NCLOB, LONG_BINARY, LONG_STRING
+import os
 import sys
+from re import sub
 from threading import Thread
+from zlib import crc32
+from queue import Queue, Empty
 from datetime import datetime, timedelta, date
 
 # Pysql imports:
@@ -19,6 +24,7 @@ from .pysqlexception import PysqlException, PysqlActionDenied, PysqlNotImplement
 from .pysqlconf import PysqlConf
 from .pysqlcolor import BOLD, CYAN, GREEN, GREY, RED, RESET
 from .pysqlhelpers import warn
+from .pysqlqueries import flashbackSql
 
 # Aditionnal cx_Oracle Import
 CX_STARTUP_SHUTDOWN = True
@@ -29,18 +35,146 @@ except ImportError:
     PRELIM_AUTH = 0  # Means that PRELIM_AUTH is not used.
 
 
+class RoundTripCounter:
+    """Counts client/server exchanges of a session"""
+    def __init__(self):
+        self.measureBytes = False  # Estimate size of fetched data (costs some cpu)
+        self.reset()
+
+    def reset(self):
+        """Sets all counters to zero"""
+        self.executes = 0  # Number of statements executed
+        self.fetches = 0  # Number of fetch calls sent to server
+        self.rows = 0  # Number of rows fetched
+        self.bytes = 0  # Estimated size of fetched data
+        self.transactions = 0  # Number of commit and rollback
+
+    def getRoundTrips(self):
+        """@return: total number of server round trips (int)"""
+        return self.executes + self.fetches + self.transactions
+
+    def addRows(self, rows):
+        """Accounts fetched rows"""
+        self.rows += len(rows)
+        if self.measureBytes:
+            for row in rows:
+                for value in row:
+                    if value is None:
+                        continue
+                    elif isinstance(value, (str, bytes)):
+                        self.bytes += len(value)
+                    else:
+                        self.bytes += len(str(value))
+
+
+def lobOutputTypeHandler(cursor, name, defaultType, size, precision, scale):
+    """Cursor output type handler that fetches LOB values inline with the rows
+    instead of LOB locators that need their own round trips to be read"""
+    if defaultType in (CLOB, NCLOB):
+        return cursor.var(LONG_STRING, arraysize=cursor.arraysize)
+    elif defaultType == BLOB:
+        return cursor.var(LONG_BINARY, arraysize=cursor.arraysize)
+
+
+class CountingCursor:
+    """Cursor wrapper that accounts round trips to a RoundTripCounter"""
+    def __init__(self, cursor, counter):
+        """
+        @param cursor: cx_Oracle cursor
+        @param counter: RoundTripCounter instance"""
+        self.__dict__["cursor"] = cursor
+        self.__dict__["counter"] = counter
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.cursor, name, value)
+
+    def execute(self, *args, **kwargs):
+        self.counter.executes += 1
+        return self.cursor.execute(*args, **kwargs)
+
+    def fetchmany(self, *args):
+        self.counter.fetches += 1
+        rows = self.cursor.fetchmany(*args)
+        self.counter.addRows(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        # Driver fetches arraysize rows by round trip, plus one to detect the end
+        self.counter.fetches += len(rows) // max(1, self.cursor.arraysize) + 1
+        self.counter.addRows(rows)
+        return rows
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany(self.cursor.arraysize)
+            if not rows:
+                return
+            for row in rows:
+                yield row
+
+
+class Fetcher(Thread):
+    """Fetches rows of a cursor by batches and puts them in a bounded queue,
+    so that next batches are fetched while current one is handled"""
+    def __init__(self, cursor, batchSize, depth):
+        """
+        @param cursor: cursor of an executed query
+        @param batchSize: number of rows fetched in one round trip
+        @param depth: maximum number of batches waiting in queue"""
+        Thread.__init__(self, daemon=True)
+        self.cursor = cursor
+        self.batchSize = batchSize
+        self.queue = Queue(depth)  # Row batches, then None at end of result or the error that stopped fetching
+        self.stopped = False
+
+    def run(self):
+        try:
+            while not self.stopped:
+                rows = self.cursor.fetchmany(self.batchSize)
+                if rows:
+                    self.queue.put(rows)
+                if len(rows) < self.batchSize:
+                    break
+        except (DatabaseError, InterfaceError) as e:
+            self.queue.put(e)
+            return
+        self.queue.put(None)
+
+    def stop(self):
+        """Stops fetching before end of result and waits for thread"""
+        self.stopped = True
+        while self.is_alive():
+            # Frees thread if it waits for room in queue
+            try:
+                self.queue.get(timeout=0.1)
+            except Empty:
+                pass
+        self.join()
+
+
 class PysqlDb:
     """ Handles database interface"""
     MAXIMUM_FETCH_SIZE = 10000  # Maximum size of a result set to fetch in one time
     FETCHALL_FETCH_SIZE = 30  # Size of cursor for fetching all type queries
+    PIPELINE_DEPTH = 4  # Number of batches fetched ahead by pipeline
+    LOB_CHUNKS_BY_READ = 16  # Number of LOB chunks read in one round trip when LOB is saved to file
+    LOB_EXPORT_FETCH_SIZE = 50  # Number of LOB locators fetched in one round trip when LOB are exported
 
     def __init__(self, connectString, mode=""):
         # Instance attributs
         self.connection = None
         self.cursor = None
+        self.timer = None  # CommandTimer of the current command, if any
+        self.counter = RoundTripCounter()  # Round trips of the current command
 
         # Read Conf
         self.conf = PysqlConf.getConfig()
+        self.fetchSize = self.conf.get("fetchsize")
+        self.conf.addListener(self.__confChanged)
 
         # Keep connection string to allow future connection
         self.connectString = connectString
@@ -71,7 +205,7 @@ class PysqlDb:
         try:
             self.connection.startup()
             self.connection = connect("/", mode=SYSDBA, threaded=True)
-            self.cursor = self.connection.cursor()
+            self.cursor = self.__newCursor()
             self.cursor.execute("alter database mount")
             if mode == "normal":
                 self.cursor.execute("alter database open")
@@ -99,6 +233,7 @@ class PysqlDb:
     def commit(self):
         """Commit pending transaction"""
         try:
+            self.counter.transactions += 1
             self.connection.commit()
         except DatabaseError as e:
             raise PysqlException(_("Cannot commit: %s") % e)
@@ -106,6 +241,7 @@ class PysqlDb:
     def rollback(self):
         """Rollback pending transaction"""
         try:
+            self.counter.transactions += 1
             self.connection.rollback()
         except DatabaseError as e:
             raise PysqlException(_("Cannot rollback: %s") % e)
@@ -117,38 +253,57 @@ class PysqlDb:
         So the getDescription does not work for executeAll"""
         try:
             if self.cursor is None:
-                self.cursor = self.connection.cursor()
+                self.cursor = self.__newCursor()
             self.cursor.arraysize = self.FETCHALL_FETCH_SIZE
-            if param == []:
-                self.cursor.execute(sql)
-            else:
-                self.cursor.prepare(sql)
-                self.cursor.execute(None, param)
-            return self.cursor.fetchall()
+            self.__enterPhase("execute")
+            try:
+                if param == []:
+                    self.cursor.execute(sql)
+                else:
+                    self.cursor.prepare(sql)
+                    self.cursor.execute(None, param)
+            finally:
+                self.__leavePhase()
+            self.__enterPhase("fetch")
+            try:
+                return self.cursor.fetchall()
+            finally:
+                self.__leavePhase()
         except (DatabaseError, InterfaceError) as e:
             raise PysqlException(_("Cannot execute query: %s") % e)
 
-    def execute(self, sql, fetch=True, cursorSize=None):
+    def execute(self, sql, fetch=True, cursorSize=None, stream=False):
         """Executes the request given in parameter.
 
          For a select request, returns a list of record and a flag to indicate if there's more record
          For insert/update/delete, return the number of record processed
          @param fetch: for select queries, start fetching (default is true)
-         @param cursorSize: if defined, overide the config cursor size"""
+         @param cursorSize: if defined, overide the config cursor size
+         @param stream: for queries, nothing is fetched and None is returned. Use fetchBatches to read result"""
         if not sys.stdin.isatty():
             fetch = False
         try:
             if self.cursor is None:
-                self.cursor = self.connection.cursor()
+                self.cursor = self.__newCursor()
             if cursorSize:
                 self.cursor.arraysize = cursorSize
             else:
-                self.cursor.arraysize = self.conf.get("fetchSize")
-            self.cursor.execute(sql)
-            if sql.upper().startswith("SELECT") and fetch:
+                self.cursor.arraysize = self.fetchSize
+            self.__enterPhase("execute")
+            try:
+                self.cursor.execute(sql)
+            finally:
+                self.__leavePhase()
+            if stream and self.cursor.description is not None:
+                return None
+            elif sql.upper().startswith("SELECT") and fetch:
                 return self.fetchNext()
             elif sql.upper().startswith("SELECT") and not fetch:
-                return (self.cursor.fetchall(), False)
+                self.__enterPhase("fetch")
+                try:
+                    return (self.cursor.fetchall(), False)
+                finally:
+                    self.__leavePhase()
             else:
                 return self.getRowCount()
         except (DatabaseError, InterfaceError) as e:
@@ -160,7 +315,7 @@ class PysqlDb:
         @return: None but raise PysqlException if sql cannot be validated"""
         try:
             if self.cursor is None:
-                self.cursor = self.connection.cursor()
+                self.cursor = self.__newCursor()
             self.cursor.arraysize = 1
             if sql.upper().startswith("SELECT"):
                 self.cursor.execute(sql)
@@ -170,6 +325,7 @@ class PysqlDb:
                or sql.upper().startswith("DELETE")):
                 self.connection.begin()
                 self.cursor.execute(sql)
+                self.counter.transactions += 1
                 self.connection.rollback()
                 return True
             else:
@@ -190,6 +346,106 @@ class PysqlDb:
             else:
                 return [i[0] + " (" + i[1].__name__ + ")" for i in self.cursor.description]
 
+    def getColumnTypes(self):
+        """@return: list of (Oracle type name, precision, scale) of columns of the current query"""
+        result = []
+        for column in self.cursor.description:
+            # cx_Oracle 8 types are DbType objects (DB_TYPE_NUMBER), older ones are classes (NUMBER)
+            typeName = getattr(column[1], "name", None) or column[1].__name__
+            if typeName.startswith("DB_TYPE_"):
+                typeName = typeName[len("DB_TYPE_"):]
+            result.append((typeName.upper(), column[4], column[5]))
+        return result
+
+    def getLobColumns(self):
+        """@return: indexes of LOB columns of the current query (list of int)"""
+        if self.cursor is None or self.cursor.description is None:
+            return []
+        return [i for (i, column) in enumerate(self.cursor.description)
+                if column[1] in (CLOB, NCLOB, BLOB, LONG_STRING, LONG_BINARY)]
+
+    def saveLob(self, sql, fileName):
+        """Streams the LOB of the first column and row of a query to a file.
+        The LOB is read by pieces and never loaded whole in memory
+        @param sql: query that selects the LOB
+        @type sql: str
+        @param fileName: file written
+        @type fileName: str
+        @return: number of characters (CLOB) or bytes (BLOB) written"""
+        try:
+            cursor = self.__newLocatorCursor()
+            cursor.execute(sql)
+            rows = cursor.fetchmany(1)
+            if not rows or rows[0][0] is None:
+                raise PysqlException(_("Query did not return any LOB"))
+            return self.__writeValue(rows[0][0], fileName)
+        except (DatabaseError, InterfaceError) as e:
+            raise PysqlException(_("Cannot save LOB: %s") % e)
+
+    def exportLobs(self, sql, directory, part=0, nbParts=1, scn=None):
+        """Streams the LOB of each row of a query to its own file. The LOB is the
+        last column of the query. Other columns give the file name, else rows are numbered.
+        Rows are fetched by small batches and LOB are read by pieces: memory used does
+        not depend on the size or number of LOB
+        @param sql: query that selects file names and LOB
+        @type sql: str
+        @param directory: directory where files are written. It must exist
+        @type directory: str
+        @param part: only export rows of this part (between 0 and nbParts-1)
+        @type part: int
+        @param nbParts: number of parts rows are split into by a hash of the file name. Rows
+        must have file name columns: row numbers depend on the fetch order of each session
+        @type nbParts: int
+        @param scn: reads data as of this system change number (see dbms_flashback) if not None
+        @type scn: int
+        @return: (number of files written, number of characters or bytes written)"""
+        if not os.path.isdir(directory):
+            raise PysqlException(_("Directory %s does not exist") % directory)
+        nbFiles = 0
+        size = 0
+        # Rows with the same file name are in the same part, so each session sees all duplicates
+        names = set()
+        try:
+            cursor = self.__newLocatorCursor()
+            if scn is not None:
+                # Session reads data as it was at scn, like the other sessions of the export
+                cursor.execute(flashbackSql["enableAtScn"], [scn])
+            try:
+                cursor.arraysize = self.LOB_EXPORT_FETCH_SIZE
+                cursor.execute(sql)
+                if nbParts > 1 and len(cursor.description) < 2:
+                    raise PysqlException(_("Parallel export needs columns that give file names"))
+                rowNumber = 0
+                while True:
+                    rows = cursor.fetchmany(cursor.arraysize)
+                    if not rows:
+                        break
+                    for row in rows:
+                        rowNumber += 1
+                        name = sub(r"[^\w.+=@-]", "_", "_".join([str(column) for column in row[:-1]])).lstrip(".")
+                        if not name:
+                            if nbParts > 1:
+                                raise PysqlException(_("Row %s has no file name. Parallel export cannot number it")
+                                                     % rowNumber)
+                            name = str(rowNumber)
+                        if crc32(name.encode("utf-8")) % nbParts != part:
+                            # Exported by another session
+                            continue
+                        if row[-1] is None:
+                            continue
+                        if name in names:
+                            raise PysqlException(_("Many rows are exported to file %s. File names must be unique")
+                                                 % name)
+                        names.add(name)
+                        size += self.__writeValue(row[-1], os.path.join(directory, name))
+                        nbFiles += 1
+            finally:
+                if scn is not None:
+                    cursor.execute(flashbackSql["disable"])
+        except (DatabaseError, InterfaceError) as e:
+            raise PysqlException(_("Cannot export LOB: %s") % e)
+        return (nbFiles, size)
+
     def getRowCount(self):
         """Returns number of line processed with last request"""
         if self.cursor is not None:
@@ -210,7 +466,11 @@ class PysqlDb:
                     # Don't fetch too much!
                     nbLines = self.MAXIMUM_FETCH_SIZE
 
-                result = self.cursor.fetchmany(nbLines)
+                self.__enterPhase("fetch")
+                try:
+                    result = self.cursor.fetchmany(nbLines)
+                finally:
+                    self.__leavePhase()
                 if len(result) == nbLines:
                     moreRows = True
                 return (result, moreRows)
@@ -219,6 +479,33 @@ class PysqlDb:
         except (DatabaseError, InterfaceError) as e:
             raise PysqlException(_("Error while fetching results: %s") % e)
 
+    def fetchBatches(self, batchSize=None, depth=None):
+        """Fetches whole result of current cursor by batches. A thread fetches next batches
+        while caller handles current one: network round trips overlap with client work.
+        Current cursor must not be used by caller until generator is exhausted or closed
+        @param batchSize: number of rows by batch (default is cursor array size)
+        @param depth: number of batches fetched ahead (default is PIPELINE_DEPTH)
+        @return: generator of row lists"""
+        if self.cursor is None:
+            raise PysqlException(_("No result set. Execute a query before fetching result !"))
+        fetcher = Fetcher(self.cursor, batchSize or self.cursor.arraysize, depth or self.PIPELINE_DEPTH)
+        fetcher.start()
+        try:
+            while True:
+                # Fetch phase only accounts time spent waiting for rows
+                self.__enterPhase("fetch")
+                try:
+                    rows = fetcher.queue.get()
+                finally:
+                    self.__leavePhase()
+                if rows is None:
+                    break
+                elif isinstance(rows, Exception):
+                    raise PysqlException(_("Error while fetching results: %s") % rows)
+                yield rows
+        finally:
+            fetcher.stop()
+
     def getServerOuput(self):
         """Gets the server buffer output filled with dbms_output.put_line
         dbms_output should be enabled (should we do this automatically at cursor creation ?)
@@ -257,6 +544,81 @@ class PysqlDb:
         @return: db server version (unicode)"""
         return str(self.connection.version)
 
+    def __confChanged(self, key, value):
+        """Follows configuration changes"""
+        if key == "fetchsize":
+            self.fetchSize = value
+
+    def __newCursor(self):
+        """@return: a new cursor whose round trips are counted and that fetches LOB inline"""
+        cursor = self.connection.cursor()
+        cursor.outputtypehandler = lobOutputTypeHandler
+        return CountingCursor(cursor, self.counter)
+
+    def __newLocatorCursor(self):
+        """@return: a new cursor that fetches LOB locators instead of LOB values"""
+        return CountingCursor(self.connection.cursor(), self.counter)
+
+    def __writeValue(self, value, fileName):
+        """Writes a LOB or a value fetched inline to a file
+        @return: number of characters or bytes written"""
+        try:
+            if isinstance(value, LOB):
+                return self.__writeLob(value, fileName)
+            if isinstance(value, bytes):
+                fileHandle = open(fileName, mode="wb")
+            else:
+                value = str(value)
+                fileHandle = open(fileName, mode="w", encoding="utf-8")
+            with fileHandle:
+                fileHandle.write(value)
+            return len(value)
+        except IOError as e:
+            raise PysqlException(_("Cannot write file %s: %s") % (fileName, e))
+
+    def __writeLob(self, lob, fileName):
+        """Writes a LOB to a file, one group of LOB chunks by read. Reads are
+        aligned on chunk boundaries, which is how Oracle stores LOB
+        @return: number of characters or bytes written"""
+        readSize = lob.getchunksize() * self.LOB_CHUNKS_BY_READ
+        offset = 1  # LOB offsets start at 1
+        fileHandle = None
+        try:
+            while True:
+                self.counter.fetches += 1
+                data = lob.read(offset, readSize)
+                if fileHandle is None:
+                    if isinstance(data, bytes):
+                        fileHandle = open(fileName, mode="wb")
+                    else:
+                        fileHandle = open(fileName, mode="w", encoding="utf-8")
+                if not data:
+                    break
+                fileHandle.write(data)
+                offset += len(data)
+        finally:
+            if fileHandle is not None:
+                fileHandle.close()
+        return offset - 1
+
+    def __enterPhase(self, phase):
+        """Notifies command timer (if any) that a new phase begins"""
+        if self.timer:
+            self.timer.enter(phase)
+
+    def __leavePhase(self):
+        """Notifies command timer (if any) that the current phase ends"""
+        if self.timer:
+            self.timer.leave()
+
+    def cancel(self):
+        """Cancels the statement running on this connection, if any.
+        Can be called from another thread"""
+        try:
+            self.connection.cancel()
+        except (DatabaseError, InterfaceError) as e:
+            raise PysqlException(_("Cannot cancel statement: %s") % e)
+
     def close(self):
         """Releases object connection"""
         # self.cursor.close()
@@ -266,6 +628,68 @@ class PysqlDb:
             raise PysqlException(_("Cannot close connection: %s") % e)
 
 
+class PysqlDbPool:
+    """A fixed size pool of PysqlDb sessions opened with the same connect string"""
+    def __init__(self, connectString, size, mode=""):
+        """
+        @param connectString: Oracle connection string to database
+        @type connectString: str
+        @param size: number of sessions to open
+        @type size: int
+        @param mode: oracle connection mode (empty or sysdba or sysoper)
+        @type mode: str
+        """
+        if size < 1:
+            raise PysqlException(_("Pool size must be strictly positive"))
+        self.sessions = []  # All pool sessions
+        self.idle = Queue()  # Sessions available for acquire()
+        try:
+            for i in range(size):
+                db = PysqlDb(connectString, mode)
+                self.sessions.append(db)
+                self.idle.put(db)
+        except PysqlException:
+            # Don't leak sessions already opened
+            self.close()
+            raise
+
+    def getSize(self):
+        """@return: number of sessions of the pool"""
+        return len(self.sessions)
+
+    def acquire(self):
+        """Gets an idle session. Blocks until one is available
+        @return: PysqlDb instance"""
+        return self.idle.get()
+
+    def release(self, db):
+        """Gives back a session to the pool
+        @param db: session obtained with acquire()"""
+        self.idle.put(db)
+
+    def commit(self):
+        """Commits pending transaction of all sessions"""
+        for db in self.sessions:
+            db.commit()
+
+    def rollback(self):
+        """Rolls back pending transaction of all sessions"""
+        for db in self.sessions:
+            db.rollback()
+
+    def close(self):
+        """Closes all sessions. Pending transactions are rolled back"""
+        errors = []
+        for db in self.sessions:
+            try:
+                db.close()
+            except PysqlException as e:
+                errors.append(e)
+        self.sessions = []
+        if errors:
+            raise errors[0]
+
+
 class BgQuery(Thread):
     """Background query to Oracle"""
     def __init__(self, connect_string, query, exceptions):
@@ -11,13 +11,9 @@
 # Python imports:
 import re
 from os import getenv, unlink
-from difflib import ndiff
-
-try:
-    from hashlib import md5
-except ImportError:
-    # before python 2.5 hashlib did not exist
-    from md5 import md5
+from queue import Queue, Empty
+from threading import Thread
+from time import time
 
 # Pysql imports:
 from .pysqlqueries import *
@@ -27,9 +23,68 @@ from .pysqlcolor import *
 from .pysqlconf import PysqlConf
 from .pysqldb import PysqlDb
 from .pysqlhelpers import colorDiff, convert, addWildCardIfNeeded, generateWhere
+from .pysqlplsql import CallGraph
 
 
 # High level pysql functions
+def callGraph(db, owner, force=False):
+    """Builds the call graph of all PL/SQL code of a schema.
+    Calls of objects compiled with PL/Scope are read from all_identifiers,
+    other objects are parsed from all_source. The graph is cached until
+    a PL/SQL object of the schema changes
+    @param owner: schema name
+    @type owner: str
+    @param force: rebuilds the graph even if the cached one is up to date
+    @type force: bool
+    @return: CallGraph instance"""
+    conf = PysqlConf.getConfig()
+    lastDDL = db.executeAll(callgraphSql["lastDDLFromOwner"], [owner])[0]
+    cacheKey = ("callgraph", db.getDSN(), owner)
+    if not force:
+        cache = conf.readCache("callgraph", cacheKey)
+        if cache and cache["lastDDL"] == lastDDL:
+            return cache["graph"]
+
+    graph = CallGraph()
+    try:
+        definitions = db.executeAll(callgraphSql["definitionsFromOwner"], [owner])
+        if definitions:
+            calls = db.executeAll(callgraphSql["callsFromOwner"], [owner])
+        else:
+            calls = []
+    except PysqlException:
+        # No PL/Scope before Oracle 11g
+        definitions = calls = []
+    plscopeObjects = set()
+    for (objectName, objectType, name) in definitions:
+        plscopeObjects.add(objectName)
+        graph.addNode(graph.nodeName(objectName, name),
+                      standalone=(objectType in ("PROCEDURE", "FUNCTION") and objectName == name))
+    for (callerObject, callerName, calleeOwner, calleeObject, calleeName) in calls:
+        callee = graph.nodeName(calleeObject, calleeName)
+        if calleeOwner != owner:
+            callee = calleeOwner + "." + callee
+        graph.addCall(graph.nodeName(callerObject, callerName), callee)
+
+    # Sources are ordered by object name. Parses them object by object
+    currentName = None
+    source = []
+    for (name, text) in db.executeAll(callgraphSql["sourceFromOwner"], [owner]):
+        if name in plscopeObjects:
+            continue
+        if name != currentName:
+            if source:
+                graph.addSource(currentName, source)
+            currentName = name
+            source = []
+        source.append(text)
+    if source:
+        graph.addSource(currentName, source)
+    graph.resolve()
+
+    conf.writeCache("callgraph", cacheKey, {"lastDDL": lastDDL, "graph": graph})
+    return graph
+
 def count(db, objectName):
     """Counts rows in a table
     @arg objectName: table/view/M.View name
@@ -51,6 +106,7 @@ def count(db, objectName):
 
 def compare(schemaA, schemaB):
     """Compares two Oracle schema and return the difference"""
+    from difflib import ndiff
     # First, compare list of tables
     tables = {}  # Store list of schema tables (key is schema)
     dbList = {}  # Store list of connect object to schema (key is schema)
@@ -121,6 +177,7 @@ def compareTableStructure(schemaA, schemaB, tableNameA, tableNameB, dbList):
     @tableNameB: name of the table in schema B
     @dbList:     hash list of PysqlDb object (keys are A & B).
     """
+    from difflib import ndiff
     tableDesc = {}  # Store the current table desc for each schema (key is schema)
     for schema, tableName in (("A", tableNameA), ("B", tableNameB)):
         # BUG: format is ugly. use/merge with __displayTab algo ??
@@ -145,6 +202,7 @@ def compareTableData(schemaA, schemaB, tableNameA, tableNameB, dbList):
     @tableNameB: name of the table in schema B
     @dbList:     hash list of PysqlDb object (keys are A & B).
     """
+    from difflib import ndiff
     # Check that table structure (columns names & type) are similar
     tableStruct = {}  # Store table structure (columns names & tupe) for each schema (key is schema)
     tablePK = {}  # Store table primary key list for each schema (key is schema)
@@ -170,33 +228,38 @@ def compareTableData(schemaA, schemaB, tableNameA, tableNameB, dbList):
         order = "order by %s" % (", ".join(tablePK["A"]))
     else:
         order = "order by %s" % ", ".join(str(i + 1) for i in range(tableNCol["A"]))
+    batches = {}  # Generators of fetched row batches. Key is A or B
     for schema, tableName in (("A", tableNameA), ("B", tableNameB)):
         # test cursor size. Should make a quick bench to choose the good one
-        dbList[schema].execute("select * from %s %s" % (tableName, order), fetch=False, cursorSize=10000)
+        dbList[schema].execute("select * from %s %s" % (tableName, order), cursorSize=10000, stream=True)
+        # Both tables are fetched in background while rows are compared
+        batches[schema] = dbList[schema].fetchBatches()
     result = {}  # Store current fecth. Key is A or B
     moreRows = {}  # Flag to indicate there's more rows in cursor. Key is A or B
     moreRows["A"] = True
     moreRows["B"] = True
     diff = []  # Store diff lines in this list
-    while moreRows["A"] and moreRows["B"]:
-        for schema in ("A", "B"):
-            result[schema], moreRows[schema] = dbList[schema].fetchNext()
-            if result[schema]:
+    try:
+        while moreRows["A"] and moreRows["B"]:
+            for schema in ("A", "B"):
+                rows = next(batches[schema], None)
+                moreRows[schema] = rows is not None
                 # TODO: performance of this part is very very bad
-                result[schema] = ["     ".join([str(i) for i in line])
-                            for line in result[schema]]
-        for line in colorDiff(ndiff(result["A"], result["B"])):
-            if line[0] != " ":
-                if diff and line[2:] == diff[-1][2:]:
-                    diff.pop()  # simple double removing for one line decay only
-                else:
-                    diff.append(line)
-    for sign, schema in (("-", "A"), ("+", "B")):
-        while moreRows[schema]:
-            result[schema], moreRows[schema] = dbList[schema].fetchNext()
-            result[schema] = ["     ".join([str(i) for i in line])
-                            for line in result[schema]]  # This code should be factorised with above
-            diff.append("%s %s" % (sign, result[schema]))
+                result[schema] = ["     ".join([str(i) for i in line]) for line in rows or []]
+            for line in colorDiff(ndiff(result["A"], result["B"])):
+                if line[0] != " ":
+                    if diff and line[2:] == diff[-1][2:]:
+                        diff.pop()  # simple double removing for one line decay only
+                    else:
+                        diff.append(line)
+        for sign, schema in (("-", "A"), ("+", "B")):
+            # Rows left in one table only
+            for rows in batches[schema]:
+                for line in rows:
+                    diff.append("%s %s" % (sign, "     ".join([str(i) for i in line])))
+    finally:
+        for schema in ("A", "B"):
+            batches[schema].close()
     # Make a second pass to remove doublon accross two resultset
     # BUG: does not work in all case
     oldSign = ""
@@ -587,6 +650,94 @@ def explain(db, statement):
                 from table(dbms_xplan.display('PLAN_TABLE',null,'serial'))""")
 
 
+def executeParallel(pool, statements):
+    """Executes concurrently independent statements on the sessions of a pool
+    Select results are fetched but only their number of rows is kept
+    @param pool: sessions used to execute statements
+    @type pool: PysqlDbPool instance
+    @param statements: list of (index, sql statement)
+    @return: list of (index, statement, elapsed time, rows, PysqlException or None) ordered by index
+    """
+    todo = Queue()
+    for statement in statements:
+        todo.put(statement)
+    results = []
+
+    def worker():
+        """Executes statements on a single session until there is nothing left to do"""
+        db = pool.acquire()
+        try:
+            while True:
+                try:
+                    index, sql = todo.get_nowait()
+                except Empty:
+                    break
+                start = time()
+                rows = 0
+                error = None
+                try:
+                    result = db.execute(sql, fetch=False)
+                    if isinstance(result, tuple):
+                        # Select statement: (records, moreRows)
+                        rows = len(result[0])
+                    else:
+                        rows = result
+                except PysqlException as e:
+                    error = e
+                results.append((index, sql, time() - start, rows, error))
+        finally:
+            pool.release(db)
+
+    workers = [Thread(target=worker) for i in range(min(pool.getSize(), len(statements)))]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    results.sort(key=lambda result: result[0])
+    return results
+
+
+def exportLobsParallel(pool, sql, directory):
+    """Exports LOB of a query to files, each session of the pool exporting its own part of rows.
+    All sessions read rows as of the same SCN, so parts are consistent even if rows change
+    @param pool: sessions used to export LOB
+    @type pool: PysqlDbPool instance
+    @param sql: query that selects file names and LOB (see PysqlDb.exportLobs)
+    @param directory: directory where files are written
+    @return: (number of files written, number of characters or bytes written)
+    """
+    nbParts = pool.getSize()
+    results = []
+    errors = []
+
+    db = pool.acquire()
+    try:
+        scn = db.executeAll(flashbackSql["currentScn"])[0][0]
+    except PysqlException as e:
+        raise PysqlException(_("Parallel export needs execute privilege on dbms_flashback: %s") % e)
+    finally:
+        pool.release(db)
+
+    def worker(part):
+        """Exports one part of the rows on a single session"""
+        db = pool.acquire()
+        try:
+            results.append(db.exportLobs(sql, directory, part, nbParts, scn))
+        except PysqlException as e:
+            errors.append(e)
+        finally:
+            pool.release(db)
+
+    workers = [Thread(target=worker, args=(part,)) for part in range(nbParts)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return (sum([result[0] for result in results]), sum([result[1] for result in results]))
+
+
 def objectsLock(db):
     """Displays locks on objects
     @return: resultset in tabular format
@@ -11,8 +11,10 @@
 # Python imports:
 import os
 import sys
-import re
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+from time import time
 from math import floor, sqrt
 
 # Pysql imports:
@@ -21,18 +23,27 @@ from .pysqlexception import PysqlException
 from .pysqlcolor import BOLD, CYAN, GREEN, GREY, RED, RESET
 from .pysqlconf import PysqlConf
 from .pysqloraobjects import OraObject
-from .pysqlhelpers import convert, generateWhere, getProg, removeComment, which
+from .pysqlplsql import extractCalls
+from .pysqlhelpers import convert, generateWhere, getProg, which
+
+# Background pictures generation
+RENDER_WORKERS = 2  # Maximum number of Graphviz processes running at the same time
+renderExecutor = None  # Thread pool that drives Graphviz processes. Created on first use
+renderJobs = []  # Background RenderJob not yet reported to user
 
 
 # High level pysql graphical functions
-def datamodel(db, userName, tableFilter=None, withColumns=True):
+def datamodel(db, userName, tableFilter=None, withColumns=True, incremental=False, force=False):
     """Extracts the datamodel of the current user as a picture
 The generation of the picture is powered by Graphviz (http://www.graphviz.org)
 through the PyDot API (http://www.dkbza.org/pydot.html)
+The extracted model is cached and reused as long as no table DDL changed.
 @param db: pysql db connection
 @param userName: schema to be extracted
 @param tableFilter: filter pattern (in pysql extended syntax to extract only some tables (None means all)
 @param withColumns: Indicate whether columns are included or not in datamodel picture
+@param incremental: if model changed since last extraction, only re-extract tables whose DDL changed
+@param force: ignore cached model and picture
 """
     # Tries to import pydot module
     try:
@@ -63,47 +74,61 @@ through the PyDot API (http://www.dkbza.org/pydot.html)
         whereClause = generateWhere("table_name", tableFilter)
     else:
         whereClause = "1=1"
-    tables = db.executeAll(datamodelSql["tablesFromOwner"] % (userName, whereClause))
+    # Table query is reused as a sub query to filter columns and links (no IN list limit)
+    tableQuery = datamodelSql["tablesFromOwner"] % (userName, whereClause)
+    startQueries = db.counter.executes
+    startRows = db.counter.rows
+    # Last DDL time of each table tells if cached model is still valid
+    lastDDL = dict(db.executeAll(datamodelSql["lastDDLFromOwnerAndTables"] % (userName, tableQuery)))
+    tables = sorted(lastDDL.keys())
     nbTables = len(tables)
     if nbTables == 0:
         raise PysqlException(_("No table found. Your filter clause is too restrictive or the schema is empty"))
-    tableList = ", ".join(["'%s'" % table[0] for table in tables])  # Table list formated to be used in SQL query
-    print(CYAN + _("Extracting %d tables...      ") % nbTables + RESET, end=' ')
-    current = 0
-    for table in tables:
-        tableName = table[0]
-        content = """<<TABLE BORDER="0" CELLBORDER="1" CELLSPACING="0">"""
-        content += """\n<TR><TD PORT="%s">""" % tableName
-        content += """<FONT FACE="%s" POINT-SIZE="%f" COLOR="%s">""" % (fontname, fontsize, fontcolor)
-        content += tableName
-        content += "</FONT></TD></TR>"
+
+    cacheKey = ("datamodel", db.getDSN(), userName, whereClause, withColumns)
+    cache = None
+    if not force:
+        cache = conf.readCache("datamodel", cacheKey)
+    if cache and cache["lastDDL"] == lastDDL:
+        print(CYAN + _("Datamodel did not change since last extraction. Using cache") + RESET)
+        columns = cache["columns"]
+        links = cache["links"]
+    elif cache and incremental:
+        changedTables = [t for t in tables if cache["lastDDL"].get(t) != lastDDL[t]]
+        print(CYAN + _("%d tables changed since last extraction") % len(changedTables) + RESET)
+        columns = dict([(t, c) for (t, c) in cache["columns"].items() if t in lastDDL])
         if withColumns:
-            columns = db.executeAll(datamodelSql["columnsFromOwnerAndTable"], [userName, tableName])
-            for column in columns:
-                columnName = column[0]
-                columnType = column[1]
-                content += """\n<TR><TD ALIGN="LEFT" PORT="%s_%s">""" % (tableName, columnName)
-                content += """<FONT FACE="%s" POINT-SIZE="%f" COLOR="%s">""" % \
-                         (fontname, fontsize - 2, fontcolor)
-                if column[2] is None:  # Normal field
-                    content += " "
-                else:  # Primary key field
-                    content += "PK%d" % int(column[2])
-                content += " %s (%s)" % (columnName, columnType)
-                content += "</FONT></TD></TR>"
-        content += "\n</TABLE>>"
-        graph.add_node(Node(tableName, shape="none", label=content, style="filled", \
+            columns.update(extractDatamodelColumns(db, userName, tableNames=changedTables))
+        links = extractDatamodelLinks(db, userName, tableQuery)
+    else:
+        columns = {}
+        if withColumns:
+            columns = extractDatamodelColumns(db, userName, tableQuery=tableQuery)
+        links = extractDatamodelLinks(db, userName, tableQuery)
+
+    print(CYAN + _("Building %d tables...      ") % nbTables + RESET, end=' ')
+    tableFont = """<FONT FACE="%s" POINT-SIZE="%f" COLOR="%s">""" % (fontname, fontsize, fontcolor)
+    columnFont = """<FONT FACE="%s" POINT-SIZE="%f" COLOR="%s">""" % (fontname, fontsize - 2, fontcolor)
+    for current, tableName in enumerate(tables):
+        content = ["""<<TABLE BORDER="0" CELLBORDER="1" CELLSPACING="0">""",
+                   """\n<TR><TD PORT="%s">""" % tableName, tableFont, tableName, "</FONT></TD></TR>"]
+        for columnName, columnType, pkPosition in columns.get(tableName, []):
+            content.append("""\n<TR><TD ALIGN="LEFT" PORT="%s_%s">""" % (tableName, columnName))
+            content.append(columnFont)
+            if pkPosition is None:  # Normal field
+                content.append(" ")
+            else:  # Primary key field
+                content.append("PK%d" % int(pkPosition))
+            content.append(" %s (%s)</FONT></TD></TR>" % (columnName, columnType))
+        content.append("\n</TABLE>>")
+        graph.add_node(Node(tableName, shape="none", label="".join(content), style="filled", \
                             fillcolor=tablecolor, color=bordercolor))
-        current += 1
-        sys.stdout.write("\b\b\b\b\b%4.1f%%" % round(100 * float(current) / nbTables, 1))
+        sys.stdout.write("\b\b\b\b\b%4.1f%%" % round(100 * float(current + 1) / nbTables, 1))
         sys.stdout.flush()
 
     print()
-    # Links between tables (foreign key -> primary key)
-    # Only extract links from considered tables
-    links = db.executeAll(datamodelSql["constraintsFromOwner"] % (userName, tableList, tableList))
     nbLinks = len(links)
-    print((CYAN + _("Extracting %d links...      ") % nbLinks + RESET), end=' ')
+    print((CYAN + _("Building %d links...      ") % nbLinks + RESET), end=' ')
     current = 0
     for link in links:
         if linklabel == "yes":
@@ -115,9 +140,58 @@ through the PyDot API (http://www.dkbza.org/pydot.html)
         sys.stdout.write("\b\b\b\b\b%4.1f%%" % round(100 * float(current) / nbLinks, 1))
 
     print()
+    print(CYAN + _("(Model extracted with %d queries, %d rows fetched)")
+          % (db.counter.executes - startQueries, db.counter.rows - startRows) + RESET)
     filename = db.getDSN() + "_" + userName + "." + format
-    generateImage(graph, filename, prog, format)
-    viewImage(filename)
+    # Graphviz is only invoked if graph or output settings changed
+    graphHash = md5((graph.to_string() + prog + format).encode("utf-8")).hexdigest()
+    modelCache = {"lastDDL": lastDDL, "columns": columns, "links": links, "graphHash": graphHash}
+    if cache and cache.get("graphHash") == graphHash and os.path.exists(filename):
+        conf.writeCache("datamodel", cacheKey, modelCache)
+        print(GREEN + _("Picture did not change: ") + os.getcwd() + os.sep + filename + RESET)
+        viewImage(filename)
+    else:
+        # Picture hash is only cached once Graphviz succeeded, else a failed picture would be reused
+        conf.writeCache("datamodel", cacheKey, dict(modelCache, graphHash=None))
+        renderImage(graph, filename, prog, format,
+                    onSuccess=lambda: conf.writeCache("datamodel", cacheKey, modelCache))
+
+def extractDatamodelColumns(db, userName, tableQuery=None, tableNames=None):
+    """Extracts columns of tables in bulk
+@param db: pysql db connection
+@param userName: schema owner of tables
+@param tableQuery: sub query that returns table names
+@param tableNames: list of table names, used if tableQuery is None
+@return: dict of columns. Key is table name, value is list of (column name, type, primary key position)
+"""
+    if tableQuery is not None:
+        subQueries = [tableQuery]
+    else:
+        # IN lists are limited to 1000 elements
+        subQueries = [", ".join(["'%s'" % t for t in tableNames[i:i + 1000]])
+                      for i in range(0, len(tableNames), 1000)]
+    columns = {}
+    print(CYAN + _("Extracting columns...") + RESET, end=' ')
+    sys.stdout.flush()
+    for subQuery in subQueries:
+        for tableName, columnName, columnType, pkPosition in \
+                db.executeAll(datamodelSql["columnsFromOwnerAndTables"] % (userName, userName, subQuery)):
+            columns.setdefault(tableName, []).append((columnName, columnType, pkPosition))
+    print(_("%d columns") % sum([len(i) for i in columns.values()]))
+    return columns
+
+def extractDatamodelLinks(db, userName, tableQuery):
+    """Extracts links between tables (foreign key -> primary key)
+@param db: pysql db connection
+@param userName: schema owner of tables
+@param tableQuery: sub query that returns table names. Only links between those tables are extracted
+@return: list of (constraint name, table name, referenced table name)
+"""
+    print(CYAN + _("Extracting links...") + RESET, end=' ')
+    sys.stdout.flush()
+    links = db.executeAll(datamodelSql["constraintsFromOwner"] % (userName, tableQuery, tableQuery))
+    print(_("%d links") % len(links))
+    return [tuple(link) for link in links]
 
 def dependencies(db, objectName, direction, maxDepth, maxNodes):
     """Displays object dependencies as a picture
@@ -155,77 +229,83 @@ through the PyDot API (http://www.dkbza.org/pydot.html)
     else:
         dirList = []
 
+    rootObject = OraObject(objectName=objectName)
+    rootObject.guessInfos(db)
+    objectOwner = rootObject.getOwner()
+    objectName = rootObject.getName()
+    objectType = rootObject.getType()
+    label = objectOwner + "." + objectName + "\\n(" + objectType + ")"
+    graph.add_node(Node(objectName, label=label, fontname=fontname, fontsize=str(fontsize), shape="diamond"))
+    currentUser = db.getUsername().upper()
+
     for currentDir in dirList:
         depth = 0
-        objectList = [OraObject(objectName=objectName)]
-        objectList[0].guessInfos(db)
-        objectOwner = objectList[0].getOwner()
-        objectName = objectList[0].getName()
-        objectType = objectList[0].getType()
-        label = objectOwner + "." + objectName + "\\n(" + objectType + ")"
-        graph.add_node(Node(objectName, label=label, fontname=fontname, fontsize=str(fontsize), shape="diamond"))
-        nodeList = [objectName]
-        edgeList = []
-        nextObjectList = []
-
-        while objectList != [] and depth <= maxDepth and len(nodeList) <= maxNodes:
+        level = [(objectOwner, objectName)]  # Objects whose references are looked up
+        visited = set(level)  # (owner, name) of all objects of the graph
+        edges = set()  # (name, referenced name) of all edges of the graph
+
+        while level and depth <= maxDepth and len(visited) <= maxNodes:
             depth += 1
-            for currentObject in objectList:
-                currentObjectOwner = currentObject.getOwner()
-                currentObjectName = currentObject.getName()
-                if currentDir == "onto":
-                    # Objects referencing the the current object
-                    result = db.executeAll(dependenciesSql["refOnFromOwnerAndName"], \
-                                        [currentObjectOwner, currentObjectName])
-                elif currentDir == "from":
-                    # Objects referenced by the the current object
-                    result = db.executeAll(dependenciesSql["refByFromOwnerAndName"], \
-                                        [currentObjectOwner, currentObjectName])
-                refObjectList = [OraObject(objectOwner=i[0], objectName=i[1]) for i in result]
-                for currentRefObject in refObjectList:
-                    currentRefObject.guessInfos(db)
-                    currentRefObjectOwner = currentRefObject.getOwner()
-                    currentRefObjectName = currentRefObject.getName()
-                    currentRefObjectType = currentRefObject.getType()
-                    if not currentRefObjectName in nodeList:
-                        nodeList.append(currentRefObjectName)
-                        # Object shape
-                        if currentRefObjectType in ("TABLE", "VIEW", "SEQUENCE"):
-                            shape = "box"
-                        elif currentRefObjectType in ("PACKAGE", "FUNCTION", "PROCEDURE", "TRIGGER"):
-                            shape = "ellipse"
-                        else:
-                            shape = "none"
-                        # Object label
-                        if currentRefObjectOwner == db.getUsername().upper():
-                            label = currentRefObjectName
-                        else:
-                            label = currentRefObjectOwner + "." + currentRefObjectName
-                        label += "\\n(" + currentRefObjectType + ")"
-                        # Adding object to graph
-                        graph.add_node(Node(currentRefObjectName, label=label, fontname=fontname, \
-                                                                  fontsize=str(fontsize), shape=shape))
-                    if not [currentObjectName, currentRefObjectName] in edgeList:
-                        if currentDir == "onto":
-                            edgeList.append([currentObjectName, currentRefObjectName])
-                            graph.add_edge(Edge(dst=currentObjectName, src=currentRefObjectName, \
-                                                color="red"))
-                        elif currentDir == "from":
-                            edgeList.append([currentObjectName, currentRefObjectName])
-                            graph.add_edge(Edge(src=currentObjectName, dst=currentRefObjectName, \
-                                                color="darkgreen"))
-                nextObjectList += refObjectList
-            objectList = nextObjectList
-            nextObjectList = []
-
-        if len(nodeList) > maxNodes:
+            nextLevel = []
+            # All objects of the level at once. Referenced object types come with the result
+            for owner, name, refOwner, refName, refType in getDependencies(db, level, currentDir):
+                if (refOwner, refName) not in visited:
+                    if len(visited) > maxNodes:
+                        break
+                    visited.add((refOwner, refName))
+                    nextLevel.append((refOwner, refName))
+                    # Object shape
+                    if refType in ("TABLE", "VIEW", "SEQUENCE"):
+                        shape = "box"
+                    elif refType in ("PACKAGE", "PACKAGE BODY", "FUNCTION", "PROCEDURE", "TRIGGER"):
+                        shape = "ellipse"
+                    else:
+                        shape = "none"
+                    # Object label
+                    if refOwner == currentUser:
+                        label = refName
+                    else:
+                        label = refOwner + "." + refName
+                    label += "\\n(" + refType + ")"
+                    # Adding object to graph
+                    graph.add_node(Node(refName, label=label, fontname=fontname, \
+                                                 fontsize=str(fontsize), shape=shape))
+                if (name, refName) not in edges and name != refName:
+                    edges.add((name, refName))
+                    if currentDir == "onto":
+                        graph.add_edge(Edge(dst=name, src=refName, color="red"))
+                    elif currentDir == "from":
+                        graph.add_edge(Edge(src=name, dst=refName, color="darkgreen"))
+            level = nextLevel
+
+        if len(visited) > maxNodes:
             print(RED + _("Warning: reach max node, references lookup stopped on direction %s") % currentDir + RESET)
         if depth > maxDepth:
             print(RED + _("Warning: reach max recursion limit, references lookup stopped on direction %s") % currentDir + RESET)
 
     filename = "dep_" + objectOwner + "." + objectName + "." + format
-    generateImage(graph, filename, prog, format)
-    viewImage(filename)
+    renderImage(graph, filename, prog, format)
+
+
+def getDependencies(db, objects, direction):
+    """Gets dependencies of many objects with one query by chunk of objects
+@param db: pysql db connection
+@param objects: list of (owner, name) of objects
+@param direction: "onto" for objects referencing given objects, "from" for objects referenced by them
+@return: list of (owner, name, referenced owner, referenced name, referenced type). For "onto" direction,
+referenced object is the one that references the given object
+"""
+    if direction == "onto":
+        query = dependenciesSql["refOnFromOwnersAndNames"]
+    else:
+        query = dependenciesSql["refByFromOwnersAndNames"]
+    result = []
+    chunkSize = 500  # Bind variables by query are limited
+    for i in range(0, len(objects), chunkSize):
+        chunk = objects[i:i + chunkSize]
+        binds = ", ".join(["(:%d, :%d)" % (2 * j + 1, 2 * j + 2) for j in range(len(chunk))])
+        result.extend(db.executeAll(query % binds, [value for obj in chunk for value in obj]))
+    return result
 
 
 def diskusage(db, userName, withIndexes=False, percent=True):
@@ -256,67 +336,36 @@ through the PyDot API (http://www.dkbza.org/pydot.html)
     prog = getProg(find_graphviz(), conf.get("graph_program"), "fdp")
 
 # First step: objects library building
-    # Tablespaces
-    if userName == db.getUsername().upper():
-        tablespaces = db.executeAll(diskusageSql["Tablespaces"])
-    else:
-        tablespaces = db.executeAll(diskusageSql["TablespacesFromOwner"], [userName])
-    tbsBytes = 0
     tbsList = []
-    for tablespace in tablespaces:
-        tablespaceName = str(tablespace[0])
-
-        # Tables from current tablespace
-        if userName == db.getUsername().upper():
-            tables = db.executeAll(diskusageSql["TablesFromTbs"], [tablespaceName])
-        else:
-            tables = db.executeAll(diskusageSql["TablesFromOwnerAndTbs"], [userName, tablespaceName])
+    for tbsName, tbsBytes, segments, indexes in extractDiskusage(db, userName, withIndexes):
+        # Objects without statistics cannot be drawn
         tabList = []
-        print(CYAN + _("Extracting %3d tables from tablespace %s") % (len(tables), tablespaceName) + RESET)
-        for table in tables:
-            tableName = table[0]
-            if table[1] is None:
+        print(CYAN + _("Extracting %3d tables from tablespace %s") % (len(segments), tbsName) + RESET)
+        for tableName, bytes, numRows, avgRowLen in segments:
+            if numRows is None:
                 print(RED + _("""Warning: table "%s" removed because no statistics have been found""") \
-                           % (tablespaceName + "/" + tableName) + RESET)
-                continue
-            if table[1] == 0:
+                           % (tbsName + "/" + tableName) + RESET)
+            elif numRows == 0:
                 print(RED + _("""Warning: table "%s" removed because it is empty""") \
-                           % (tablespaceName + "/" + tableName) + RESET)
-                continue
-            numRows = int(table[1])
-            avgRowLen = float(table[2])
-            bytes = int(table[3])
-            tbsBytes += bytes
-            tabList += [[tableName, bytes, numRows, avgRowLen]]
-
-        if withIndexes:
-            # Indexes from current tablespace
-            if userName == db.getUsername().upper():
-                indexes = db.executeAll(diskusageSql["IndexesFromTbs"], [tablespaceName])
+                           % (tbsName + "/" + tableName) + RESET)
             else:
-                indexes = db.executeAll(diskusageSql["IndexesFromOwnerAndTbs"], [userName, tablespaceName])
-            idxList = []
-            print(CYAN + _("Extracting %3d indexes from tablespace %s") % (len(indexes), tablespaceName) + RESET)
-            for index in indexes:
-                indexName = index[0]
-                if index[1] is None:
+                tabList.append([tableName, bytes, numRows, avgRowLen])
+        idxList = []
+        if withIndexes:
+            print(CYAN + _("Extracting %3d indexes from tablespace %s") % (len(indexes), tbsName) + RESET)
+            for indexName, bytes, numRows, distinctKeys, tabName in indexes:
+                if numRows is None:
                     print(RED + _("""Warning: index "%s" removed because no statistics have been found""") \
-                            % (tablespaceName + "/" + indexName) + RESET)
-                    continue
-                if index[1] == 0:
+                            % (tbsName + "/" + indexName) + RESET)
+                elif numRows == 0:
                     print(RED + _("""Warning: index "%s" removed because it is empty""") \
-                            % (tablespaceName + "/" + indexName) + RESET)
-                    continue
-                numRows = int(index[1])
-                distinctKeys = int(index[2])
-                bytes = int(index[3])
-                tabName = str(index[4])
-                tbsBytes += bytes
-                idxList += [[indexName, bytes, numRows, distinctKeys, tabName]]
+                            % (tbsName + "/" + indexName) + RESET)
+                else:
+                    idxList.append([indexName, bytes, numRows, distinctKeys, tabName])
         else:
-            print(CYAN + _("Not extracting indexes from tablespace %s (ignored)") % (tablespaceName) + RESET)
-            idxList = []
-        tbsList += [[tablespaceName, tbsBytes, tabList, idxList]]
+            print(CYAN + _("Not extracting indexes from tablespace %s (ignored)") % (tbsName) + RESET)
+        tbsBytes = sum([i[1] for i in tabList + idxList])
+        tbsList.append([tbsName, tbsBytes, tabList, idxList])
 
 # Second step: objects drawing
     graph = Dot(label=userName, overlap="false", splines="true")
@@ -383,8 +432,41 @@ through the PyDot API (http://www.dkbza.org/pydot.html)
             # subGraph.add_edge(Edge(src=name, dst=tabName, constraint="false", style="invis"))
 
     filename = "du_" + userName + "." + format
-    generateImage(graph, filename, prog, format)
-    viewImage(filename)
+    renderImage(graph, filename, prog, format)
+
+def extractDiskusage(db, userName, withIndexes=False):
+    """Extracts all table and index segments of a user with one query
+@param db: pysql db connection
+@param userName: schema owner of segments
+@param withIndexes: also extract index segments
+@return: list of [tablespace name, bytes, tables, indexes] by tablespace.
+Tables are [name, bytes, rows, average row length], indexes are [name, bytes, rows, distinct keys, table name].
+Rows are None if object has no statistics.
+"""
+    if userName == db.getUsername().upper():
+        segmentView = diskusageSql["userSegments"]
+    else:
+        segmentView = "dba_segments"
+    result = db.executeAll(diskusageSql["SegmentsFromOwner"] % ((segmentView,) * 4),
+                           {"owner": userName, "indexes": withIndexes and "Y" or "N"})
+    tbsList = []
+    tablespaces = {}  # Key is tablespace name, value is tbsList item
+    for tbsName, segmentType, name, numRows, stat, bytes, tableName in result:
+        if tbsName not in tablespaces:
+            tablespaces[tbsName] = [tbsName, 0, [], []]
+            tbsList.append(tablespaces[tbsName])
+        tbs = tablespaces[tbsName]
+        bytes = int(bytes or 0)
+        if numRows is not None:
+            numRows = int(numRows)
+        if stat is not None:
+            stat = segmentType == "TABLE" and float(stat) or int(stat)
+        tbs[1] += bytes
+        if segmentType == "TABLE":
+            tbs[2].append([name, bytes, numRows, stat])
+        else:
+            tbs[3].append([name, bytes, numRows, stat, str(tableName or "")])
+    return tbsList
 
 def pkgTree(db, packageName):
     """Creates the call tree of internal package functions and procedures"""
@@ -412,9 +494,6 @@ def pkgTree(db, packageName):
 
     graph = Dot(overlap="false", splines="true")
 
-    # Lists of function or procedure
-    verbs = []
-
     # Tries to resolve synonym and describe the target
     # TODO: factorise this code!!
     if package.getType() == "SYNONYM":
@@ -430,46 +509,24 @@ def pkgTree(db, packageName):
     print(CYAN + _("Extracting package source...") + RESET)
     content = package.getSQLAsList(db)
 
-    # Removes comments
     print(CYAN + _("Parsing source and building graph...") + RESET)
-    newContent = []
-    comment = False
-    for line in content:
-        line, comment = removeComment(line, comment)
-        newContent.append(line)
-    content = newContent
-
-    # Gets procedures and functions
-    for line in content:
-        result = re.match("\s*(FUNCTION|PROCEDURE)\s+(.+?)[\s|\(]+", line, re.I)
-        if result:
-            verbs.append(re.escape(result.group(2)))
-            graph.add_node(Node(result.group(2).upper(), shape="box", label=result.group(2).upper(), \
-                                fontsize=str(fontsize), fontname=fontname, fontcolor=fontcolor))
-
-    if not verbs:
+    (subprograms, calls) = extractCalls(content, package.getName())
+    if not subprograms:
         raise PysqlException(_("This package does not have any readable function or procedure"))
 
-    verbs = "|".join(verbs)
-    # Gets call of functions/procedure inside each other
-    currentVerb = ""
-    for line in content:
-        # Doesn't pay attention to end lines
-        if re.match("\s*END.*;", line, re.I):
-            continue
-        # Marks the function/procedure we are parsing
-        result = re.match("\s*(FUNCTION|PROCEDURE)\s+(.+?)[\s|\(]+", line, re.I)
-        if result:
-            currentVerb = result.group(2)
-            continue  # else we get a circular reference below ;-)
-        result = re.match(".*\s(%s).*" % verbs, line, re.I)
-        if result:
-            if graph.get_edge(currentVerb.upper(), result.group(1).upper()) is None:
-                graph.add_edge(Edge(src=currentVerb.upper(), dst=result.group(1).upper()))
+    for name, lines in subprograms.items():
+        if len(lines) > 1:
+            # Overloaded function or procedure
+            label = "%s (%d)" % (name, len(lines))
+        else:
+            label = name
+        graph.add_node(Node(name, shape="box", label=label, \
+                            fontsize=str(fontsize), fontname=fontname, fontcolor=fontcolor))
+    for caller, callee in sorted(calls):
+        graph.add_edge(Edge(src=caller, dst=callee))
 
     filename = package.getName() + "_dep." + format
-    generateImage(graph, filename, prog, format)
-    viewImage(filename)
+    renderImage(graph, filename, prog, format)
 
 def viewImage(imagePath):
     """Shows Image with prefered user image viewer
@@ -494,22 +551,102 @@ def viewImage(imagePath):
     else:
         raise PysqlException(_("Viewer was not found"))
 
-def generateImage(graph, filename, prog, format):
+def generateImage(graph, filename, prog, format, background=False, onSuccess=None):
     """Generate graphviz image from graph
 @param graph: pydot graph object
 @param filename: image filename (str)
 @param format: image format (str)
+@param background: if True, Graphviz runs in background and the function returns immediately
+@param onSuccess: function without argument called once image is successfully generated
+@return: RenderJob if background is True else None
 """
-    print(CYAN + _("Generating picture using %s filter...") % prog + RESET)
     filepath = os.getcwd() + os.sep + filename
-    import pydot
-    oldstdout = sys.stdout
-    sys.stdout = open(os.devnull, 'a')  # Mutes STDOUT
+    source = graph.to_string()
+    if background:
+        job = RenderJob(source, filepath, prog, format, onSuccess)
+        renderJobs.append(job)
+        print(CYAN + _("Generating picture using %s filter in background. ") % prog +
+              _("It will be displayed when ready") + RESET)
+        return job
+    else:
+        print(CYAN + _("Generating picture using %s filter...") % prog + RESET)
+        runGraphviz(source, filepath, prog, format)
+        if onSuccess:
+            onSuccess()
+        print(GREEN + _("Image saved as ") + filepath + RESET)
+
+def renderImage(graph, filename, prog, format, onSuccess=None):
+    """Generates graphviz image and shows it. Generation is done in background
+if user interaction is possible, else synchronously (scripts, pipes...)
+@param graph: pydot graph object
+@param filename: image filename (str)
+@param format: image format (str)
+@param onSuccess: function without argument called once image is successfully generated
+"""
+    if sys.stdin.isatty():
+        generateImage(graph, filename, prog, format, background=True, onSuccess=onSuccess)
+    else:
+        generateImage(graph, filename, prog, format, onSuccess=onSuccess)
+        viewImage(filename)
+
+def runGraphviz(source, filepath, prog, format):
+    """Runs a Graphviz program in a separate process
+@param source: graph in dot language (str)
+@param filepath: output image path (str)
+@param prog: Graphviz program name
+@param format: image format (str)
+"""
+    from pydot import find_graphviz
+    progPath = (find_graphviz() or {}).get(prog) or which(prog) or prog
     try:
-        graph.write(filepath, prog=prog, format=format)
-    except (IOError, OSError, pydot.InvocationException) as e:
-        sys.stdout = sys.__stdout__  # Restores STDOUT
+        process = subprocess.Popen([progPath, "-T" + format, "-o", filepath],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (out, err) = process.communicate(source.encode("utf-8"))
+    except (IOError, OSError) as e:
         raise PysqlException(_("Graphviz failed to generate image:\n%s") % e)
-    sys.stdout = oldstdout  # Restores STDOUT
-    print(GREEN + _("Image saved as ") + filepath + RESET)
-
+    if process.returncode != 0:
+        raise PysqlException(_("Graphviz failed to generate image:\n%s") % err.decode("utf-8", "replace"))
+
+def getFinishedRenderJobs():
+    """@return: list of background RenderJob that ended since last call"""
+    finished = [job for job in renderJobs if job.isDone()]
+    for job in finished:
+        renderJobs.remove(job)
+    return finished
+
+
+class RenderJob:
+    """Graphviz picture generation running in background"""
+    def __init__(self, source, filepath, prog, format, onSuccess=None):
+        global renderExecutor
+        if renderExecutor is None:
+            renderExecutor = ThreadPoolExecutor(max_workers=RENDER_WORKERS)
+        self.filepath = filepath
+        self.prog = prog
+        self.onSuccess = onSuccess
+        self.startTime = time()
+        self.endTime = None
+        self.future = renderExecutor.submit(runGraphviz, source, filepath, prog, format)
+        self.future.add_done_callback(self.__done)
+
+    def __done(self, future):
+        """Called by the pool when Graphviz ends"""
+        self.endTime = time()
+        if self.onSuccess and future.exception() is None:
+            try:
+                self.onSuccess()
+            except PysqlException:
+                # Picture is fine. It will just be generated again next time
+                pass
+
+    def isDone(self):
+        """@return: True if Graphviz ended (successfully or not)"""
+        return self.future.done()
+
+    def getError(self):
+        """@return: PysqlException raised by generation or None. Only meaningful when job is done"""
+        return self.future.exception()
+
+    def getElapsedTime(self):
+        """@return: generation duration in seconds (up to now if still running)"""
+        return (self.endTime or time()) - self.startTime
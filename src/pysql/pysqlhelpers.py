@@ -18,7 +18,7 @@ from threading import Thread, Lock
 try:
     from cx_Oracle import LOB
 except:
-    pass
+    LOB = ()  # No LOB locator without cx_Oracle
 try:
     import setproctitle
     HAVE_SETPROCTITLE = True
@@ -110,12 +110,32 @@ def itemLength(item):
     """Compute length of a result set item"""
     if item is None:
         return 0
-    elif isinstance(item, (int, float, datetime.datetime, datetime.timedelta)):
-        return len(str(item))
-    elif isinstance(item, LOB):
-        return item.size()
-    else:
+    elif isinstance(item, (str, bytes)):
         return len(item)
+    else:
+        # Numbers, dates and LOB previews. Never ask server for LOB size
+        return len(str(item))
+
+def lobPreview(item, length):
+    """Shortens a LOB value for display. Binary values are displayed in hexadecimal
+    @arg item: value fetched inline (str or bytes) or LOB locator
+    @arg length: maximum number of characters displayed (0 means whole value)
+    @return: str or None"""
+    if item is None:
+        return None
+    if isinstance(item, LOB):
+        # Not fetched inline. Read only what is displayed: one round trip
+        if length:
+            item = item.read(1, length + 1)
+        else:
+            item = item.read()
+    if isinstance(item, bytes):
+        if length:
+            item = item[:length // 2 + 1]
+        item = item.hex()
+    if length and len(item) > length:
+        item = item[:length] + "..."
+    return item
 
 def generateWhere(keyword, filterClause):
     """ Generate where clause from pysql syntax to filter Oracle object
@@ -296,17 +316,10 @@ def getTitle():
 
 
 def getTermWidth():
-    """Gets the terminal width. Works only on Unix system.
-    @return: terminal width or "120" is system not supported"""
-    if os.name == "posix":
-        tput = os.popen("tput cols")
-        result = tput.readline().strip()
-        tput.close()
-        if result:
-            return int(result)
-    else:
-        # Unsupported system, use default 120
-        return 120
+    """Gets the terminal width without running any external program
+    @return: terminal width or 120 if it cannot be found"""
+    from shutil import get_terminal_size
+    return get_terminal_size((120, 24)).columns
 
 
 def upperIfNoQuotes(aString):
@@ -380,6 +393,60 @@ def getLastKeyword(line):
             lastKeyword = token
     return lastKeyword
 
+def splitScript(lines, commands=()):
+    """Splits a sql script into statements, honoring pysql commands, PL/SQL blocs
+    and the "-- pysql:barrier" marker
+    @param lines: script lines
+    @type lines: list of str
+    @param commands: pysql command names (single line statements)
+    @type commands: list of str
+    @return: list of (kind, statement). Kind is one of sql, plsql, command or barrier"""
+    statements = []
+    buffer = []  # Lines of the current statement
+    comment = False  # Are we in a multiline comment?
+    plBloc = False  # Are we in a PL/SQL bloc?
+    for line in lines:
+        line = line.rstrip("\n")
+        if not comment and not buffer and match("\s*--\s*pysql:barrier\s*$", line.lower()):
+            statements.append(("barrier", ""))
+            continue
+        line, comment = removeComment(line, comment)
+        line = line.strip()
+        if not line:
+            continue
+        if not buffer:
+            firstWord = line.split()[0].lower().rstrip(";")
+            if line[0] in ("@", "!") or firstWord in commands:
+                # Pysql commands are single line
+                statements.append(("command", line.rstrip(";")))
+                continue
+            if firstWord in ("declare", "begin") or \
+               match("create\s+(or\s+replace\s+)?(procedure|function|package|trigger|type)\s", line.lower()):
+                plBloc = True
+        if plBloc:
+            if line == "/":
+                statements.append(("plsql", "\n".join(buffer)))
+                buffer = []
+                plBloc = False
+            else:
+                buffer.append(line)
+        elif line == "/":
+            # Repeat last statement (sqlplus way). Useless in a script
+            continue
+        elif line.endswith(";"):
+            buffer.append(line.rstrip(";"))
+            statements.append(("sql", " ".join(buffer)))
+            buffer = []
+        else:
+            buffer.append(line)
+    if buffer:
+        # Last statement without ending ; or /
+        if plBloc:
+            statements.append(("plsql", "\n".join(buffer)))
+        else:
+            statements.append(("sql", " ".join(buffer)))
+    return statements
+
 def currentVersion():
     """@return: current pysql version according to 'version' file"""
     try:
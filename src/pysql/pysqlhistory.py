@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""This module defines the shell history stored in a local SQLite database.
+Each command is appended as soon as it is executed, with its context (date,
+session, elapsed time, rows, error). Statements are indexed for full text search
+when SQLite has the FTS5 extension, else search falls back to LIKE
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license: GNU GPL V3
+"""
+
+# Python imports:
+import sqlite3
+from time import time
+
+# Pysql imports:
+from .pysqlexception import PysqlException
+
+# Columns of history entries, in the order they are returned
+COLUMNS = ("id", "timestamp", "dsn", "username", "statement", "elapsed", "rows", "error")
+
+historySql = {
+    "createTable": """create table if not exists history (
+                        id integer primary key,
+                        timestamp real,
+                        dsn text,
+                        username text,
+                        statement text not null,
+                        elapsed real,
+                        rows integer,
+                        error text)""",
+    "createFullText": """create virtual table if not exists history_fts
+                         using fts5(statement, content='history', content_rowid='id')""",
+    "checkFullText": "select 1 from history_fts limit 0",
+    "insert": """insert into history (timestamp, dsn, username, statement, elapsed, rows, error)
+                 values (?, ?, ?, ?, ?, ?, ?)""",
+    "insertFullText": "insert into history_fts (rowid, statement) values (?, ?)",
+    "last": "select %s from history order by id desc limit ?" % ", ".join(COLUMNS),
+    "get": "select statement from history where id = ?",
+    "searchFullText": """select %s from history where id in
+                         (select rowid from history_fts where history_fts match ?
+                          order by rowid desc limit ?)
+                         order by id desc""" % ", ".join(COLUMNS),
+    "searchLike": "select %s from history where %%s order by id desc limit ?" % ", ".join(COLUMNS),
+    "count": "select count(*) from history"
+    }
+
+
+class PysqlHistory:
+    """Shell history stored in a SQLite database"""
+    def __init__(self, path, fullText=True):
+        """Opens (and creates if needed) history database
+        @param path: database file path
+        @param fullText: indexes statements with FTS5 if SQLite has it"""
+        try:
+            # Other pysql sessions may be writing at the same time
+            self.connection = sqlite3.connect(path, timeout=5)
+            self.connection.execute("pragma journal_mode=wal")
+            self.connection.execute("pragma synchronous=normal")
+            self.connection.execute(historySql["createTable"])
+            self.fullText = False
+            if fullText:
+                try:
+                    self.connection.execute(historySql["createFullText"])
+                    self.connection.execute(historySql["checkFullText"])
+                    self.fullText = True
+                except sqlite3.OperationalError:
+                    # SQLite built without FTS5
+                    pass
+            self.connection.commit()
+        except sqlite3.Error as e:
+            raise PysqlException(_("Cannot open history %s: %s") % (path, e))
+
+    def add(self, statement, dsn=None, username=None, elapsed=None, rows=None, error=None, timestamp=None):
+        """Appends a command to history
+        @param statement: sql statement or pysql command
+        @param dsn: database of the session, if connected
+        @param username: user of the session, if connected
+        @param elapsed: execution time in seconds
+        @param rows: number of rows fetched
+        @param error: error message if command failed
+        @param timestamp: execution date in seconds since epoch (default is now)"""
+        if timestamp is None:
+            timestamp = time()
+        try:
+            cursor = self.connection.execute(historySql["insert"],
+                                             (timestamp, dsn, username, statement, elapsed, rows, error))
+            if self.fullText:
+                self.connection.execute(historySql["insertFullText"], (cursor.lastrowid, statement))
+            self.connection.commit()
+        except sqlite3.Error as e:
+            self.connection.rollback()
+            raise PysqlException(_("Cannot save command to history: %s") % e)
+
+    def importFile(self, path):
+        """Appends commands of a readline history file (previous history format)
+        @return: number of commands imported"""
+        try:
+            historyFile = open(path, mode="r", encoding="utf-8", errors="replace")
+            try:
+                lines = [line.rstrip("\n") for line in historyFile]
+            finally:
+                historyFile.close()
+        except IOError as e:
+            raise PysqlException(_("Cannot read history file %s: %s") % (path, e))
+        # libedit writes a header line
+        lines = [line for line in lines if line.strip() and line != "_HiStOrY_V2_"]
+        try:
+            for line in lines:
+                cursor = self.connection.execute(historySql["insert"],
+                                                 (None, None, None, line, None, None, None))
+                if self.fullText:
+                    self.connection.execute(historySql["insertFullText"], (cursor.lastrowid, line))
+            self.connection.commit()
+        except sqlite3.Error as e:
+            self.connection.rollback()
+            raise PysqlException(_("Cannot import history file %s: %s") % (path, e))
+        return len(lines)
+
+    def getLast(self, number):
+        """@return: the last number entries (tuples of COLUMNS), oldest first"""
+        return self.__query(historySql["last"], (number,))
+
+    def get(self, id):
+        """@return: statement of entry id or None if it does not exist"""
+        result = self.__query(historySql["get"], (id,))
+        if result:
+            return result[0][0]
+        else:
+            return None
+
+    def search(self, words, number):
+        """Searches entries whose statement contains all words. With full text index,
+        words are matched as token prefixes (emp matches employees)
+        @param words: list of words
+        @param number: maximum number of entries returned
+        @return: the most recent matching entries (tuples of COLUMNS), oldest first"""
+        if not words:
+            return self.getLast(number)
+        if self.fullText:
+            # Each word is a quoted prefix query: no FTS syntax error whatever user types
+            query = " ".join(['"%s"*' % word.replace('"', '""') for word in words])
+            return self.__query(historySql["searchFullText"], (query, number))
+        else:
+            where = " and ".join(["statement like ? escape '\\'"] * len(words))
+            patterns = ["%%%s%%" % word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                        for word in words]
+            return self.__query(historySql["searchLike"] % where, patterns + [number])
+
+    def isEmpty(self):
+        """@return: True if history has no entry"""
+        return self.__query(historySql["count"], ())[0][0] == 0
+
+    def close(self):
+        """Closes history database"""
+        try:
+            self.connection.close()
+        except sqlite3.Error as e:
+            raise PysqlException(_("Cannot close history: %s") % e)
+
+    def __query(self, sql, parameters):
+        """@return: rows of query, in reverse order for history queries (newest entries are selected)"""
+        try:
+            rows = self.connection.execute(sql, parameters).fetchall()
+        except sqlite3.Error as e:
+            raise PysqlException(_("Cannot read history: %s") % e)
+        rows.reverse()
+        return rows
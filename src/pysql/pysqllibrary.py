@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+"""This module defines the user sql library stored in a local SQLite database.
+Requests are read when needed and each change is written at once in its own
+transaction, so a crash loses nothing and big libraries do not slow startup
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license: GNU GPL V3
+"""
+
+# Python imports:
+import sqlite3
+from time import time
+
+# Pysql imports:
+from .pysqlexception import PysqlException
+
+# Greatest unicode character. Used to select names by prefix with the primary key index
+MAX_CHAR = chr(0x10FFFF)
+
+librarySql = {
+    "createTable": """create table if not exists library (
+                        name text primary key,
+                        sql text not null,
+                        modified real)""",
+    "createTagTable": """create table if not exists library_tag (
+                           tag text,
+                           name text,
+                           primary key (tag, name))""",
+    "createTagIndex": "create index if not exists library_tag_name on library_tag (name)",
+    "get": "select sql from library where name = ?",
+    "set": """insert into library (name, sql, modified) values (?, ?, ?)
+              on conflict (name) do update set sql = excluded.sql, modified = excluded.modified""",
+    "remove": "delete from library where name = ?",
+    "removeTags": "delete from library_tag where name = ?",
+    "addTag": "insert or ignore into library_tag (tag, name) values (?, ?)",
+    "names": "select name from library where name >= ? and name < ? order by name",
+    "all": """select l.name, group_concat(t.tag, ','), l.sql
+              from library l left join library_tag t on t.name = l.name
+              where l.name >= ? and l.name < ?
+              group by l.name order by l.name""",
+    "allByTag": """select l.name, group_concat(t.tag, ','), l.sql
+                   from library l join library_tag t on t.name = l.name
+                   where l.name >= ? and l.name < ?
+                   and l.name in (select name from library_tag where tag = ?)
+                   group by l.name order by l.name""",
+    "count": "select count(*) from library"
+    }
+
+
+class PysqlLibrary:
+    """User sql library: named sql requests with optional tags"""
+    def __init__(self, path):
+        """Opens (and creates if needed) library database
+        @param path: database file path"""
+        try:
+            # Other pysql sessions may be writing at the same time
+            self.connection = sqlite3.connect(path, timeout=5)
+            self.connection.execute("pragma journal_mode=wal")
+            for name in ("createTable", "createTagTable", "createTagIndex"):
+                self.connection.execute(librarySql[name])
+            self.connection.commit()
+        except sqlite3.Error as e:
+            raise PysqlException(_("Cannot open sql library %s: %s") % (path, e))
+
+    def get(self, name):
+        """@return: sql request saved as name or None if it does not exist"""
+        result = self.__query(librarySql["get"], (name,))
+        if result:
+            return result[0][0]
+        else:
+            return None
+
+    def set(self, name, sql, tags=None):
+        """Saves a request. An existing request with the same name is replaced
+        @param name: request name
+        @param sql: request text
+        @param tags: list of tags. None keeps tags of the existing request"""
+        self.__write([(librarySql["set"], (name, sql, time()))], name, tags)
+
+    def setTags(self, name, tags):
+        """Replaces tags of an existing request
+        @return: False if request does not exist"""
+        if self.get(name) is None:
+            return False
+        self.__write([], name, tags)
+        return True
+
+    def remove(self, name):
+        """Removes a request and its tags
+        @return: False if request does not exist"""
+        if self.get(name) is None:
+            return False
+        self.__write([(librarySql["remove"], (name,))], name, [])
+        return True
+
+    def getNames(self, prefix=""):
+        """@return: sorted names of requests that start with prefix"""
+        return [row[0] for row in self.__query(librarySql["names"], (prefix, prefix + MAX_CHAR))]
+
+    def getAll(self, prefix="", tag=None):
+        """@param prefix: only requests whose name starts with prefix
+        @param tag: only requests with this tag
+        @return: list of (name, comma separated tags, sql) sorted by name"""
+        if tag:
+            return self.__query(librarySql["allByTag"], (prefix, prefix + MAX_CHAR, tag))
+        else:
+            return self.__query(librarySql["all"], (prefix, prefix + MAX_CHAR))
+
+    def importDict(self, library):
+        """Saves all requests of a dict in one transaction (sql library format of previous versions)
+        @param library: dict of name => sql request
+        @return: number of requests imported"""
+        now = time()
+        self.__write([(librarySql["set"], (name, sql, now)) for (name, sql) in library.items()])
+        return len(library)
+
+    def isEmpty(self):
+        """@return: True if library has no request"""
+        return self.__query(librarySql["count"], ())[0][0] == 0
+
+    def close(self):
+        """Closes library database"""
+        try:
+            self.connection.close()
+        except sqlite3.Error as e:
+            raise PysqlException(_("Cannot close sql library: %s") % e)
+
+    def __write(self, statements, name=None, tags=None):
+        """Executes statements, then replaces tags of request name if tags is not None,
+        in a single transaction
+        @param statements: list of (sql, parameters)"""
+        try:
+            for (sql, parameters) in statements:
+                self.connection.execute(sql, parameters)
+            if tags is not None:
+                self.connection.execute(librarySql["removeTags"], (name,))
+                for tag in tags:
+                    self.connection.execute(librarySql["addTag"], (tag, name))
+            self.connection.commit()
+        except sqlite3.Error as e:
+            self.connection.rollback()
+            raise PysqlException(_("Cannot save sql library: %s") % e)
+
+    def __query(self, sql, parameters):
+        """@return: rows of query"""
+        try:
+            return self.connection.execute(sql, parameters).fetchall()
+        except sqlite3.Error as e:
+            raise PysqlException(_("Cannot read sql library: %s") % e)
@@ -114,6 +114,10 @@ def main():
     # Sets the locale
     # setLocale(conf)
 
+    if options.batch:
+        # Batch mode has its own error handling: it never waits for user input
+        sys.exit(runBatch(options, argv))
+
     try:
         if options.version:
             printComponentsVersion()
@@ -138,7 +142,17 @@ def main():
             if options.oneTryLogin and shell.db == None:
                 rc = 1
             else:
-                shell.loop()
+                profileFile = os.environ.get("PYSQL_PROFILE")
+                if profileFile:
+                    # Profiles whole session to a pstats file
+                    import cProfile
+                    profile = cProfile.Profile()
+                    try:
+                        profile.runcall(shell.loop)
+                    finally:
+                        profile.dump_stats(profileFile)
+                else:
+                    shell.loop()
                 rc = shell.rc
         # Bye
         if os.name == "nt" and not options.version:
@@ -158,6 +172,29 @@ def main():
     # Bye!
     sys.exit(rc)
 
+def runBatch(options, argv):
+    """Runs statements in batch mode
+    @return: exit code"""
+    from . import pysqlbatch
+    try:
+        import cx_Oracle
+    except ImportError as e:
+        sys.stderr.write("pysql: cx_Oracle module cannot be loaded (%s)\n" % e)
+        return pysqlbatch.EXIT_CONNECT_ERROR
+    if len(argv) != 1:
+        sys.stderr.write("pysql: " + _("batch mode needs a connection string") + "\n")
+        return pysqlbatch.EXIT_USAGE_ERROR
+    if options.sql is not None and options.file is not None:
+        sys.stderr.write("pysql: " + _("-e and -f options cannot be used together") + "\n")
+        return pysqlbatch.EXIT_USAGE_ERROR
+    try:
+        statements = pysqlbatch.readStatements(options.sql, options.file)
+    except PysqlException as e:
+        sys.stderr.write("pysql: %s\n" % e)
+        return pysqlbatch.EXIT_USAGE_ERROR
+    return pysqlbatch.runBatch(argv[0], statements, options.format, options.header)
+
+
 def setLocale(conf):
     """Sets the right encoding"""
     try:
@@ -193,6 +230,19 @@ def parseOptions():
     parser.add_option("-L", "--Login", dest="oneTryLogin", action="store_true",
               help="exits if login attempt failed, instead of starting not connected")
 
+    # Batch mode
+    parser.add_option("-B", "--batch", dest="batch", action="store_true",
+              help="runs statements without interactive shell and writes query results to standard output")
+    parser.add_option("-e", "--execute", dest="sql",
+              help="statements run in batch mode")
+    parser.add_option("-f", "--file", dest="file",
+              help="script run in batch mode. Default is to read statements from standard input")
+    parser.add_option("--format", dest="format", type="choice",
+              choices=["tsv", "csv", "jsonl", "arrow", "parquet"], default="tsv",
+              help="format of query results in batch mode: tsv (default), csv, jsonl, arrow or parquet")
+    parser.add_option("--no-header", dest="header", action="store_false", default=True,
+              help="does not write column names in batch mode")
+
     return parser.parse_args()
 
 ###### Starts Pysql ########
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+
+"""This module defines a light PL/SQL tokenizer, the call extractor
+used to draw call graphs of packages and the schema wide call graph index
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license: GNU GPL V3
+"""
+
+# Python imports:
+import re
+
+# Pysql imports:
+from .pysqlexception import PysqlException
+
+# One pass PL/SQL tokenizer. Order matters: comments and strings (including q'[...]' and
+# n'...' literals) must be matched before names and symbols
+TOKEN_PATTERN = re.compile(r"""
+      (?P<space>\s+)
+    | (?P<comment>--[^\n]*|/\*.*?(?:\*/|\Z))
+    | (?P<string>[nN]?[qQ]'(?:\[.*?\]|\{.*?\}|\(.*?\)|<.*?>|(?P<delimiter>\S).*?(?P=delimiter))'
+                |[nN]?'(?:[^']|'')*(?:'|\Z))
+    | (?P<name>[A-Za-z][\w$\#]*|"[^"]*")
+    | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+    | (?P<symbol>=>|:=|\.\.|\|\||<>|!=|<=|>=|.)
+    """, re.VERBOSE | re.DOTALL)
+
+# Keywords that follow END and close a block not counted as a BEGIN/END pair
+END_STATEMENTS = ("IF", "LOOP")
+
+# Keywords that introduce a subprogram without PL/SQL body (call specification)
+CALL_SPECS = ("LANGUAGE", "EXTERNAL")
+
+
+def tokenize(source):
+    """Splits PL/SQL source into tokens. Blanks and comments are dropped.
+    Unquoted names are upper cased, quoted names are given without quotes
+    @param source: PL/SQL source code
+    @type source: str
+    @return: generator of (kind, value, line number) where kind is name, string, number or symbol"""
+    line = 1
+    for match in TOKEN_PATTERN.finditer(source):
+        kind = match.lastgroup
+        if kind == "delimiter":
+            kind = "string"
+        value = match.group()
+        if kind == "name":
+            if value[0] == '"':
+                yield (kind, value[1:-1], line)
+            else:
+                yield (kind, value.upper(), line)
+        elif kind in ("space", "comment"):
+            line += value.count("\n")
+        else:
+            yield (kind, value, line)
+            if kind == "string":
+                line += value.count("\n")
+
+
+def extractCalls(source, packageName=None):
+    """Extracts subprograms and their calls to each other from PL/SQL source.
+    Source is tokenized once. Nested subprograms are named after their parents
+    (OUTER.INNER) and overloaded subprograms share the same name. All calls of
+    a line are found, calls prefixed by the package name included
+    @param source: PL/SQL source code (package body, procedure, function...)
+    @type source: str or list of str (one item per line as read in all_source)
+    @param packageName: name of the package used to recognize qualified self calls
+    @type packageName: str
+    @return: (subprograms, calls). Subprograms is a dict of name => list of line number
+    of each definition. Calls is a set of (caller name, callee name)"""
+    (subprograms, candidates) = parseSubprograms(source, packageName)
+    (calls, unresolved) = resolveCalls(subprograms, candidates)
+    # Code outside subprograms (package initialization) is not part of the tree
+    return (subprograms, set([(caller, callee) for (caller, callee) in calls if caller]))
+
+
+def parseSubprograms(source, packageName=None):
+    """Parses PL/SQL source to find subprograms and names they may call
+    @param source: PL/SQL source code
+    @type source: str or list of str (one item per line as read in all_source)
+    @param packageName: name of the package used to recognize qualified self calls
+    @type packageName: str
+    @return: (subprograms, candidates). Subprograms is a dict of name => list of line number
+    of each definition. Candidates is a set of (caller name, called name). Caller name is empty
+    for code outside subprograms. Called name is QUALIFIER.NAME for qualified names"""
+    if not isinstance(source, str):
+        source = "\n".join(line.rstrip("\n") for line in source)
+    if packageName:
+        packageName = packageName.upper()
+    tokens = list(tokenize(source))
+    nbTokens = len(tokens)
+
+    subprograms = {}  # Subprogram name => lines of definitions
+    candidates = set()  # (caller, called name) not yet resolved
+    frames = []  # Stack of (name, block depth) of subprograms being parsed
+    blocks = []  # Stack of BEGIN or CASE keywords waiting for their END
+    i = 0
+    while i < nbTokens:
+        kind, value, line = tokens[i]
+        if kind != "name":
+            i += 1
+            continue
+        if value in ("FUNCTION", "PROCEDURE") and i + 1 < nbTokens and tokens[i + 1][0] == "name":
+            # Subprogram header. Goes to IS/AS (definition) or ; (declaration)
+            name = tokens[i + 1][1]
+            j = i + 2
+            level = 0
+            while j < nbTokens:
+                value = tokens[j][1]
+                if value == "(":
+                    level += 1
+                elif value == ")":
+                    level -= 1
+                elif level == 0 and (value == ";" or (tokens[j][0] == "name" and value in ("IS", "AS"))):
+                    break
+                j += 1
+            if frames:
+                name = frames[-1][0] + "." + name
+            if j < nbTokens and tokens[j][1] in ("IS", "AS"):
+                subprograms.setdefault(name, []).append(line)
+                if j + 1 < nbTokens and tokens[j + 1][1] in CALL_SPECS:
+                    # No body to parse
+                    j += 1
+                else:
+                    frames.append((name, len(blocks)))
+            i = j + 1
+            continue
+        if value == "BEGIN" or value == "CASE":
+            blocks.append(value)
+        elif value == "END":
+            nextValue = i + 1 < nbTokens and tokens[i + 1][1] or ""
+            if nextValue in END_STATEMENTS:
+                i += 2
+                continue
+            # Closes a block. Closes the subprogram too if it was its body
+            if blocks and blocks.pop() == "BEGIN" and frames and len(blocks) == frames[-1][1]:
+                frames.pop()
+            if i + 1 < nbTokens and tokens[i + 1][0] == "name":
+                # Skips END CASE and labels or subprogram name after END
+                i += 1
+        elif i + 1 < nbTokens and tokens[i + 1][1] in (".", "=>"):
+            # Qualifier or named parameter
+            pass
+        else:
+            caller = frames and frames[-1][0] or ""
+            if i > 1 and tokens[i - 1][1] == "." and tokens[i - 2][0] == "name":
+                if tokens[i - 2][1] == packageName:
+                    # Qualified self call
+                    candidates.add((caller, value))
+                else:
+                    candidates.add((caller, tokens[i - 2][1] + "." + value))
+            else:
+                candidates.add((caller, value))
+        i += 1
+    return (subprograms, candidates)
+
+
+def resolveCalls(subprograms, candidates):
+    """Resolves called names from innermost to outermost scope of the caller
+    @param subprograms: subprograms as returned by parseSubprograms
+    @param candidates: (caller name, called name) as returned by parseSubprograms
+    @return: (calls, unresolved). Calls is a set of (caller name, callee name)
+    and unresolved the set of candidates that are not local subprograms"""
+    calls = set()
+    unresolved = set()
+    for caller, name in candidates:
+        scope = caller
+        while True:
+            callee = scope and scope + "." + name or name
+            if callee in subprograms:
+                calls.add((caller, callee))
+                break
+            if not scope:
+                unresolved.add((caller, name))
+                break
+            scope = scope.rpartition(".")[0]
+    return (calls, unresolved)
+
+
+class CallGraph:
+    """Call graph of all PL/SQL subprograms of a schema. Nodes are named
+    OBJECT.SUBPROGRAM. Standalone functions and procedures, triggers and
+    package initialization code are simply named OBJECT"""
+    def __init__(self):
+        self.callees = {}  # Node => set of called nodes
+        self.callers = {}  # Node => set of calling nodes
+        self.standalones = set()  # Standalone functions and procedures
+        self.pending = []  # (caller node, called name) waiting for resolve()
+
+    def nodeName(self, objectName, name):
+        """@return: node name of subprogram name of object objectName"""
+        if not name or name == objectName:
+            return objectName
+        else:
+            return objectName + "." + name
+
+    def addNode(self, node, standalone=False):
+        """Adds a subprogram to the graph
+        @param node: node name
+        @param standalone: True if node is a standalone function or procedure"""
+        if node not in self.callees:
+            self.callees[node] = set()
+            self.callers[node] = set()
+        if standalone:
+            self.standalones.add(node)
+
+    def addCall(self, caller, callee):
+        """Adds a call between two nodes. Nodes are created if needed"""
+        self.addNode(caller)
+        self.addNode(callee)
+        self.callees[caller].add(callee)
+        self.callers[callee].add(caller)
+
+    def addSource(self, objectName, source):
+        """Parses PL/SQL source of an object and adds its subprograms and
+        internal calls. Calls to other objects are resolved by resolve()
+        @param objectName: name of the package, procedure, function, trigger...
+        @param source: PL/SQL source code (str or list of str)"""
+        (subprograms, candidates) = parseSubprograms(source, objectName)
+        (calls, unresolved) = resolveCalls(subprograms, candidates)
+        self.addNode(objectName, standalone=(objectName in subprograms))
+        for name in subprograms:
+            self.addNode(self.nodeName(objectName, name))
+        for caller, callee in calls:
+            self.addCall(self.nodeName(objectName, caller), self.nodeName(objectName, callee))
+        for caller, name in unresolved:
+            self.pending.append((self.nodeName(objectName, caller), name))
+
+    def resolve(self):
+        """Resolves calls to other objects found by addSource. Must be called once all
+        objects are added: unqualified names are calls to standalone subprograms,
+        qualified names are calls to package subprograms"""
+        for caller, name in self.pending:
+            if "." in name:
+                if name in self.callees:
+                    self.addCall(caller, name)
+            elif name in self.standalones and name != caller:
+                self.addCall(caller, name)
+        self.pending = []
+
+    def find(self, name):
+        """@return: sorted list of nodes named name or of subprograms of object name"""
+        name = name.upper()
+        if name in self.callees:
+            nodes = [name]
+        else:
+            nodes = []
+        nodes.extend([node for node in self.callees if node.startswith(name + ".")])
+        if not nodes:
+            raise PysqlException(_("%s not found in call graph") % name)
+        return sorted(nodes)
+
+    def whoCalls(self, name, maxDepth=None):
+        """Searches subprograms that call directly or indirectly name
+        @param name: subprogram or object name
+        @param maxDepth: maximum number of call levels (all if None)
+        @return: list of (depth, node, called node)"""
+        return self.__search(name, self.callers, maxDepth)
+
+    def reach(self, name, maxDepth=None):
+        """Searches subprograms called directly or indirectly by name
+        @param name: subprogram or object name
+        @param maxDepth: maximum number of call levels (all if None)
+        @return: list of (depth, node, caller node)"""
+        return self.__search(name, self.callees, maxDepth)
+
+    def __search(self, name, links, maxDepth):
+        """Breadth first walk of the graph following links from nodes matching name"""
+        level = self.find(name)
+        visited = set(level)
+        result = []
+        depth = 0
+        while level and (maxDepth is None or depth < maxDepth):
+            depth += 1
+            nextLevel = []
+            for parent in level:
+                for node in sorted(links[parent]):
+                    if node not in visited:
+                        visited.add(node)
+                        result.append((depth, node, parent))
+                        nextLevel.append(node)
+            level = nextLevel
+        return result
@@ -408,7 +408,32 @@ sessionStatSql = {
     "longops":               """select target "Target", message "Message", start_time "Start time", start_time + elapsed_seconds/(60*60*24) "End time",  round(100*sofar/totalwork,2) "Progress (%)"
                                 from v$session_longops
                                 where time_remaining!=0 and sid = :1 order by start_time""",
-    "serialFromSid":         """select serial# from v$session where SID = :1 """
+    "serialFromSid":         """select serial# from v$session where SID = :1 """,
+    # All statistics and wait events of a list of sessions. Used by session trace
+    "snapshot":              """select s.sid, 'statistic', n.name, s.value
+                                from v$sesstat s, v$statname n
+                               where s.statistic# = n.statistic#
+                                 and s.sid in (%s)
+                              union all
+                              select e.sid, 'wait (ms)', e.event, e.time_waited_micro / 1000
+                                from v$session_event e
+                               where e.sid in (%s)""",
+    # Cumulated counters and current state of all sessions. Used by session sampler
+    "sample":                """select s.sid, s.serial#, nvl(c.value, 0),
+                                      nvl(io.block_gets + io.consistent_gets, 0), nvl(io.physical_reads, 0),
+                                      nvl(w.time_waited, 0), s.username, s.program, s.status,
+                                      decode(s.state, 'WAITING', s.event, 'ON CPU'), s.sql_id
+                                from v$session s, v$sess_io io, v$sesstat c, v$statname n,
+                                     (select sid, sum(time_waited) time_waited
+                                        from v$session_event
+                                       where wait_class != 'Idle'
+                                       group by sid) w
+                               where io.sid(+) = s.sid
+                                 and c.sid = s.sid
+                                 and c.statistic# = n.statistic#
+                                 and n.name = 'CPU used by this session'
+                                 and w.sid(+) = s.sid
+                                 and s.type != 'BACKGROUND'"""
 }
 
 # Queries used in pysqlgraphics
@@ -424,20 +449,27 @@ datamodelSql = {
                                                          FROM all_external_tables ext
                                                          WHERE ext.owner=tab.owner
                                                            AND ext.table_name=tab.table_name)""",
-    "columnsFromOwnerAndTable" :    """SELECT column_name
-                                            , data_type
-                                            , (SELECT position
-                                               FROM all_cons_columns col, all_constraints cst
-                                               WHERE cst.owner=col.owner
-                                                 AND tab.owner=col.owner
-                                                 AND tab.table_name=col.table_name
-                                                 AND tab.column_name=col.column_name
-                                                 AND col.constraint_name=cst.constraint_name
-                                                 AND cst.constraint_type='P') pk_position
+    "lastDDLFromOwnerAndTables" :   """SELECT object_name, TO_CHAR(last_ddl_time, 'YYYYMMDDHH24MISS')
+                                       FROM all_objects
+                                       WHERE owner='%s'
+                                         AND object_type='TABLE'
+                                         AND object_name IN (%s)""",
+    "columnsFromOwnerAndTables" :   """SELECT tab.table_name
+                                            , tab.column_name
+                                            , tab.data_type
+                                            , pk.position
                                        FROM all_tab_columns tab
-                                       WHERE owner=:1
-                                         AND table_name=:2
-                                       ORDER BY pk_position, column_id""",
+                                          , (SELECT col.table_name, col.column_name, col.position
+                                             FROM all_cons_columns col, all_constraints cst
+                                             WHERE cst.owner='%s'
+                                               AND col.owner=cst.owner
+                                               AND col.constraint_name=cst.constraint_name
+                                               AND cst.constraint_type='P') pk
+                                       WHERE tab.owner='%s'
+                                         AND tab.table_name IN (%s)
+                                         AND pk.table_name(+)=tab.table_name
+                                         AND pk.column_name(+)=tab.column_name
+                                       ORDER BY tab.table_name, pk.position, tab.column_id""",
    "constraintsFromOwner"     :    """SELECT fk.constraint_name, fk.table_name, pk.table_name
                                        FROM all_constraints fk, all_constraints pk
                                        WHERE fk.owner='%s'
@@ -450,79 +482,91 @@ datamodelSql = {
 }
 
 dependenciesSql = {
-    "refByFromOwnerAndName"  :   """SELECT referenced_owner, referenced_name, referenced_type
+    "refByFromOwnersAndNames"  : """SELECT DISTINCT owner, name, referenced_owner, referenced_name, referenced_type
                                        FROM all_dependencies
-                                       WHERE owner=:1
-                                         AND name=:2""",
-    "refOnFromOwnerAndName"  :   """SELECT owner, name, 'None'
+                                       WHERE (owner, name) IN (%s)""",
+    "refOnFromOwnersAndNames"  : """SELECT DISTINCT referenced_owner, referenced_name, owner, name, type
                                        FROM all_dependencies
-                                       WHERE referenced_owner=:1
-                                         AND referenced_name=:2 """
+                                       WHERE (referenced_owner, referenced_name) IN (%s)"""
 }
 
 diskusageSql = {
-    "Tablespaces"  :            """SELECT DISTINCT tablespace_name
-                                   FROM user_segments
-                                   WHERE segment_type in ('TABLE', 'TABLE PARTITION',
-                                                          'INDEX', 'INDEX PARTITION')""",
-    "TablespacesFromOwner"  :   """SELECT DISTINCT tablespace_name
-                                   FROM dba_segments
-                                   WHERE owner=:1
-                                     AND segment_type in ('TABLE', 'TABLE PARTITION',
-                                                          'INDEX', 'INDEX PARTITION')""",
-    "TablesFromTbs" :           """SELECT t.table_name, t.num_rows, t.avg_row_len, s.bytes
-                                   FROM all_tables t, user_segments s
-                                   WHERE t.tablespace_name=:1
-                                     AND t.table_name=s.segment_name
-                                     AND t.temporary='N'
-                                     AND t.table_name NOT IN (select table_name from all_external_tables)
-                                   UNION
-                                   SELECT p.table_name||'/'||p.partition_name, p.num_rows, p.avg_row_len, s.bytes
-                                   FROM all_tab_partitions p, user_segments s
-                                   WHERE p.tablespace_name=:1
-                                     AND p.partition_name=s.partition_name
-                                     AND s.segment_type='TABLE PARTITION'""",
-    "IndexesFromTbs" :          """SELECT i.index_name, i.num_rows, i.distinct_keys, s.bytes, i.table_name
-                                     FROM all_indexes i, user_segments s
-                                     WHERE i.tablespace_name=:1
-                                       AND i.index_name=s.segment_name
-                                       AND s.segment_type='INDEX'
-                                     UNION
-                                     SELECT p.index_name||'/'||p.partition_name, p.num_rows, p.distinct_keys, s.bytes, ''
-                                     FROM all_ind_partitions p, user_segments s
-                                     WHERE p.tablespace_name=:1
-                                       AND p.partition_name=s.partition_name
-                                       AND s.segment_type='INDEX PARTITION'""",
-    "TablesFromOwnerAndTbs" :   """SELECT t.table_name, t.num_rows, t.avg_row_len, s.bytes
-                                   FROM all_tables t, dba_segments s
-                                   WHERE t.owner=:1
-                                     AND t.tablespace_name=:2
-                                     AND t.owner=s.owner
-                                     AND t.table_name=s.segment_name
+    # %s is the segment view: dba_segments or current user segments with an owner column
+    "SegmentsFromOwner" :       """SELECT s.tablespace_name, 'TABLE', t.table_name, t.num_rows, t.avg_row_len, s.bytes,
+                                          t.table_name
+                                   FROM all_tables t, %s s
+                                   WHERE t.owner=:owner
+                                     AND s.owner=t.owner
+                                     AND s.segment_name=t.table_name
+                                     AND s.segment_type='TABLE'
                                      AND t.temporary='N'
-                                     AND t.table_name NOT IN (select table_name from all_external_tables)
-                                   UNION
-                                   SELECT p.table_name||'/'||p.partition_name, p.num_rows, p.avg_row_len, s.bytes
-                                   FROM all_tab_partitions p, dba_segments s
-                                   WHERE p.table_owner=:1
-                                     AND p.tablespace_name=:2
-                                     AND p.table_owner=s.owner
-                                     AND p.partition_name=s.partition_name
-                                     AND s.segment_type='TABLE PARTITION'""",
-    "IndexesFromOwnerAndTbs" :   """SELECT i.index_name, i.num_rows, i.distinct_keys, s.bytes, i.table_name
-                                     FROM all_indexes i, dba_segments s
-                                     WHERE i.owner=:1
-                                       AND i.tablespace_name=:2
-                                       AND i.owner=s.owner
-                                       AND i.index_name=s.segment_name
-                                       AND s.segment_type='INDEX'
-                                     UNION
-                                     SELECT p.index_name||'/'||p.partition_name, p.num_rows, p.distinct_keys, s.bytes, ''
-                                     FROM all_ind_partitions p, dba_segments s
-                                     WHERE s.owner=:1
-                                       AND p.index_owner=s.owner
-                                       AND p.partition_name=s.partition_name
-                                       AND s.segment_type='INDEX PARTITION'"""
+                                   UNION ALL
+                                   SELECT s.tablespace_name, 'TABLE', p.table_name||'/'||p.partition_name, p.num_rows,
+                                          p.avg_row_len, s.bytes, p.table_name
+                                   FROM all_tab_partitions p, %s s
+                                   WHERE p.table_owner=:owner
+                                     AND s.owner=p.table_owner
+                                     AND s.segment_name=p.table_name
+                                     AND s.partition_name=p.partition_name
+                                     AND s.segment_type='TABLE PARTITION'
+                                   UNION ALL
+                                   SELECT s.tablespace_name, 'INDEX', i.index_name, i.num_rows, i.distinct_keys, s.bytes,
+                                          i.table_name
+                                   FROM all_indexes i, %s s
+                                   WHERE :indexes='Y'
+                                     AND i.owner=:owner
+                                     AND s.owner=i.owner
+                                     AND s.segment_name=i.index_name
+                                     AND s.segment_type='INDEX'
+                                   UNION ALL
+                                   SELECT s.tablespace_name, 'INDEX', p.index_name||'/'||p.partition_name, p.num_rows,
+                                          p.distinct_keys, s.bytes, ''
+                                   FROM all_ind_partitions p, %s s
+                                   WHERE :indexes='Y'
+                                     AND p.index_owner=:owner
+                                     AND s.owner=p.index_owner
+                                     AND s.segment_name=p.index_name
+                                     AND s.partition_name=p.partition_name
+                                     AND s.segment_type='INDEX PARTITION'
+                                   ORDER BY 1, 2 DESC, 6 DESC""",
+    "userSegments" :            """(SELECT USER owner, segment_name, partition_name, segment_type, tablespace_name, bytes
+                                    FROM user_segments)"""
+}
+
+callgraphSql = {
+    "lastDDLFromOwner"     :     """SELECT TO_CHAR(MAX(last_ddl_time), 'YYYYMMDDHH24MISS'), COUNT(*)
+                                   FROM all_objects
+                                   WHERE owner=:1
+                                     AND object_type IN ('PACKAGE', 'PACKAGE BODY', 'PROCEDURE', 'FUNCTION',
+                                                         'TRIGGER', 'TYPE BODY')""",
+    "sourceFromOwner"      :     """SELECT name, text
+                                   FROM all_source
+                                   WHERE owner=:1
+                                     AND type IN ('PACKAGE BODY', 'PROCEDURE', 'FUNCTION', 'TRIGGER', 'TYPE BODY')
+                                   ORDER BY name, type, line""",
+    # PL/Scope (objects compiled with plscope_settings='IDENTIFIERS:ALL')
+    "definitionsFromOwner" :     """SELECT object_name, object_type, name
+                                   FROM all_identifiers
+                                   WHERE owner=:1
+                                     AND usage='DEFINITION'
+                                     AND type IN ('PROCEDURE', 'FUNCTION', 'TRIGGER', 'PACKAGE')""",
+    "callsFromOwner"       :     """SELECT DISTINCT c.caller_object, c.caller_name, d.owner, d.object_name, d.name
+                                   FROM (SELECT CONNECT_BY_ROOT i.object_name caller_object,
+                                                CONNECT_BY_ROOT i.name caller_name, i.usage, i.signature
+                                         FROM all_identifiers i
+                                         START WITH i.owner=:1
+                                                AND i.usage='DEFINITION'
+                                                AND i.type IN ('PROCEDURE', 'FUNCTION', 'TRIGGER', 'PACKAGE')
+                                         CONNECT BY PRIOR i.usage_id=i.usage_context_id
+                                                AND PRIOR i.owner=i.owner
+                                                AND PRIOR i.object_name=i.object_name
+                                                AND PRIOR i.object_type=i.object_type
+                                                AND i.usage<>'DEFINITION') c,
+                                        all_identifiers d
+                                   WHERE c.usage='CALL'
+                                     AND d.signature=c.signature
+                                     AND d.usage IN ('DECLARATION', 'DEFINITION')
+                                     AND d.type IN ('PROCEDURE', 'FUNCTION')"""
 }
 
 # Audit functions queries
@@ -565,6 +609,12 @@ lockSql = {
                      and l2.request > 0 and l1.id1 = l2.id1 and l2.id2 = l2.id2"""
 }
 
+flashbackSql = {
+    "currentScn"  : """select dbms_flashback.get_system_change_number from dual""",
+    "enableAtScn" : """begin dbms_flashback.enable_at_system_change_number(:1); end;""",
+    "disable"     : """begin dbms_flashback.disable; end;"""
+}
+
 gatherCompleteSql = {
     "table"     : """select table_name from user_tables""",
     "index"     : """select index_name from user_indexes""",
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+
+"""This module defines the session sampler that polls Oracle sessions in
+background (like Oracle ASH does) and keeps samples in memory to compute
+top sessions without querying the database again, and session traces that
+compute statistics deltas between snapshots
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license: GNU GPL V3
+"""
+
+# Python imports:
+from array import array
+from collections import deque
+from sys import intern
+from threading import Event, Lock, Thread
+from time import time
+
+# Pysql imports:
+from .pysqlqueries import sessionStatSql
+from .pysqlexception import PysqlException
+from .pysqldb import PysqlDb
+
+# Numeric columns of a sample, in query order. All but sid and serial are cumulated counters
+NUMERIC_COLUMNS = ("sid", "serial", "cpu", "reads", "physicalReads", "waits")
+
+# Text columns of a sample, in query order after numeric columns
+TEXT_COLUMNS = ("username", "program", "status", "event", "sqlId")
+
+# Metrics that can be used to rank sessions
+TOP_METRICS = ("cpu", "reads", "physicalReads", "waits", "activity")
+
+
+class SessionSample:
+    """Snapshot of all sessions at a given time. Numeric columns are stored
+    in compact arrays and repeated strings are shared"""
+    def __init__(self, timestamp, rows):
+        """
+        @param timestamp: sampling time (seconds since epoch)
+        @type timestamp: float
+        @param rows: rows of the sessionStatSql["sample"] query"""
+        self.time = timestamp
+        self.columns = {}
+        for index, name in enumerate(NUMERIC_COLUMNS):
+            self.columns[name] = array("q", [int(row[index] or 0) for row in rows])
+        offset = len(NUMERIC_COLUMNS)
+        for index, name in enumerate(TEXT_COLUMNS):
+            self.columns[name] = [intern(str(row[offset + index] or "")) for row in rows]
+
+    def __len__(self):
+        return len(self.columns["sid"])
+
+    def getKeys(self):
+        """@return: list of (sid, serial) that identify sessions of the sample"""
+        return list(zip(self.columns["sid"], self.columns["serial"]))
+
+
+class RingBuffer:
+    """Thread safe fixed size buffer that keeps the most recent items"""
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise PysqlException(_("Buffer size must be strictly positive"))
+        self.items = [None] * capacity
+        self.capacity = capacity
+        self.start = 0  # Index of oldest item
+        self.size = 0  # Number of items
+        self.lock = Lock()
+
+    def append(self, item):
+        """Adds an item. Oldest item is dropped if buffer is full"""
+        with self.lock:
+            self.items[(self.start + self.size) % self.capacity] = item
+            if self.size < self.capacity:
+                self.size += 1
+            else:
+                self.start = (self.start + 1) % self.capacity
+
+    def getItems(self):
+        """@return: list of items, oldest first"""
+        with self.lock:
+            return [self.items[(self.start + i) % self.capacity] for i in range(self.size)]
+
+    def __len__(self):
+        return self.size
+
+
+class SessionSampler(Thread):
+    """Background thread that samples sessions at regular interval
+    on its own connection"""
+    def __init__(self, connectString, interval, capacity):
+        """
+        @param connectString: Oracle connection string to database
+        @type connectString: str
+        @param interval: number of seconds between two samples
+        @type interval: int
+        @param capacity: maximum number of samples kept in memory
+        @type capacity: int"""
+        Thread.__init__(self)
+        self.setDaemon(True)
+        self.connectString = connectString
+        self.interval = interval
+        self.buffer = RingBuffer(capacity)
+        self.error = None  # PysqlException that stopped sampling, if any
+        self.stopEvent = Event()
+        self.db = None
+
+    def run(self):
+        """Method executed when the thread object start() method is called"""
+        try:
+            self.db = PysqlDb(self.connectString)
+            try:
+                while not self.stopEvent.is_set():
+                    self.sample()
+                    self.stopEvent.wait(self.interval)
+            finally:
+                self.db.close()
+        except PysqlException as e:
+            self.error = e
+
+    def sample(self):
+        """Takes a sample of all sessions"""
+        rows = self.db.executeAll(sessionStatSql["sample"])
+        self.buffer.append(SessionSample(time(), rows))
+
+    def stop(self):
+        """Stops sampling. Samples already taken are kept"""
+        self.stopEvent.set()
+
+    def top(self, metric="cpu", nbLines=10, window=None):
+        """Ranks sessions by their activity between the first and the last samples
+        @param metric: ranking metric (see TOP_METRICS)
+        @param nbLines: number of sessions to return
+        @param window: only use samples of the last window seconds (all samples if None)
+        @return: (header, result, elapsed seconds, number of samples used)"""
+        if metric not in TOP_METRICS:
+            raise PysqlException(_("Unknown metric %s") % metric)
+        if self.error:
+            raise PysqlException(_("Session sampling failed: %s") % self.error)
+        samples = self.buffer.getItems()
+        if window and samples:
+            samples = [sample for sample in samples if sample.time >= samples[-1].time - window]
+        if len(samples) < 2:
+            raise PysqlException(_("Not enough session samples yet. Retry in %s seconds") % self.interval)
+        first = samples[0]
+        last = samples[-1]
+
+        # Position of each session in the first sample
+        firstIndex = dict([(key, i) for (i, key) in enumerate(first.getKeys())])
+        # Active session history: number of samples where session was working
+        activity = {}
+        for sample in samples[1:]:
+            for key, status in zip(sample.getKeys(), sample.columns["status"]):
+                if status == "ACTIVE":
+                    activity[key] = activity.get(key, 0) + 1
+
+        header = [_("Id"), _("Serial"), _("Schema"), _("Program"), _("CPU(ms)"), _("Reads"),
+                  _("Phy Rds"), _("Waits(ms)"), _("Active(%)"), _("Event"), _("SQL Id")]
+        metricIndex = {"cpu": 4, "reads": 5, "physicalReads": 6, "waits": 7, "activity": 8}[metric]
+        columns = last.columns
+        result = []
+        for i, key in enumerate(last.getKeys()):
+            j = firstIndex.get(key)
+            deltas = []
+            for name in ("cpu", "reads", "physicalReads", "waits"):
+                if j is None:
+                    # Session opened after first sample
+                    deltas.append(columns[name][i])
+                else:
+                    deltas.append(columns[name][i] - first.columns[name][j])
+            result.append([key[0], key[1], columns["username"][i], columns["program"][i],
+                           deltas[0] * 10, deltas[1], deltas[2], deltas[3] * 10,
+                           100 * activity.get(key, 0) // (len(samples) - 1),
+                           columns["event"][i], columns["sqlId"][i]])
+        result.sort(key=lambda row: row[metricIndex], reverse=True)
+        return (header, result[:nbLines], last.time - first.time, len(samples))
+
+
+class SessionSnapshot:
+    """Values of all statistics and wait events of some sessions at a given time"""
+    def __init__(self, timestamp, rows):
+        """
+        @param timestamp: snapshot time (seconds since epoch)
+        @type timestamp: float
+        @param rows: rows of the sessionStatSql["snapshot"] query"""
+        self.time = timestamp
+        # (sid, statistic type, statistic name) => value
+        self.values = dict([((int(sid), kind, name), value or 0) for (sid, kind, name, value) in rows])
+
+
+class SessionTrace:
+    """Trace of one or many sessions. Snapshots of all their statistics and
+    wait events are taken on demand or periodically in background"""
+    def __init__(self, sids):
+        """
+        @param sids: traced session ids
+        @type sids: list of str or int"""
+        try:
+            self.sids = sorted(set([int(sid) for sid in sids]))
+        except ValueError:
+            raise PysqlException(_("Session id must be a number"))
+        if not self.sids:
+            raise PysqlException(_("No session to trace"))
+        # Deltas only need the first snapshot and the last two ones: memory does not grow with periodic snapshots
+        self.firstSnapshot = None
+        self.lastSnapshots = deque(maxlen=2)  # SessionSnapshot, oldest first
+        self.nbSnapshots = 0
+        self.lock = Lock()
+        self.snapshotter = None  # TraceSnapshotter thread if periodic snapshots are on
+
+    def getName(self):
+        """@return: trace name (traced session ids)"""
+        return ",".join([str(sid) for sid in self.sids])
+
+    def getNbSnapshots(self):
+        """@return: number of snapshots taken"""
+        return self.nbSnapshots
+
+    def snapshot(self, db):
+        """Takes a snapshot of traced sessions in one query
+        @param db: connection used to query statistics
+        @type db: PysqlDb"""
+        sids = ", ".join([str(sid) for sid in self.sids])
+        rows = db.executeAll(sessionStatSql["snapshot"] % (sids, sids))
+        if not rows:
+            raise PysqlException(_("Session %s does not exist or you are not allowed to see session details")
+                                 % self.getName())
+        self.addSnapshot(SessionSnapshot(time(), rows))
+
+    def addSnapshot(self, snapshot):
+        """Records a snapshot. Only the first one and the last two ones are kept
+        @type snapshot: SessionSnapshot"""
+        with self.lock:
+            if self.firstSnapshot is None:
+                self.firstSnapshot = snapshot
+            self.lastSnapshots.append(snapshot)
+            self.nbSnapshots += 1
+
+    def deltas(self, sinceStart=True, nbLines=None):
+        """Computes statistics deltas between two snapshots. Null deltas are skipped
+        @param sinceStart: deltas between first and last snapshots if True, else between the last two ones
+        (the previous one may have been taken in background)
+        @param nbLines: maximum number of statistics of each type and session (all if None)
+        @return: (header, result, elapsed seconds between snapshots). Result is sorted by session,
+        statistic type and decreasing delta"""
+        with self.lock:
+            if self.nbSnapshots < 2:
+                raise PysqlException(_("Trace %s needs at least two snapshots") % self.getName())
+            if sinceStart:
+                first = self.firstSnapshot
+            else:
+                first = self.lastSnapshots[0]
+            last = self.lastSnapshots[-1]
+        elapsed = last.time - first.time
+        result = []
+        for (sid, kind, name), value in last.values.items():
+            delta = value - first.values.get((sid, kind, name), 0)
+            if delta:
+                if elapsed > 0:
+                    rate = round(delta / elapsed, 1)
+                else:
+                    rate = 0
+                result.append([sid, kind, name, delta, rate])
+        result.sort(key=lambda row: (row[0], row[1], -row[3], row[2]))
+        if nbLines is not None:
+            counts = {}
+            limited = []
+            for row in result:
+                counts[(row[0], row[1])] = counts.get((row[0], row[1]), 0) + 1
+                if counts[(row[0], row[1])] <= nbLines:
+                    limited.append(row)
+            result = limited
+        header = [_("Session"), _("Type"), _("Statistic"), _("Delta"), _("Per second")]
+        return (header, result, elapsed)
+
+    def startSnapshots(self, connectString, interval):
+        """Takes snapshots every interval seconds in background on a new connection"""
+        self.stopSnapshots()
+        self.snapshotter = TraceSnapshotter(self, connectString, interval)
+        self.snapshotter.start()
+
+    def stopSnapshots(self):
+        """Stops background snapshots if any"""
+        if self.snapshotter is not None:
+            self.snapshotter.stop()
+            self.snapshotter = None
+
+
+class TraceSnapshotter(Thread):
+    """Background thread that takes periodic snapshots of a trace"""
+    def __init__(self, trace, connectString, interval):
+        """
+        @param trace: trace to feed
+        @type trace: SessionTrace
+        @param connectString: Oracle connection string to database
+        @type connectString: str
+        @param interval: number of seconds between two snapshots
+        @type interval: int"""
+        Thread.__init__(self)
+        self.setDaemon(True)
+        self.trace = trace
+        self.connectString = connectString
+        self.interval = interval
+        self.error = None  # PysqlException that stopped snapshots, if any
+        self.stopEvent = Event()
+
+    def run(self):
+        """Method executed when the thread object start() method is called"""
+        try:
+            db = PysqlDb(self.connectString)
+            try:
+                while not self.stopEvent.wait(self.interval):
+                    self.trace.snapshot(db)
+            finally:
+                db.close()
+        except PysqlException as e:
+            self.error = e
+
+    def stop(self):
+        """Stops taking snapshots"""
+        self.stopEvent.set()
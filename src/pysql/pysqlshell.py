@@ -12,22 +12,22 @@ import sys
 import os
 import readline
 from re import match, sub
-from time import sleep, time
+from time import localtime, sleep, strftime, time
 from getpass import getpass
-import csv
 
 # Pysql imports:
-from .pysqldb import PysqlDb, BgQuery
+# Graphics, audit, watch and profiling modules are imported by the commands that use them
+from .pysqldb import PysqlDb, PysqlDbPool, BgQuery
 from . import pysqlfunctions
-from . import pysqlgraphics
-from . import pysqlaudit
 from .pysqlexception import PysqlException, PysqlNotImplemented, PysqlOptionParserNormalExitException
 from .pysqlconf import PysqlConf
 from .pysqlcolor import BOLD, CYAN, GREEN, GREY, RED, RESET
-from .pysqlhelpers import itemLength, removeComment, printStackTrace, setTitle, getTitle, \
-                         getTermWidth, WaitCursor, getLastKeyword
+from .pysqlhelpers import itemLength, lobPreview, removeComment, printStackTrace, setTitle, getTitle, \
+                         getTermWidth, WaitCursor, getLastKeyword, splitScript, convert
 from .pysqloptionparser import PysqlOptionParser
 from .pysqlcomplete import CompleteGatheringWorker, completeColumns
+from .pysqlstats import CommandTimer, StatsCollector, PHASES, timedPhase
+from .pysqlsession import SessionSampler, SessionTrace, TOP_METRICS
 
 
 class PysqlShell(cmd.Cmd):
@@ -52,24 +52,44 @@ class PysqlShell(cmd.Cmd):
         self.useCompletion = True  # Indicate if we should use completion with "tab"
         self.showBanner = not silent  # Indicate if intro banner should be displayed
         self.showPrompt = not silent  # Indicate if prompt should be displayed
-        self.trace = {}  # Store session trace statistics between two call to trace command
+        self.trace = {}  # Running SessionTrace by name, kept between two calls to trace command
+        self.sampler = None  # Background session sampler used by session --top
+        self.watchTables = None  # List that captures displayed tables while watching a command
         self.rc = 0  # Shell exit code
         self.oldTermName = ""  # Old terminal name
         self.waitCursor = None  # Waiting cursor thread handler
         self.tty = sys.stdin.isatty()  # Indicate if user interactivity is possible or not.
         self.allowAnimatedCursor = True  # Enable or not animated cursor. Useful for test.
         self.completeLists = {}  # Completionlist dictionary
+        self.stats = StatsCollector()  # Timing statistics of executed commands
+        self.timer = None  # CommandTimer of the running command
+        self.history = None  # Shell history. Interactive sessions only
+        self.termWidth = "auto"  # Display parameters, kept up to date by __confChanged
+        self.widthMin = 5
+        self.transpose = False
+        self.colsep = " "
+        self.shrink = True
+        self.lobPreview = 100
 
         self.notConnectedPrompt = RED + _("(not connected) ") + RESET
 
         # Reads conf
         self.conf = PysqlConf.getConfig()
+        for key in ("termwidth", "widthmin", "transpose", "colsep", "shrink", "lob_preview"):
+            self.__confChanged(key, self.conf.get(key))
+        self.conf.addListener(self.__confChanged)
 
         # Are we in tty (user interaction) or not (script, pipe...) ?
         # If not, doesn't use completion in script neither cursor animation
         if not self.tty:
             self.useCompletion = False
             self.allowAnimatedCursor = False
+        else:
+            # Recalls commands of previous sessions
+            try:
+                self.history = self.conf.loadHistory()
+            except PysqlException as e:
+                print(RED + _("History is disabled: %s") % e + RESET)
 
         # Calls father constructor
         cmd.Cmd.__init__(self, "tab", stdin, stdout)
@@ -104,6 +124,9 @@ class PysqlShell(cmd.Cmd):
         self.cmds = [i[3:] for i in self.get_names() if i.startswith("do_")]
         self.cmds.remove("explain")  # explain command use multine
         self.cmds.remove("csv")  # so does csv
+        self.cmds.remove("export")  # and export
+        self.cmds.remove("lobsave")  # and lobsave
+        self.cmds.remove("lobexport")  # and lobexport
         if self.showBanner:
             banner = _("\nWelcome to pysql shell\n")
             banner += _("""Type "help" for some help.\nUse Tab for completion\n""")
@@ -161,7 +184,18 @@ class PysqlShell(cmd.Cmd):
 
     def onecmd(self, line):
         """This method is subclassed just to be
-        able to encapsulate it with a try/except bloc"""
+        able to encapsulate it with a try/except bloc.
+        It also records command timing statistics"""
+        previousTimer = self.timer  # Commands can be nested (script, watch...)
+        self.timer = CommandTimer()
+        if self.db:
+            self.db.timer = self.timer
+        if line == "" and self.fetching:
+            # Fetching next results of last statement
+            statement = self.lastStatement
+        else:
+            statement = line
+        error = None  # Error message of failed command
         try:
             return cmd.Cmd.onecmd(self, line)
         except PysqlOptionParserNormalExitException:
@@ -170,14 +204,26 @@ class PysqlShell(cmd.Cmd):
         except PysqlException as e:
             print(RED + BOLD + "*** " + _("Pysql error") + " ***\n\t%s" % e + RESET)
             self.exceptions.append(e)
+            error = str(e)
             if e.oraCode == "ORA-03114":  # Not connected to Oracle
                 self.db = None
         except KeyboardInterrupt:
             print(RED + BOLD + _("Break !") + RESET)
+            error = _("Break !")
         except Exception as e:
             # Just a hook for a more pleasant error handling
             print(RED + BOLD + _("\n==> Unhandled error. Sorry <==") + RESET)
             printStackTrace()
+        finally:
+            self.timer.stop()
+            if statement and statement != "EOF":
+                self.stats.record(statement, self.timer)
+            if self.history and line and line != "EOF" and previousTimer is None:
+                # Commands run by other commands (script, watch...) are not recorded
+                self.__addToHistory(line, error)
+            self.timer = previousTimer
+            if self.db:
+                self.db.timer = previousTimer
 
     def precmd(self, line):
         """Hook executed just before any command execution.
@@ -187,6 +233,11 @@ class PysqlShell(cmd.Cmd):
             # Echo line to stdout
             print(line)
 
+        if self.db:
+            # Round trips are reported by postcmd
+            self.db.counter.reset()
+            self.db.counter.measureBytes = (self.conf.get("roundtrips") == "yes")
+
         line, self.comment = removeComment(line, self.comment)
 
         # Removes leading and trailing whitespace
@@ -257,7 +308,8 @@ class PysqlShell(cmd.Cmd):
                and firstWord.lower() not in ("select", "insert", "update", "delete",
                                              "alter", "truncate", "drop", "begin",
                                              "declare", "comment", "create", "grant",
-                                             "revoke", "analyze", "explain", "csv"):
+                                             "revoke", "analyze", "explain", "csv", "export", "lobsave",
+                                             "lobexport"):
                 print(RED + BOLD + _("""Unknown command or sql order. Type "help" for help""") + RESET)
             else:
                 # Bufferise the command and wait for the rest
@@ -284,6 +336,12 @@ class PysqlShell(cmd.Cmd):
         if self.waitCursor:
             self.waitCursor.stop()  # Stop any running cursor
             self.waitCursor = None
+        if self.db and self.conf.get("roundtrips") == "yes":
+            self.__printRoundTrips()
+        pysqlgraphics = sys.modules.get(__package__ + ".pysqlgraphics")  # Loaded by graphical commands only
+        if pysqlgraphics:
+            for job in pysqlgraphics.getFinishedRenderJobs():
+                self.__notifyRenderJob(job)
         if self.multilineCmd:
             self.__setPrompt(multiline=True)
         else:
@@ -420,7 +478,7 @@ class PysqlShell(cmd.Cmd):
 
     def complete_library(self, text, line, begidx, endidx):
         """Completion for library command"""
-        return [k for k  in list(self.conf.sqlLibrary.keys()) if k.startswith(text)]
+        return self.conf.sqlLibrary.getNames(text)
 
     # Command line definitions
     # Connection stuff
@@ -463,66 +521,122 @@ class PysqlShell(cmd.Cmd):
             self.__displayCol(self.completeLists[theme])
             print()
 
+    def parser_history(self):
+        parser = PysqlOptionParser()
+        parser.set_usage(CYAN + "h[istory] " + _("[options] [n]") + RESET)
+        parser.set_description(
+            _("Without argument, prints the last commands. ") +
+            _("If argument is supplied, executes the nth command. ") +
+            _("History is shared by all sessions and kept from one session to another.")
+            )
+        parser.add_option("-s", "--search", dest="search",
+                          default=False, action="store_true",
+                          help=_("prints commands that contain all the words given as arguments"))
+        parser.add_option("-n", "--number", dest="number",
+                          default=20, type="int",
+                          help=_("number of commands printed (default is 20)"))
+        return parser
+
     def do_history(self, arg):
         """Display shell history"""
-        self.__checkArg(arg, "<=1")
-        # TODO: move depth to pysqlConfig
-        # BUG: if history is short stupid things are printed !
-        depth = 20  # Number of history item to be displayed
-        try:
-            length = readline.get_current_history_length()  # Length of current history in readline buffer
-        except AttributeError:
-            message = _("History not available on Windows platform (readline limitation)")
-            raise PysqlException(message)
-        arg = arg.split()
-        if len(arg) == 0:
-            # Display history
-            for i in range(depth):
-                position = length - depth + i
-                print("%d: %s " % (position, readline.get_history_item(position)))
-        elif len(arg) == 1:
+        if self.history is None:
+            raise PysqlException(_("History is only available in interactive sessions"))
+        parser = self.parser_history()
+        options, args = parser.parse_args(arg)
+        if options.search or len(args) == 0:
+            if options.search:
+                entries = self.history.search(args, options.number)
+            else:
+                entries = self.history.getLast(options.number)
+            result = []
+            for (id, timestamp, dsn, username, statement, elapsed, rows, error) in entries:
+                if timestamp is not None:
+                    timestamp = strftime("%Y-%m-%d %H:%M:%S", localtime(timestamp))
+                if username:
+                    session = "%s@%s" % (username, dsn)
+                else:
+                    session = None
+                if elapsed is not None:
+                    elapsed = round(elapsed, 3)
+                result.append((id, timestamp, session, elapsed, rows, statement, error))
+            self.__displayTab(result, (_("#"), _("Date"), _("Session"), _("Time (s)"), _("Rows"),
+                                       _("Command"), _("Error")))
+        elif len(args) == 1:
             # Executes the nth command
             try:
-                position = int(arg[0])
+                position = int(args[0])
             except ValueError:
                 raise PysqlException(_("Argument must be an integer"))
-
-            if position > length:
-                raise PysqlException(_("This is the future ! Cannot execute. Sorry"))
-            elif position <= 0:
-                raise PysqlException(_("Argument should be stricly positive"))
-            else:
-                command = readline.get_history_item(position)
-                command = self.precmd(command)
-                print(command)
-                self.onecmd(command)
+            command = self.history.get(position)
+            if command is None:
+                raise PysqlException(_("Command %s is not in history") % position)
+            command = self.precmd(command)
+            print(command)
+            self.onecmd(command)
         else:
             raise PysqlException(_("See help history for usage"))
 
+    def parser_library(self):
+        parser = PysqlOptionParser()
+        parser.set_usage(CYAN + "lib[rary] " + _("[options] [<sqlName> [<sqlText>|remove]]") + RESET)
+        parser.set_description(
+            _("Handles user custom sql library. Allows user to save and recall sql requests. ") +
+            _("Without argument, prints saved requests. With a name, loads the request in history ") +
+            _("(use up arrow to get it). With a name and a request, saves the request. ") +
+            _("With a name and the remove keyword, removes the request. ") +
+            _("Changes are saved at once and shared by all sessions.")
+            )
+        parser.add_option("-t", "--tags", dest="tags",
+                          default=None,
+                          help=_("comma separated tags. When a request is saved, sets its tags. ") +
+                               _("When requests are printed, only prints requests with this tag"))
+        parser.add_option("-p", "--prefix", dest="prefix",
+                          default="",
+                          help=_("only prints requests whose name starts with this prefix"))
+        # Sql text is not parsed
+        parser.disable_interspersed_args()
+        return parser
+
     def do_library(self, arg):
         """Manage user sql request library"""
-        nArgs = len(arg.split())
-        if nArgs == 0:
-            # Shows all sql library
-            self.__displayTab(list(self.conf.sqlLibrary.items()), (_("Name"), _("SQL request")))
-        elif nArgs == 1:
-            # Recalls a request
-            if arg in self.conf.sqlLibrary:
-                readline.add_history(self.conf.sqlLibrary[arg])
-                print(GREEN + \
-                            _("SQL request was loaded in your history. Use up arrow to get it now") \
-                            + RESET)
+        parser = self.parser_library()
+        options, args = parser.parse_args(arg)
+        library = self.conf.sqlLibrary
+        if options.tags is not None:
+            tags = [tag.strip() for tag in options.tags.split(",") if tag.strip()]
+        else:
+            tags = None
+        if len(args) == 0:
+            # Shows sql library
+            if tags and len(tags) > 1:
+                raise PysqlException(_("Only one tag can be used to select requests"))
+            self.__displayTab(library.getAll(options.prefix, tags and tags[0]),
+                              (_("Name"), _("Tags"), _("SQL request")))
+        elif len(args) == 1:
+            name = args[0]
+            if tags is not None:
+                # Tags an existing request
+                if library.setTags(name, tags):
+                    print(GREEN + _("Request has been saved") + RESET)
+                    return
             else:
-                msg = _("Request %s does not exist. ") % arg + \
-                      _("""Type "lib" without argument to see all requests""")
-                raise PysqlException(msg)
-        elif nArgs > 1:
+                # Recalls a request
+                sql = library.get(name)
+                if sql is not None:
+                    readline.add_history(sql)
+                    print(GREEN + \
+                                _("SQL request was loaded in your history. Use up arrow to get it now") \
+                                + RESET)
+                    return
+            msg = _("Request %s does not exist. ") % name + \
+                  _("""Type "lib" without argument to see all requests""")
+            raise PysqlException(msg)
+        else:
             # First argument is name and second argument can be sql or keyword remove
-            name = arg.split()[0]
-            text = " ".join(arg.split()[1:])
+            name = args[0]
+            text = " ".join(args[1:])
             if text == "remove":
-                if name in self.conf.sqlLibrary:
-                    del self.conf.sqlLibrary[name]
+                if library.remove(name):
                     print(GREEN + _("Request has been removed") + RESET)
                 else:
                     msg = _("Request %s does not exist. ") % name + \
@@ -530,17 +644,23 @@ class PysqlShell(cmd.Cmd):
                     raise PysqlException(msg)
             else:
                 # Add request
-                self.conf.sqlLibrary[name] = text
+                library.set(name, text, tags)
                 print(GREEN + _("Request has been saved") + RESET)
 
     # background queries
     def do_bg(self, arg):
         """Manages background queries"""
+        from . import pysqlgraphics
         arg = arg.split()
         if len(arg) == 0:
             # Shows background queries
             result = [(i.getName(), i.query, not i.isAlive(), i.error) for i in self.bgQueries]
             self.__displayTab(result, [_("#"), _("SQL request"), _("Finished?"), _("Error")])
+            if pysqlgraphics.renderJobs:
+                # Shows pictures being generated
+                result = [(job.prog, job.filepath, job.isDone(), round(job.getElapsedTime(), 1))
+                          for job in pysqlgraphics.renderJobs]
+                self.__displayTab(result, [_("Program"), _("Picture"), _("Finished?"), _("Time (s)")])
         elif len(arg) == 1:
             # Finds the thread
             bgQuery = [i for i in self.bgQueries if i.getName() == arg[0]]
@@ -750,6 +870,7 @@ class PysqlShell(cmd.Cmd):
 
     def do_addmrpt(self, arg):
         """Generates ADDM report"""
+        from . import pysqlaudit
         parser = self.parser_addmrpt()
         options, args = parser.parse_args(arg)
         self.__checkConnection()
@@ -797,6 +918,7 @@ class PysqlShell(cmd.Cmd):
 
     def do_awrrpt(self, arg):
         """Generates AWR report"""
+        from . import pysqlaudit
         parser = self.parser_awrrpt()
         options, args = parser.parse_args(arg)
         self.__checkConnection()
@@ -840,6 +962,7 @@ class PysqlShell(cmd.Cmd):
 
     def do_sqltune(self, arg):
         """Generates SQL tuning advice"""
+        from . import pysqlaudit
         parser = self.parser_sqltune()
         options, args = parser.parse_args(arg)
         self.__checkConnection()
@@ -878,6 +1001,7 @@ class PysqlShell(cmd.Cmd):
 
     def do_durpt(self, arg):
         """Generates disk usage report"""
+        from . import pysqlaudit
         parser = self.parser_durpt()
         options, args = parser.parse_args(arg)
         self.__checkConnection()
@@ -906,6 +1030,7 @@ class PysqlShell(cmd.Cmd):
 
     def do_assmrpt(self, arg):
         """Generates ASSM report"""
+        from . import pysqlaudit
         self.__checkConnection()
         self.__checkArg(arg, "=1")
         self.__animateCursor()
@@ -918,6 +1043,7 @@ class PysqlShell(cmd.Cmd):
         parser.set_usage(CYAN + "datamodel " + _("[options] [filters on table name]]") + RESET)
         parser.set_description(
             _("Extracts the datamodel of a user filtered on selected table pattern. ") +
+            _("The extracted model is cached until a table DDL changes. ") +
             _("The generation of the output is powered by Graphviz (http://www.graphviz.org)")
             )
         if self.db:
@@ -930,16 +1056,25 @@ class PysqlShell(cmd.Cmd):
         parser.add_option("-u", "--user", dest="user",
                           default=defaultUser,
                           help=_("user owner of tables (schema)"))
+        parser.add_option("-i", "--incremental", dest="incremental",
+                          default=False, action="store_true",
+                          help=_("only re-extracts tables whose DDL changed since last extraction"))
+        parser.add_option("-f", "--force", dest="force",
+                          default=False, action="store_true",
+                          help=_("ignores cached model and picture"))
         return parser
 
     def do_datamodel(self, arg):
         """Exports a datamodel as a picture"""
+        from . import pysqlgraphics
         self.__checkConnection()
         parser = self.parser_datamodel()
         options, args = parser.parse_args(arg)
         pysqlgraphics.datamodel(self.db, options.user.upper(),
                                 tableFilter=" ".join(args),
-                                withColumns=options.columns)
+                                withColumns=options.columns,
+                                incremental=options.incremental,
+                                force=options.force)
 
     def parser_dependencies(self):
         parser = PysqlOptionParser()
@@ -963,6 +1098,7 @@ class PysqlShell(cmd.Cmd):
 
     def do_dependencies(self, arg):
         """Exports object dependencies as a picture"""
+        from . import pysqlgraphics
         self.__checkConnection()
         parser = self.parser_dependencies()
         options, args = parser.parse_args(arg)
@@ -976,7 +1112,7 @@ class PysqlShell(cmd.Cmd):
         parser = PysqlOptionParser()
         parser.set_usage(CYAN + "diskusage|du " + _("[options] <schema name>") + RESET)
         parser.set_description(
-            _("Extracts the physical storage of a user as a picture based on Oracle statistics. ") +
+            _("Extracts the physical storage of a user as a picture (or as text) based on Oracle statistics. ") +
             _("The generation of the output is powered by Graphviz (http://www.graphviz.org)")
             )
         parser.add_option("-i", "--index", dest="index",
@@ -985,11 +1121,18 @@ class PysqlShell(cmd.Cmd):
         parser.add_option("-p", "--percent", dest="percent",
                   default=False, action="store_true",
                   help=_("draws object sizes against others"))
+        parser.add_option("-t", "--text", dest="text",
+                  default=False, action="store_true",
+                  help=_("displays segments as text instead of drawing them"))
+        parser.add_option("-c", "--csv", dest="csv",
+                  default=None, metavar="<file>",
+                  help=_("writes segments to a csv file instead of drawing them"))
 
         return parser
 
     def do_diskusage(self, arg):
         """Exports disk usage as a picture"""
+        from . import pysqlgraphics
         self.__checkConnection()
         parser = self.parser_diskusage()
         options, args = parser.parse_args(arg)
@@ -997,7 +1140,27 @@ class PysqlShell(cmd.Cmd):
             user = args[0]
         except IndexError:
             user = self.db.getUsername()
-        pysqlgraphics.diskusage(self.db, user.upper(), options.index, options.percent)
+        if options.text or options.csv:
+            # Tabular output, Graphviz is not needed
+            self.__animateCursor()
+            unit = self.conf.get("unit")
+            header = [_("Tablespace"), _("Type"), _("Name"), _("Size (%s)") % unit.upper(), _("% of tbs"),
+                      _("Rows"), _("Avg row len / Distinct keys"), _("Table")]
+            result = []
+            for tbsName, tbsBytes, tables, indexes in pysqlgraphics.extractDiskusage(self.db, user.upper(),
+                                                                                     options.index):
+                for segmentType, segments in (("TABLE", tables), ("INDEX", indexes)):
+                    for segment in segments:
+                        result.append([tbsName, segmentType, segment[0], round(convert(segment[1], unit), 2),
+                                       round(100.0 * segment[1] / (tbsBytes or 1), 2), segment[2], segment[3],
+                                       segment[4] if segmentType == "INDEX" else segment[0].split("/")[0]])
+            if options.csv:
+                self.__toCsv([header] + result, options.csv, header=False)
+                print(GREEN + _("(Completed)") + RESET)
+            else:
+                self.__displayTab(result, header)
+        else:
+            pysqlgraphics.diskusage(self.db, user.upper(), options.index, options.percent)
 
     def do_ddl(self, arg):
         """Prints Oracle object DDL"""
@@ -1062,6 +1225,23 @@ class PysqlShell(cmd.Cmd):
         parser.add_option("-s", "--search", dest="search",
                           action="append",
                           help=_("filters session display with given search term. Multiple searches can be given to make 'and' search"))
+        parser.add_option("-t", "--top", dest="top",
+                          default=False, action="store_true",
+                          help=_("displays top sessions computed from samples taken in background. ") +
+                               _("Sampling starts on first use"))
+        parser.add_option("-b", "--by", dest="metric",
+                          default="cpu", type="choice",
+                          metavar="<metric>", choices=TOP_METRICS,
+                          help=_("ranks top sessions by: %s") % ", ".join(TOP_METRICS))
+        parser.add_option("-n", "--nbLines", dest="nbLines",
+                          default=10, type="int",
+                          help=_("number of top sessions to display"))
+        parser.add_option("-w", "--window", dest="window",
+                          default=None, type="int",
+                          help=_("only uses samples of the last n seconds"))
+        parser.add_option("-x", "--stop", dest="stop",
+                          default=False, action="store_true",
+                          help=_("stops background session sampling"))
         return parser
 
     def do_session(self, arg):
@@ -1071,7 +1251,11 @@ class PysqlShell(cmd.Cmd):
         options, args = parser.parse_args(arg)
         if options.all and args:
             print(CYAN + _("Note: the all (-a / --all) option is useless when display one session") + RESET)
-        if not args:
+        if options.stop:
+            self.__stopSampler()
+        elif options.top:
+            self.__sessionTop(options.metric, options.nbLines, options.window)
+        elif not args:
             # Lists all session
             (header, result) = pysqlfunctions.sessions(self.db, all=options.all, search=options.search)
             self.__displayTab(result, header)
@@ -1145,55 +1329,120 @@ class PysqlShell(cmd.Cmd):
         (header, result) = pysqlfunctions.sessionsLock(self.db)
         self.__displayTab(result, header)
 
-    def do_trace(self, sid):
-        """Trace a session"""
+    def parser_trace(self):
+        parser = PysqlOptionParser()
+        parser.set_usage(CYAN + "trace " + _("[options] <session id> [<session id>...]") + RESET)
+        parser.set_description(_("Traces all statistics and wait events of one or many sessions. ") +
+                               _("First call starts the trace, second call with the same sessions stops it ") +
+                               _("and displays statistics deltas and rates. Many traces can run at the same time."))
+        parser.add_option("-a", "--auto", dest="interval",
+                          default=None, type="int",
+                          help=_("takes a snapshot every n seconds in background"))
+        parser.add_option("-s", "--snapshot", dest="snapshot",
+                          default=False, action="store_true",
+                          help=_("takes a snapshot and displays deltas since previous one ") +
+                               _("without stopping the trace. ") +
+                               _("With -a, previous snapshot is the last one taken in background"))
+        parser.add_option("-l", "--list", dest="list",
+                          default=False, action="store_true",
+                          help=_("lists running traces"))
+        parser.add_option("-n", "--nbLines", dest="nbLines",
+                          default=20, type="int",
+                          help=_("number of statistics and of wait events displayed for each session"))
+        return parser
+
+    def do_trace(self, arg):
+        """Trace sessions"""
         self.__checkConnection()
-        self.__checkArg(sid, "==1")
-        try:
-            if sid in self.trace:
-                # Ends trace capture and display result
-                ios = list(pysqlfunctions.sessionStat(self.db, sid, "ios")[0])
-                iosHeader = self.db.getDescription()
-                waits = list(pysqlfunctions.sessionStat(self.db, sid, "waitEvents")[0])
-                waitsHeader = self.db.getDescription()
-                def conv(item):
-                    """Sub function to convert str to int and NULL to 0"""
-                    if item is None:
-                        return 0
-                    else:
-                        try:
-                            return int(item)
-                        except ValueError:
-                            return 0
-                ios = [conv(i) for i in ios]
-                waits = [conv(i) for i in waits]
-                self.trace[sid][0] = [conv(i) for i in self.trace[sid][0]]
-                self.trace[sid][1] = [conv(i) for i in self.trace[sid][1]]
-                resultIos = []
-                resultWaits = []
-                for i in range(len(ios)):
-                    resultIos.append(ios[i] - self.trace[sid][0][i])
-                    resultWaits.append(waits[i] - self.trace[sid][1][i])
-                print(CYAN + "*****" + _("Input/Output delta for session %s") % sid + "*****" + RESET)
-                self.__displayTab([resultIos], iosHeader)
-                print(CYAN + "*****" + _("Wait events delta for session %s") % sid + "*****" + RESET)
-                self.__displayTab([resultWaits], waitsHeader)
-                # Removes trace point for this session
-                del self.trace[sid]
+        parser = self.parser_trace()
+        options, args = parser.parse_args(arg)
+        if options.list:
+            result = [(trace.getName(), trace.getNbSnapshots(),
+                       trace.snapshotter and trace.snapshotter.interval or "")
+                      for trace in self.trace.values()]
+            if result:
+                self.__displayTab(result, (_("Sessions"), _("Snapshots"), _("Auto (s)")))
             else:
-                # Starts trace capture
-                print(CYAN + _("Starting trace capture for session %s") % sid + RESET)
-                print(CYAN + _("""Type "trace %s" again to stop trace on this sesssion""") % sid + RESET)
-                ios = list(pysqlfunctions.sessionStat(self.db, sid, "ios")[0])
-                waits = list(pysqlfunctions.sessionStat(self.db, sid, "waitEvents")[0])
-                # Stores to trace dict to compute diff on next trace call
-                self.trace[sid] = [ios, waits]
-        except IndexError:
-            msg = _("Session %s does not exist or you are not allowed to see session details") % sid
-            raise PysqlException(msg)
+                print(CYAN + _("(no result)") + RESET)
+            return
+        self.__checkArg(args, ">=1")
+        trace = SessionTrace(args)
+        name = trace.getName()
+        if name in self.trace:
+            trace = self.trace[name]
+            if trace.snapshotter and trace.snapshotter.error:
+                print(RED + _("Background snapshots failed: %s") % trace.snapshotter.error + RESET)
+            if options.snapshot:
+                trace.snapshot(self.db)
+                (header, result, elapsed) = trace.deltas(sinceStart=False, nbLines=options.nbLines)
+            else:
+                # Ends trace capture and display result
+                trace.stopSnapshots()
+                del self.trace[name]
+                trace.snapshot(self.db)
+                (header, result, elapsed) = trace.deltas(nbLines=options.nbLines)
+            print(CYAN + "*****" + _("Statistics delta for session %s over %.1f seconds") % (name, elapsed)
+                  + "*****" + RESET)
+            self.__displayTab(result, header)
+        elif options.snapshot:
+            raise PysqlException(_("Session %s is not traced") % name)
+        else:
+            # Starts trace capture
+            trace.snapshot(self.db)
+            self.trace[name] = trace
+            if options.interval:
+                trace.startSnapshots(self.db.getConnectString(), options.interval)
+            print(CYAN + _("Starting trace capture for session %s") % name + RESET)
+            print(CYAN + _("""Type "trace %s" again to stop trace on this sesssion""") % " ".join(args) + RESET)
+
+    def parser_callgraph(self):
+        parser = PysqlOptionParser()
+        parser.set_usage(CYAN + "callgraph " + _("[options] <function, procedure or package name>") + RESET)
+        parser.set_description(
+            _("Searches the call graph of the PL/SQL code of a schema. ") +
+            _("Calls are read from PL/Scope when objects are compiled with it, else from PL/SQL source. ") +
+            _("The graph is cached until a PL/SQL object of the schema changes.")
+            )
+        if self.db:
+            defaultUser = self.db.getUsername()
+        else:
+            defaultUser = ""
+        parser.add_option("-r", "--reach", dest="reach",
+                          default=False, action="store_true",
+                          help=_("displays what the subprogram calls instead of who calls it"))
+        parser.add_option("-d", "--depth", dest="maxDepth",
+                          default=None, type="int",
+                          help=_("maximum level of calls (default is all)"))
+        parser.add_option("-u", "--user", dest="user",
+                          default=defaultUser,
+                          help=_("owner of the PL/SQL code (default is current user)"))
+        parser.add_option("-f", "--force", dest="force",
+                          default=False, action="store_true",
+                          help=_("rebuilds the call graph even if cache is up to date"))
+        return parser
+
+    def do_callgraph(self, arg):
+        """Searches callers or callees of PL/SQL subprograms"""
+        self.__checkConnection()
+        parser = self.parser_callgraph()
+        options, args = parser.parse_args(arg)
+        self.__checkArg(args, "=1")
+        self.__animateCursor()
+        graph = pysqlfunctions.callGraph(self.db, options.user.upper(), options.force)
+        if options.reach:
+            result = graph.reach(args[0], options.maxDepth)
+            header = [_("Depth"), _("Called"), _("Caller")]
+        else:
+            result = graph.whoCalls(args[0], options.maxDepth)
+            header = [_("Depth"), _("Caller"), _("Called")]
+        if result:
+            self.__displayTab(result, header)
+        else:
+            print(CYAN + _("(no result)") + RESET)
 
     def do_pkgtree(self, arg):
         """Display PL/SQL package call tree"""
+        from . import pysqlgraphics
         self.__checkConnection()
         self.__checkArg(arg, "==1")
         # raise PysqlNotImplemented()
@@ -1384,29 +1633,49 @@ class PysqlShell(cmd.Cmd):
         print(os.getcwd())
 
     # Script execution
+    def parser_script(self):
+        parser = PysqlOptionParser()
+        parser.set_usage(CYAN + "script|@ " + _("[options] <script>") + RESET)
+        parser.set_description(_("Executes a SQL script and displays the output on the standard output. ") +
+                               _("In parallel mode, independent statements run concurrently on distinct sessions. ") +
+                               _("Commit, rollback, DDL, pysql commands and the '-- pysql:barrier' marker ") +
+                               _("wait for all previous statements before being executed. ") +
+                               _("Except rollback, they also commit work of previous statements, as Oracle does ") +
+                               _("before DDL: locks held by idle sessions would block next statements."))
+        parser.add_option("-p", "--parallel", dest="parallel",
+                          default=1, type="int",
+                          help=_("number of sessions used to run statements concurrently"))
+        return parser
+
     def do_script(self, arg):
         """Execute an external sql file, similar to sql*plus @"""
         self.__checkConnection()
-        self.__checkArg(arg, "==1")
+        parser = self.parser_script()
+        options, args = parser.parse_args(arg)
+        self.__checkArg(args, "==1")
+        fileName = args[0]
         try:
             # If file does not exist, tries with .sql extension
-            if os.access(arg, os.R_OK):
-                fileName = arg
-            else:
-                fileName = arg + ".sql"
+            if not os.access(fileName, os.R_OK):
+                fileName += ".sql"
             script = open(fileName, mode="r", encoding="utf-8")
-            for line in script.readlines():
+            lines = script.readlines()
+            script.close()
+        except IOError as e:
+            raise PysqlException(e)
+        if options.parallel > 1:
+            self.__executeParallelScript(lines, options.parallel)
+        else:
+            for line in lines:
                 line = line.rstrip("\n")
                 line = self.precmd(line)
                 self.onecmd(line)
                 self.postcmd(None, line)
-            script.close()
-        except IOError as e:
-            raise PysqlException(e)
 
     # Command repeating
     def do_watch(self, arg):
         """Repeat a command"""
+        from .pysqlwatch import WatchScreen, WatchWorker
         self.__checkConnection()
         self.__checkArg(arg, ">=1")
         # Checks if interval is given
@@ -1417,16 +1686,31 @@ class PysqlShell(cmd.Cmd):
         except ValueError:
             # Default to 3 secondes
             interval = 3
+        screen = WatchScreen(_("Every %ss: %s") % (interval, arg), self.tty)
+        allowAnimatedCursor = self.allowAnimatedCursor
+        self.allowAnimatedCursor = False
+        worker = None
         try:
             while True:
-                self.onecmd(arg)
-                sleep(interval)
+                start = time()
+                # Command runs in a worker thread so that Ctrl-C is always caught here
+                worker = WatchWorker(self, arg)
+                worker.start()
+                while worker.is_alive():
+                    worker.join(0.1)
+                screen.draw(worker.tables, worker.output)
+                sleep(max(0, interval - (time() - start)))
         except KeyboardInterrupt:
-            # As for now KeyboardInterrupt is never raised
-            # if if cx_Oracle.connection object is created
-            # Bug!
+            if worker is not None and worker.is_alive():
+                try:
+                    self.db.cancel()
+                except PysqlException:
+                    pass
+                worker.join()
+            screen.close()
             print(_("exit watch"))
-            pass
+        finally:
+            self.allowAnimatedCursor = allowAnimatedCursor
 
     # To file
     def do_csv(self, arg):
@@ -1434,17 +1718,181 @@ class PysqlShell(cmd.Cmd):
         self.__checkConnection()
         self.__checkArg(arg, ">=3")
         (fileName, sql) = match("(.+?)\s(.+)", arg).groups()
-        self.__executeSQL(sql, output="csv", fileName=fileName)
+        self.__executeSQL(sql, output="file", fileName=fileName, format="csv")
+
+    def parser_export(self):
+        from .pysqlwriters import WRITERS
+        parser = PysqlOptionParser()
+        parser.set_usage(CYAN + "export " + _("[options] <output file> <sql query>") + RESET)
+        parser.set_description(
+            _("Writes the result of the query to a file. ") +
+            _("Rows are written as they are fetched, so the result can be bigger than memory. ") +
+            _("File is compressed if its name ends with .gz, .zst or .xz (see compress_thread parameter).")
+            )
+        parser.add_option("-f", "--format", dest="format",
+                          default=None, type="choice", choices=sorted(WRITERS),
+                          help=_("file format: %s. Default is guessed from file extension, else csv")
+                          % ", ".join(sorted(WRITERS)))
+        parser.add_option("-n", "--no-header", dest="header",
+                          default=True, action="store_false",
+                          help=_("does not write column names (tsv and csv)"))
+        # Options are before query. Query words are not options
+        parser.disable_interspersed_args()
+        return parser
+
+    def do_export(self, arg):
+        """Exports query result to file"""
+        from .pysqlwriters import getFormat
+        self.__checkConnection()
+        parser = self.parser_export()
+        options, args = parser.parse_args(arg)
+        self.__checkArg(args, ">=2")
+        fileName = args[0]
+        sql = " ".join(args[1:])
+        self.__executeSQL(sql, output="file", fileName=fileName,
+                          format=options.format or getFormat(fileName), header=options.header)
+
+    def do_lobsave(self, arg):
+        """Saves a LOB to file"""
+        self.__checkConnection()
+        self.__checkArg(arg, ">=3")
+        (fileName, sql) = match("(.+?)\s(.+)", arg).groups()
+        self.__animateCursor()
+        size = self.db.saveLob(sql, fileName)
+        print(GREEN + _("(%s characters or bytes written to %s)") % (size, fileName) + RESET)
+
+    def parser_lobexport(self):
+        parser = PysqlOptionParser()
+        parser.set_usage(CYAN + "lobexport " + _("[options] <directory> <sql query>") + RESET)
+        parser.set_description(
+            _("Writes the LOB of each row of the query to its own file. ") +
+            _("The LOB is the last column of the query. Other columns give the file name, ") +
+            _("else files are named by row number. ") +
+            _("LOB are read by pieces, so they can be bigger than memory.")
+            )
+        parser.add_option("-p", "--parallel", dest="parallel",
+                          default=1, type="int",
+                          help=_("number of sessions used to export LOB concurrently. ") +
+                               _("Query must select file names. Each session runs the whole query ") +
+                               _("as of the same SCN: execute privilege on dbms_flashback is needed"))
+        # Options are before query. Query words are not options
+        parser.disable_interspersed_args()
+        return parser
+
+    def do_lobexport(self, arg):
+        """Exports LOB to files"""
+        self.__checkConnection()
+        parser = self.parser_lobexport()
+        options, args = parser.parse_args(arg)
+        self.__checkArg(args, ">=3")
+        directory = args[0]
+        sql = " ".join(args[1:])
+        self.__animateCursor()
+        if options.parallel > 1:
+            pool = PysqlDbPool(self.db.getConnectString(), options.parallel)
+            try:
+                (nbFiles, size) = pysqlfunctions.exportLobsParallel(pool, sql, directory)
+            finally:
+                pool.close()
+        else:
+            (nbFiles, size) = self.db.exportLobs(sql, directory)
+        print(GREEN + _("(%s files, %s characters or bytes written to %s)") % (nbFiles, size, directory) + RESET)
 
     # Time it!
     def do_time(self, arg):
         """Time request execution time"""
         self.__checkConnection()
         self.__checkArg(arg, ">=3")
-        start = time()
         self.__executeSQL(arg, output="null")
-        elapsed = time() - start
-        print(GREEN + _("(Executed in %.1f second(s))") % elapsed + RESET)
+        self.timer.stop()
+        print(GREEN + _("(Executed in %.3f second(s))") % self.timer.elapsed + RESET)
+        print(GREEN + "(" + ", ".join(["%s: %.3f s" % (_(phase), self.timer.phases[phase])
+                                      for phase in PHASES]) + ")" + RESET)
+
+    def parser_stats(self):
+        parser = PysqlOptionParser()
+        parser.set_usage(CYAN + "stats " + _("[options] [statement hash]") + RESET)
+        parser.set_description(_("Displays timing statistics of statements and commands executed during this session. ") +
+                               _("Time is split in phases: parse (client side processing), execute (server), ") +
+                               _("fetch (network and server) and render (client side display or file writing). ") +
+                               _("If a statement hash is given, displays its latency histogram."))
+        parser.add_option("-n", "--nbLines", dest="nbLines",
+                          default=20, type="int",
+                          help=_("number of statements to display"))
+        parser.add_option("-r", "--reset", dest="reset",
+                          default=False, action="store_true",
+                          help=_("forgets all statistics"))
+        return parser
+
+    def do_stats(self, arg):
+        """Display statements timing statistics"""
+        parser = self.parser_stats()
+        options, args = parser.parse_args(arg)
+        self.__checkArg(args, "<=1")
+        if options.reset:
+            self.stats.reset()
+            print(GREEN + _("Statistics have been reset") + RESET)
+        elif args:
+            stats = self.stats.get(args[0])
+            if stats is None:
+                raise PysqlException(_("Unknown statement hash. Use stats without argument to see all statements"))
+            print(CYAN + stats.statement + RESET)
+            histogram = stats.histogram
+            maxCount = max(histogram.buckets)
+            result = [(histogram.getBucketLabel(i), histogram.buckets[i],
+                       "#" * int(round(40.0 * histogram.buckets[i] / maxCount)))
+                      for i in range(histogram.NB_BUCKETS) if histogram.buckets[i]]
+            self.__displayTab(result, [_("Latency"), _("Count"), ""])
+        else:
+            (header, result) = self.stats.getSummary(options.nbLines)
+            self.__displayTab(result, header)
+
+    def parser_cprofile(self):
+        parser = PysqlOptionParser()
+        parser.set_usage(CYAN + "cprofile " + _("[options] <pysql command or sql order>") + RESET)
+        parser.set_description(_("Runs a command under the python profiler and displays client side hot spots. ") +
+                               _("Useful to find where pysql spends time outside of the database. ") +
+                               _("Set PYSQL_PROFILE environment variable to a file name to profile a whole session."))
+        parser.add_option("-n", "--nbLines", dest="nbLines",
+                          default=20, type="int",
+                          help=_("number of functions to display"))
+        parser.add_option("-s", "--sort", dest="sort",
+                          default="cumulative",
+                          help=_("sort order: cumulative (default), tottime, calls or ncalls"))
+        parser.add_option("-o", "--output", dest="output",
+                          default=None,
+                          help=_("also saves raw profile in pstats format to this file"))
+        return parser
+
+    def do_cprofile(self, arg):
+        """Profile a pysql command"""
+        import cProfile
+        import pstats
+        parser = self.parser_cprofile()
+        # Options are only allowed before the profiled command
+        words = arg.split()
+        index = 0
+        while index < len(words) and words[index].startswith("-"):
+            index += 1 if words[index] in ("-n", "--nbLines", "-s", "--sort", "-o", "--output") else 0
+            index += 1
+        options, args = parser.parse_args(" ".join(words[:index]))
+        command = " ".join(words[index:])
+        self.__checkArg(command, ">=1")
+        if options.sort not in ("cumulative", "tottime", "calls", "ncalls"):
+            raise PysqlException(_("Invalid sort order: %s") % options.sort)
+        profile = cProfile.Profile()
+        profile.runcall(self.onecmd, command)
+        if options.output:
+            profile.dump_stats(options.output)
+            print(GREEN + _("(Profile saved to %s)") % options.output + RESET)
+        result = []
+        for (fileName, line, function), (nativeCalls, calls, tottime, cumtime, callers) in pstats.Stats(profile).stats.items():
+            result.append([function, calls, round(tottime, 4), round(cumtime, 4),
+                           "%s:%s" % (os.path.basename(fileName), line)])
+        sortIndex = {"cumulative": 3, "tottime": 2}.get(options.sort, 1)
+        result.sort(key=lambda x: x[sortIndex], reverse=True)
+        self.__displayTab(result[:options.nbLines],
+                          [_("Function"), _("Calls"), _("Own time (s)"), _("Cumulated time (s)"), _("Location")])
 
     # Show it!
     def do_show(self, arg):
@@ -1495,7 +1943,7 @@ class PysqlShell(cmd.Cmd):
         print(_("Manages background queries"))
         print()
         print(_("Sample usages:"))
-        print("\t" + _("To display all background queries:"))
+        print("\t" + _("To display all background queries and pictures being generated:"))
         print("\t\t" + CYAN + "bg" + RESET)
         print("\t" + _("To call back a background query:"))
         print("\t\t" + CYAN + "bg " + _("<id>") + RESET)
@@ -1534,9 +1982,11 @@ class PysqlShell(cmd.Cmd):
         print(_("Usage:"))
         print("\t" + CYAN + "csv " + _("<output file> <sql query>") + RESET)
         print(_("Dumps sql query to file"))
+        print(_("File is compressed if its name ends with .gz, .zst or .xz"))
         print()
         print(_("Example:"))
         print("\t" + CYAN + "csv " + _("out.csv select * from dummy;") + RESET)
+        print("\t" + CYAN + "csv " + _("out.csv.gz select * from dummy;") + RESET)
 
     def help_datafile(self):
         """online help"""
@@ -1598,13 +2048,6 @@ class PysqlShell(cmd.Cmd):
         print(_("Brings some help like usage and a short description"))
         print(_("about the command and its parameters"))
 
-    def help_history(self):
-        """online help"""
-        print(_("Usage:"))
-        print("\t" + CYAN + "h[istory] " + _("<n>") + RESET)
-        print(_("Without any argument, prints the last 20 commands"))
-        print(_("If argument is supplied, executes the nth command"))
-
     def help_index(self):
         """online help"""
         self._help_for_search_method("index")
@@ -1622,21 +2065,16 @@ class PysqlShell(cmd.Cmd):
         print("\t" + CYAN + "lcd " + _("<path>") + RESET)
         print(_("Changes working directory"))
 
-    def help_library(self):
+    def help_lobsave(self):
         """online help"""
         print(_("Usage:"))
-        print("\t" + CYAN + "lib[rary] " + _("<sqlName> <sqlText>") + RESET)
-        print("\t" + _("Handles user custom sql library. Allows user to save and recall sql requests."))
+        print("\t" + CYAN + "lobsave " + _("<output file> <sql query>") + RESET)
+        print(_("Saves to file the LOB of the first column and row of the query"))
+        print(_("The LOB is read by pieces, so it can be bigger than memory"))
+        print(_("Query results only display the first characters of LOB (see lob_preview parameter)"))
         print()
-        print(_("Sample usages: "))
-        print("\t" + _("To see all saved request:"))
-        print("\t\t" + CYAN + "lib" + RESET)
-        print("\t" + _("To save a request as 'employeeNumber':"))
-        print("\t\t" + CYAN + "lib " + _("employeeNumber select count(*) from employee") + RESET)
-        print("\t" + _("recall a saved request:"))
-        print("\t\t" + CYAN + "lib " + _("employeNumber") + RESET)
-        print("\t" + _("To remove the foo request:"))
-        print("\t\t" + CYAN + "lib " + _("foo remove") + RESET)
+        print(_("Example:"))
+        print("\t" + CYAN + "lobsave " + _("doc.pdf select content from documents where id=12;") + RESET)
 
     def help_lls(self):
         """online help"""
@@ -1672,12 +2110,6 @@ class PysqlShell(cmd.Cmd):
         """online help"""
         self._help_for_search_method("procedure")
 
-    def help_script(self):
-        """online help"""
-        print(_("Usage:"))
-        print("\t" + CYAN + "@ " + _("<script>") + RESET)
-        print(_("Executes a PL/SQL script and displays the output on the standard output"))
-
     def help_segment(self):
         """online help"""
         self._help_for_search_method("segment")
@@ -1750,11 +2182,11 @@ class PysqlShell(cmd.Cmd):
         """online help"""
         self._help_for_search_method("tablespace")
 
-    def help_time(self, arg):
+    def help_time(self):
         """online help"""
         print(_("Usage:"))
         print("\t" + CYAN + "time " + _("<sql query>") + RESET)
-        print(_("Time request execution time"))
+        print(_("Time request execution time and displays time spent in each phase"))
 
     def help_trigger(self):
         """online help"""
@@ -1774,6 +2206,8 @@ class PysqlShell(cmd.Cmd):
         print("\t" + CYAN + "watch " + _("<n>") + " " + _("<pysql command or sql order>") + RESET)
         print(_("Repeats the command each n seconds"))
         print(_("If n is ommited, repeat each 3 seconds"))
+        print(_("On a terminal, only values that changed are redrawn and highlighted"))
+        print(_("Use Ctrl-C to stop watching"))
 
     def help_write(self):
         """online help"""
@@ -1819,6 +2253,54 @@ class PysqlShell(cmd.Cmd):
                 pass
         return [prefix + i for i in completeList if i.startswith(text.upper())]
 
+    def __notifyRenderJob(self, job):
+        """Tells user a background picture generation ended and shows the picture"""
+        from . import pysqlgraphics
+        error = job.getError()
+        if error:
+            print(RED + BOLD + _("Background picture generation failed: %s") % error + RESET)
+            return
+        print(GREEN + _("(Picture generated in %.1f second(s): %s)") % (job.getElapsedTime(), job.filepath) + RESET)
+        try:
+            pysqlgraphics.viewImage(job.filepath)
+        except PysqlException as e:
+            print(RED + BOLD + "*** " + _("Pysql error") + " ***\n\t%s" % e + RESET)
+            self.exceptions.append(e)
+
+    def __printRoundTrips(self):
+        """Prints server round trips made by the last command"""
+        counter = self.db.counter
+        if counter.getRoundTrips() == 0:
+            return
+        print(GREEN + _("(%d round trip(s): %d execute(s), %d fetch(es), %d commit/rollback, %d row(s), %.1f KB)")
+              % (counter.getRoundTrips(), counter.executes, counter.fetches, counter.transactions,
+                 counter.rows, counter.bytes / 1024.0) + RESET)
+
+    def __sessionTop(self, metric, nbLines, window):
+        """Displays top sessions from background samples. Starts sampling if needed"""
+        if self.sampler is not None and self.sampler.error is not None:
+            # Sampling is started again by next call
+            error = self.sampler.error
+            self.sampler = None
+            raise PysqlException(_("Session sampling failed: %s") % error)
+        if self.sampler is None or not self.sampler.is_alive():
+            self.sampler = SessionSampler(self.db.getConnectString(),
+                                          self.conf.get("sampler_interval"),
+                                          self.conf.get("sampler_size"))
+            self.sampler.start()
+            print(CYAN + _("Session sampling started every %s seconds") % self.sampler.interval + RESET)
+            return
+        (header, result, elapsed, nbSamples) = self.sampler.top(metric, nbLines, window)
+        print(CYAN + _("(Top sessions by %s over the last %d seconds, %d samples)") %
+              (metric, elapsed, nbSamples) + RESET)
+        self.__displayTab(result, header)
+
+    def __stopSampler(self):
+        """Stops background session sampling if running"""
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler = None
+
     def __connect(self, connectString, mode=""):
         """Calls the PysqlDb class to connect to Oracle"""
 
@@ -1858,6 +2340,10 @@ class PysqlShell(cmd.Cmd):
 
     def __disconnect(self):
         """Disconnects from Oracle and update prompt"""
+        self.__stopSampler()
+        for trace in self.trace.values():
+            trace.stopSnapshots()
+        self.trace.clear()
         if self.db:
             self.db.close()
             self.db = None
@@ -1909,28 +2395,49 @@ class PysqlShell(cmd.Cmd):
             print(GREEN + "***** " + owner + " *****" + RESET)
             self.__displayCol(result[owner])
 
+    def __confChanged(self, key, value):
+        """Follows changes of display parameters"""
+        if key == "termwidth":
+            self.termWidth = value
+        elif key == "widthmin":
+            self.widthMin = value
+        elif key == "transpose":
+            self.transpose = (value == "yes")
+        elif key == "colsep":
+            if value == "space":
+                value = " "
+            self.colsep = value
+        elif key == "shrink":
+            self.shrink = (value == "yes")
+        elif key == "lob_preview":
+            self.lobPreview = value
+
+    @timedPhase("render")
     def __displayCol(self, listOfString):
         """Displays on column the list of strings"""
-        termWidth = self.conf.get("termWidth")
+        termWidth = self.termWidth
         if termWidth == "auto":
             termWidth = getTermWidth()
         self.columnize(listOfString, displaywidth=termWidth)
 
+    @timedPhase("render")
     def __displayTab(self, array, header=None):
         """Displays in tabular the array using correct width for each column"""
-        termWidth = self.conf.get("termWidth")  # Terminal maximum width
+        if self.watchTables is not None:
+            # Watch screen draws tables itself
+            self.watchTables.append((header, [list(i) for i in array]))
+            return
+        termWidth = self.termWidth  # Terminal maximum width
         if termWidth == "auto":
             termWidth = getTermWidth()
-        widthMin = int(self.conf.get("widthMin"))  # Minimum size of the column
-        transpose = (self.conf.get("transpose") == "yes")
-        colsep = self.conf.get("colsep")
-        if colsep == "space":
-            colsep = " "
+        widthMin = self.widthMin  # Minimum size of the column
+        transpose = self.transpose
+        colsep = self.colsep
 
         # Should output be shrinked to fit terminal width?
         if header and self.tty:
         # Uses configuration value
-            shrink = (self.conf.get("shrink") == "yes")
+            shrink = self.shrink
         else:
         # Disables shrinking if isn't a tty
             shrink = False
@@ -2029,14 +2536,18 @@ class PysqlShell(cmd.Cmd):
         except SyntaxError as e:
             raise PysqlException(_("Invalid syntax for argument checking"))
 
-    def __executeSQL(self, sql, output="tty", fileName="pysql.csv"):
+    def __executeSQL(self, sql, output="tty", fileName="pysql.csv", format="csv", header=True):
         """Executes SQL request
         @param sql: SQL request to executed
         @type sql: str
         @param output: output type. Only affect select queries. Null means all result are sent to paradise
-        @type output: str (screen, csv, xml or null)
-        @param fileName: name of the file for csv and xml extract
-        @type fileName: str"""
+        @type output: str (screen, file, xml or null)
+        @param fileName: name of the file for file and xml extract
+        @type fileName: str
+        @param format: file format (see pysqlwriters.WRITERS)
+        @type format: str
+        @param header: writes column names to file
+        @type header: bool"""
 
         self.__checkConnection()
         if len(sql) < 2:
@@ -2063,12 +2574,12 @@ class PysqlShell(cmd.Cmd):
                 (result, moreRows) = self.db.execute(sql)
                 self.__toScreen(result, moreRows)
             elif output == "notty":
+                # Whole result is needed to align columns: no fetch pipeline here
                 (result, moreRows) = self.db.execute(sql, fetch=False)
                 self.__toScreen(result, False)
-            elif output == "csv":
-                (result, moreRows) = self.db.execute(sql, fetch=False)
-                self.__toCsv(result, fileName)
-                print(GREEN + _("(Completed)") + RESET)
+            elif output == "file":
+                nbRows = self.__toFile(sql, fileName, format, header)
+                print(GREEN + _("(%s rows written to %s)") % (nbRows, fileName) + RESET)
             elif output == "xml":
                 raise PysqlNotImplemented()
             elif output == "null":
@@ -2106,6 +2617,93 @@ class PysqlShell(cmd.Cmd):
         else:
             print(RED + BOLD + _("""Unknown command or sql order. Type "help" for help""") + RESET)
 
+    def __executeParallelScript(self, lines, parallel):
+        """Executes script statements concurrently on a pool of sessions
+        Statements are grouped between barriers. Each group is run in parallel.
+        Barriers (except rollback) commit work of previous groups.
+        @param lines: script lines
+        @type lines: list of str
+        @param parallel: number of sessions used
+        @type parallel: int"""
+        statements = splitScript(lines, self.cmds + list(self.aliases.keys()))
+        ddlKeywords = ("ALTER", "ANALYZE", "COMMENT", "CREATE", "DROP", "GRANT", "LOCK",
+                       "RENAME", "REVOKE", "SAVEPOINT", "SET", "TRUNCATE")
+        print(CYAN + _("Opening %d sessions...") % parallel + RESET)
+        pool = PysqlDbPool(self.db.getConnectString(), parallel)
+        results = []  # (index, statement, elapsed, rows, error) of all statements
+        group = []  # Independent statements waiting for execution
+        nGroups = 0  # Number of group executed
+        pending = False  # Is there uncommitted work on pool sessions?
+        start = time()
+        try:
+            for index, (kind, statement) in enumerate(statements, 1):
+                keyword = statement.split()[0].upper().rstrip(";") if statement else ""
+                if kind in ("sql", "plsql") and keyword not in ddlKeywords:
+                    group.append((index, statement))
+                    continue
+                # Barrier: waits for all previous statements
+                if group:
+                    results.extend(pysqlfunctions.executeParallel(pool, group))
+                    nGroups += 1
+                    pending = True
+                    group = []
+                if keyword in ("COMMIT", "ROLLBACK"):
+                    stepStart = time()
+                    error = None
+                    try:
+                        if keyword == "COMMIT":
+                            pool.commit()
+                        else:
+                            pool.rollback()
+                        pending = False
+                    except PysqlException as e:
+                        error = e
+                    results.append((index, statement, time() - stepStart, 0, error))
+                    continue
+                if pending:
+                    # Pool sessions stay idle until the end of script. Their locks must be released
+                    # else next statements would wait for them forever. Oracle commits before DDL anyway
+                    stepStart = time()
+                    try:
+                        pool.commit()
+                        pending = False
+                    except PysqlException as e:
+                        results.append((index, "COMMIT", time() - stepStart, 0, e))
+                if kind == "barrier":
+                    continue
+                elif kind == "command":
+                    # Pysql command are run on the main session
+                    self.onecmd(self.precmd(statement))
+                else:
+                    # DDL is run alone
+                    results.extend(pysqlfunctions.executeParallel(pool, [(index, statement)]))
+            if group:
+                results.extend(pysqlfunctions.executeParallel(pool, group))
+                nGroups += 1
+                pending = True
+        finally:
+            elapsed = time() - start
+            pool.close()
+
+        # Sums up errors and timings
+        errors = [(i[0], i[1], str(i[4])) for i in results if i[4] is not None]
+        self.exceptions.extend([i[4] for i in results if i[4] is not None])
+        totalTime = sum([i[2] for i in results])
+        print(CYAN + "***** " + _("Parallel script report") + " *****" + RESET)
+        self.__displayTab([[len(results), len(errors), nGroups, parallel, round(elapsed, 3),
+                            round(totalTime, 3), round(totalTime / max(elapsed, 0.001), 2)]],
+                          [_("Statements"), _("Errors"), _("Groups"), _("Sessions"), _("Elapsed (s)"),
+                           _("Statements time (s)"), _("Speedup")])
+        if errors:
+            print(RED + BOLD + "***** " + _("Errors") + " *****" + RESET)
+            self.__displayTab(errors, [_("#"), _("Statement"), _("Error")])
+        slowest = sorted(results, key=lambda result: result[2], reverse=True)[:5]
+        print(CYAN + "***** " + _("Slowest statements") + " *****" + RESET)
+        self.__displayTab([(i[0], round(i[2], 3), i[3], i[1]) for i in slowest],
+                          [_("#"), _("Elapsed (s)"), _("Rows"), _("Statement")])
+        if pending:
+            print(RED + BOLD + _("Warning: work not committed by the script has been rolled back") + RESET)
+
     def __toScreen(self, result, moreRows, header=True):
         """Displays first part of fetch on screen
         @param result: array of tabular data
@@ -2116,6 +2714,11 @@ class PysqlShell(cmd.Cmd):
         @type header: bool
         """
         if result:
+            lobColumns = self.db.getLobColumns()
+            if lobColumns:
+                # LOB are fetched whole but only their beginning is displayed
+                result = [[lobPreview(value, self.lobPreview) if i in lobColumns else value
+                           for (i, value) in enumerate(line)] for line in result]
             if header:
                 self.__displayTab(result, self.db.getDescription())
             else:
@@ -2129,18 +2732,48 @@ class PysqlShell(cmd.Cmd):
         else:
             self.fetching = False
 
+    @timedPhase("render")
     def __toCsv(self, result, fileName, header=True):
-        """Writes query result to a file"""
+        """Writes query result to a csv file"""
+        from .pysqlwriters import openWriter
+        writer = openWriter(fileName, "csv", header)
         try:
-            fileHandle = open(fileName, mode="w", encoding="utf-8")
-            csv_writer = csv.writer(fileHandle, dialect="excel")
-            if header:
-                csv_writer.writerow(self.db.getDescription())  # Header
-            for line in result:
-                csv_writer.writerow(line)
-        except Exception as e:
-            raise PysqlException(e)
-        fileHandle.close()
+            writer.startQuery(self.db.getDescription())
+            writer.writeRows(result)
+        finally:
+            writer.close()
+
+    def __toFile(self, sql, fileName, format, header=True):
+        """Executes query and writes its result to a file as it is fetched
+        @return: number of rows written"""
+        from .pysqlwriters import openWriter, writeQuery
+        writer = openWriter(fileName, format, header, self.conf.get("compress_thread") == "yes")
+        start = time()
+        try:
+            nbRows = writeQuery(self.db, sql, writer, self.db.fetchSize)
+        finally:
+            writer.close()
+        (rawSize, diskSize) = writer.sizes
+        if rawSize != diskSize:
+            # Compressed file
+            elapsed = max(time() - start, 0.001)
+            unit = self.conf.get("unit")
+            print(CYAN + _("(%.1f %s raw at %.1f %s/s, %.1f %s compressed at %.1f %s/s)")
+                  % (convert(rawSize, unit), unit.upper(), convert(rawSize / elapsed, unit), unit.upper(),
+                     convert(diskSize, unit), unit.upper(), convert(diskSize / elapsed, unit), unit.upper())
+                  + RESET)
+        return nbRows
+
+    def __addToHistory(self, line, error):
+        """Appends command that has just been executed to history"""
+        if self.db:
+            (dsn, username, rows) = (self.db.getDSN(), self.db.getUsername(), self.db.counter.rows)
+        else:
+            (dsn, username, rows) = (None, None, None)
+        try:
+            self.history.add(line, dsn, username, self.timer.elapsed, rows, error)
+        except PysqlException as e:
+            print(RED + str(e) + RESET)
 
     def __fetchNext(self, nbLines=0):
         """ Fetches next result of current cursor"""
@@ -2158,15 +2791,16 @@ class PysqlShell(cmd.Cmd):
             print(CYAN + "\n\n" + _("Bye !") + "\n" + RESET)
 
         rc = 0
-        # Flushes history to disk
-        try:
-            self.conf.writeHistory()
-        except PysqlException as e:
-            print(e)
-            rc = 1
-        # Flushes sql library to disk
+        # History is written as commands are executed
+        if self.history:
+            try:
+                self.history.close()
+            except PysqlException as e:
+                print(e)
+                rc = 1
+        # Sql library is written as it is changed
         try:
-            self.conf.writeSqlLibrary()
+            self.conf.closeSqlLibrary()
         except PysqlException as e:
             print(e)
             rc = 1
@@ -2181,6 +2815,7 @@ class PysqlShell(cmd.Cmd):
 
     def __askForSnapshotId(self, numDays=0, text=""):
         """ Prompts user and asks him to choose a snapshot id"""
+        from . import pysqlaudit
         if numDays == 0:
             try:
                 answer = input(CYAN + _("Specify the number of days of snapshots to choose from: ") + RESET)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+"""This module defines command timing and latency statistics
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license: GNU GPL V3
+"""
+
+# Python imports:
+from hashlib import md5
+from re import sub
+from time import perf_counter
+
+# Phases of a command. Parse is client side time spent outside the database and rendering
+PHASES = ("parse", "execute", "fetch", "render")
+
+
+def statementHash(statement):
+    """Computes a short hash of a statement. Case, blanks and literal values are ignored
+    so that the same statement with different values share the same hash
+    @param statement: sql statement or pysql command
+    @type statement: str
+    @return: hash (str)"""
+    return md5(normalizeStatement(statement).encode("utf-8")).hexdigest()[:8]
+
+
+def normalizeStatement(statement):
+    """@return: statement with collapsed blanks and literal values replaced by ?"""
+    statement = sub("'[^']*'", "'?'", statement)  # String literals
+    statement = sub(r"\b\d+(\.\d+)?\b", "?", statement)  # Numeric literals
+    statement = sub(r"\s+", " ", statement)
+    return statement.strip().rstrip(";").lower()
+
+
+def timedPhase(phase):
+    """Decorator that accounts method execution time to a phase of the
+    CommandTimer referenced by the instance timer attribute (if any)
+    @param phase: phase name
+    @type phase: str"""
+    def decorator(method):
+        def wrapper(self, *args, **kwargs):
+            timer = self.timer
+            if timer is None:
+                return method(self, *args, **kwargs)
+            timer.enter(phase)
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                timer.leave()
+        wrapper.__name__ = method.__name__
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+    return decorator
+
+
+class CommandTimer:
+    """Measures time spent in each phase of a command.
+    Phases are stacked: entering a phase suspends the current one until leave() is called"""
+    def __init__(self):
+        self.phases = dict.fromkeys(PHASES, 0.0)  # Elapsed time by phase (seconds)
+        self.stack = ["parse"]  # Current phase is the last one
+        self.start = perf_counter()  # Command start time
+        self.phaseStart = self.start  # Current phase start time
+        self.elapsed = None  # Total elapsed time, set by stop()
+
+    def enter(self, phase):
+        """Suspends current phase and starts the given one"""
+        self.__accumulate()
+        self.stack.append(phase)
+
+    def leave(self):
+        """Ends current phase and resumes the previous one"""
+        self.__accumulate()
+        if len(self.stack) > 1:
+            self.stack.pop()
+
+    def stop(self):
+        """Stops timer
+        @return: total elapsed time in seconds"""
+        self.__accumulate()
+        self.elapsed = perf_counter() - self.start
+        return self.elapsed
+
+    def __accumulate(self):
+        """Adds time elapsed since last phase change to current phase"""
+        now = perf_counter()
+        self.phases[self.stack[-1]] += now - self.phaseStart
+        self.phaseStart = now
+
+
+class LatencyHistogram:
+    """Histogram of latencies with power of two millisecond buckets"""
+    NB_BUCKETS = 21  # From <1ms to >= 2^19 ms (about 9 minutes)
+
+    def __init__(self):
+        self.buckets = [0] * self.NB_BUCKETS  # Number of measures by bucket
+        self.count = 0  # Total number of measures
+        self.total = 0.0  # Sum of all measures (seconds)
+        self.max = 0.0  # Highest measure (seconds)
+
+    def add(self, elapsed):
+        """Adds a measure
+        @param elapsed: latency in seconds
+        @type elapsed: float"""
+        milliseconds = int(elapsed * 1000)
+        self.buckets[min(milliseconds.bit_length(), self.NB_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+    def getBucketLabel(self, index):
+        """@return: human readable range of a bucket (str)"""
+        if index == 0:
+            return "< 1 ms"
+        elif index == self.NB_BUCKETS - 1:
+            return ">= %d ms" % 2 ** (index - 1)
+        else:
+            return "%d - %d ms" % (2 ** (index - 1), 2 ** index - 1)
+
+    def percentile(self, percent):
+        """Estimates a percentile. Result is the upper bound of the bucket
+        @param percent: percentile to compute (between 0 and 100)
+        @return: latency in milliseconds (float)"""
+        if self.count == 0:
+            return 0.0
+        threshold = self.count * percent / 100.0
+        cumulated = 0
+        for index in range(self.NB_BUCKETS):
+            cumulated += self.buckets[index]
+            if cumulated >= threshold and index < self.NB_BUCKETS - 1:
+                return min(float(2 ** index), round(self.max * 1000, 1))
+        return round(self.max * 1000, 1)
+
+
+class StatementStats:
+    """Latency statistics of one statement"""
+    def __init__(self, statement):
+        self.statement = normalizeStatement(statement)
+        self.histogram = LatencyHistogram()
+        self.phases = dict.fromkeys(PHASES, 0.0)  # Cumulated time by phase (seconds)
+
+    def add(self, timer):
+        """Adds measures of a stopped CommandTimer"""
+        self.histogram.add(timer.elapsed)
+        for phase in PHASES:
+            self.phases[phase] += timer.phases[phase]
+
+
+class StatsCollector:
+    """In memory statistics of all commands executed, by statement hash"""
+    def __init__(self):
+        self.statements = {}  # Key is statement hash, value is StatementStats
+
+    def record(self, statement, timer):
+        """Records timing of a statement
+        @param statement: sql statement or pysql command
+        @param timer: stopped CommandTimer instance"""
+        key = statementHash(statement)
+        if key not in self.statements:
+            self.statements[key] = StatementStats(statement)
+        self.statements[key].add(timer)
+
+    def get(self, key):
+        """@return: StatementStats for the given hash or None"""
+        return self.statements.get(key)
+
+    def reset(self):
+        """Forgets all statistics"""
+        self.statements.clear()
+
+    def getSummary(self, nbLines=20):
+        """Summarises statistics of the most time consuming statements
+        @param nbLines: maximum number of statements to report
+        @return: header and resultset in tabular format"""
+        header = [_("Hash"), _("Count"), _("Total (s)"), _("Avg (ms)"), _("P50 (ms)"), _("P95 (ms)"),
+                  _("Max (ms)")] + ["%s %%" % phase.capitalize() for phase in PHASES] + [_("Statement")]
+        result = []
+        statements = sorted(list(self.statements.items()), key=lambda i: i[1].histogram.total, reverse=True)
+        for key, stats in statements[:nbLines]:
+            histogram = stats.histogram
+            total = sum(stats.phases.values()) or 1
+            result.append([key, histogram.count, round(histogram.total, 3),
+                           round(1000 * histogram.total / histogram.count, 1),
+                           histogram.percentile(50), histogram.percentile(95), round(histogram.max * 1000, 1)]
+                          + [round(100 * stats.phases[phase] / total, 1) for phase in PHASES]
+                          + [stats.statement])
+        return (header, result)
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+"""This module defines the watch command machinery: the worker that runs
+the watched command and the screen that only redraws cells that changed
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license: GNU GPL V3
+"""
+
+# Python imports:
+import sys
+from io import StringIO
+from shutil import get_terminal_size
+from threading import Thread
+from time import sleep, strftime, time
+
+# Pysql imports:
+from .pysqlcolor import BOLD, GREEN, RED, RESET
+
+# Minimum number of seconds between two screen updates
+WATCH_MIN_REFRESH = 0.5
+
+# ANSI terminal sequences
+CLEAR_SCREEN = "\033[2J\033[H"
+CLEAR_LINE = "\033[K"
+MOVE_TO = "\033[%d;%dH"  # Line and column, starting at 1
+
+
+class WatchWorker(Thread):
+    """Runs once a shell command and captures its output. Tables the command
+    would have displayed are captured as data instead of text"""
+    def __init__(self, shell, line):
+        """
+        @param shell: shell that executes the command
+        @type shell: PysqlShell
+        @param line: command line
+        @type line: str"""
+        Thread.__init__(self)
+        self.setDaemon(True)
+        self.shell = shell
+        self.line = line
+        self.tables = []  # Captured (header, rows)
+        self.output = ""  # Other command output
+
+    def run(self):
+        """Method executed when the thread object start() method is called"""
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        self.shell.watchTables = self.tables
+        try:
+            self.shell.onecmd(self.line)
+        finally:
+            self.shell.watchTables = None
+            self.output = sys.stdout.getvalue()
+            sys.stdout = stdout
+
+
+class WatchScreen:
+    """Draws successive results of a watched command. On a terminal, only cells
+    that changed since the previous draw are rewritten. Cells whose value changed
+    since the previous result of the same row (rows are identified by their first
+    columns, not by their position) are highlighted"""
+    def __init__(self, title, tty):
+        """
+        @param title: text displayed on top of the screen
+        @type title: str
+        @param tty: draws on a terminal. If False, results are printed one after the other
+        @type tty: bool"""
+        self.title = title
+        self.tty = tty
+        self.screen = []  # Lines on screen: list of list of (text, style) cells
+        self.widths = {}  # Table index => columns width
+        self.values = {}  # Row key => row values of previous draw
+        self.lastDraw = 0
+
+    def draw(self, tables, output):
+        """Draws a new result of the watched command
+        @param tables: list of (header, rows) captured by WatchWorker
+        @param output: other command output (str)"""
+        wait = WATCH_MIN_REFRESH - (time() - self.lastDraw)
+        if wait > 0:
+            sleep(wait)
+        self.lastDraw = time()
+
+        widthChanged = False
+        for index, (header, rows) in enumerate(tables):
+            widths = self.__computeWidths(header, rows, self.widths.get(index, []))
+            if widths != self.widths.get(index):
+                widthChanged = True
+                self.widths[index] = widths
+        frame = self.__frame(tables, output)
+
+        if not self.tty:
+            print("\n".join(["".join([text for (text, style) in line]) for line in frame]))
+            return
+
+        # Don't write below the bottom of the terminal
+        height = get_terminal_size().lines - 1
+        if len(frame) > height:
+            hidden = len(frame) - height + 1
+            frame = frame[:height - 1] + [[(_("(%d more lines)") % hidden, "")]]
+
+        writes = []
+        if widthChanged or not self.screen:
+            writes.append(CLEAR_SCREEN)
+            self.screen = []
+        for y, line in enumerate(frame):
+            if y < len(self.screen):
+                previous = self.screen[y]
+            else:
+                previous = []
+            x = 0
+            for c, cell in enumerate(line):
+                if c >= len(previous) or previous[c] != cell:
+                    writes.append(MOVE_TO % (y + 1, x + 1) + cell[1] + cell[0] + (cell[1] and RESET))
+                x += len(cell[0])
+            if len(previous) > len(line):
+                writes.append(MOVE_TO % (y + 1, x + 1) + CLEAR_LINE)
+        for y in range(len(frame), len(self.screen)):
+            writes.append(MOVE_TO % (y + 1, 1) + CLEAR_LINE)
+        writes.append(MOVE_TO % (len(frame) + 1, 1))
+        # One write by draw
+        sys.stdout.write("".join(writes))
+        sys.stdout.flush()
+        self.screen = frame
+
+    def close(self):
+        """Moves cursor after the last line of the screen"""
+        if self.tty and self.screen:
+            sys.stdout.write(MOVE_TO % (len(self.screen) + 1, 1))
+            sys.stdout.flush()
+
+    def __frame(self, tables, output):
+        """@return: lines to display. Each line is a list of (text, style) cells"""
+        frame = [[(self.title, ""), ("  " + strftime("%H:%M:%S"), "")]]
+        for line in output.splitlines():
+            frame.append([(line, "")])
+        values = {}
+        for index, (header, rows) in enumerate(tables):
+            widths = self.widths[index]
+            if header:
+                frame.append([(str(h).ljust(w) + " ", BOLD) for (h, w) in zip(header, widths)])
+                frame.append([("-" * w + " ", "") for w in widths])
+            for key, row in zip(self.__rowKeys(index, rows), rows):
+                previous = self.values.get(key)
+                line = []
+                for c, (value, width) in enumerate(zip(row, widths)):
+                    if value is None:
+                        text = "NULL".ljust(width)
+                    elif isinstance(value, (int, float)):
+                        text = str(value).rjust(width)
+                    else:
+                        text = str(value).ljust(width)
+                    if previous is None or c >= len(previous) or previous[c] == value:
+                        style = ""
+                    elif isinstance(value, (int, float)) and isinstance(previous[c], (int, float)):
+                        if value > previous[c]:
+                            style = GREEN
+                        else:
+                            style = RED
+                    else:
+                        style = BOLD
+                    line.append((text + " ", style))
+                frame.append(line)
+                values[key] = row
+        self.values = values
+        return frame
+
+    def __computeWidths(self, header, rows, widths):
+        """@return: columns width. Columns never shrink to avoid full redraws"""
+        if header:
+            columns = [[h] for h in header]
+        else:
+            columns = [[] for i in range(len(rows and rows[0] or []))]
+        for row in rows:
+            for c, value in enumerate(row[:len(columns)]):
+                columns[c].append(value)
+        result = []
+        for c, values in enumerate(columns):
+            width = max([len(value is None and "NULL" or str(value)) for value in values] or [0])
+            if c < len(widths):
+                width = max(width, widths[c])
+            result.append(width)
+        return result
+
+    def __rowKeys(self, index, rows):
+        """Identifies rows by their first column, or their two first columns if the first one
+        is not unique (session id and serial for example), else by their position
+        @return: list of keys"""
+        for nbColumns in (1, 2):
+            keys = [(index,) + tuple(row[:nbColumns]) for row in rows]
+            if len(set(keys)) == len(keys):
+                return keys
+        return [(index, i) for i in range(len(rows))]
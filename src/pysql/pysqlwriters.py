@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+
+"""This module defines the writers that export query results to files or streams.
+Rows are written by batches as they are fetched
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license: GNU GPL V3
+"""
+
+# Python imports:
+import csv
+import datetime
+import io
+import json
+import os
+from queue import Queue
+from threading import Thread
+
+# Pysql imports:
+from .pysqlexception import PysqlException, PysqlNotImplemented
+
+# Number of rows fetched by round trip while exporting
+EXPORT_FETCH_SIZE = 500
+
+# File extension => format
+EXTENSIONS = {".tsv": "tsv", ".txt": "tsv", ".csv": "csv", ".jsonl": "jsonl", ".json": "jsonl",
+              ".arrow": "arrow", ".feather": "arrow", ".parquet": "parquet"}
+
+# File extension => compression
+COMPRESSIONS = {".gz": "gzip", ".zst": "zstd", ".xz": "xz"}
+
+# Maximum number of data pieces waiting for the compression thread
+COMPRESS_QUEUE_SIZE = 64
+
+
+def formatValue(value):
+    """Converts a fetched value to a plain python value that can be written as text
+    @return: str, int, float or None"""
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    elif isinstance(value, bytes):
+        return value.hex()
+    elif isinstance(value, (str, int, float)) or value is None:
+        return value
+    else:
+        return str(value)
+
+
+class Writer:
+    """Mother class of all writers"""
+    binary = False  # Does writer need a binary output?
+
+    def __init__(self, output, header=True):
+        """
+        @param output: file like object (binary if writer class binary attribute is set)
+        @param header: writes column names before the rows of each query"""
+        self.output = output
+        self.header = header
+        self.file = None  # File opened by openWriter(), closed with writer
+        self.fileName = None
+        self.sizes = None  # (bytes written by writer, bytes written to disk) once file is closed
+
+    def startQuery(self, columns, types=None):
+        """Starts the result of a new query
+        @param columns: column names
+        @param types: list of (Oracle type name, precision, scale) of columns
+        (see PysqlDb.getColumnTypes)"""
+        pass
+
+    def writeRows(self, rows):
+        """Writes a batch of rows. Must be defined by each writer"""
+        raise PysqlNotImplemented()
+
+    def flush(self):
+        """Sends rows already written to output"""
+        self.output.flush()
+
+    def close(self):
+        """Ends output. File opened by openWriter() is closed"""
+        if self.file is not None:
+            binaryFile = getattr(self.file, "buffer", self.file)  # Compressed output is below text layer
+            self.file.close()
+            diskSize = os.path.getsize(self.fileName)
+            self.sizes = (getattr(binaryFile, "rawSize", diskSize), diskSize)
+            self.file = None
+
+
+class TsvWriter(Writer):
+    """Writes rows as tab separated values. Tabs, new lines and backslashes
+    in values are escaped with a backslash. Null is an empty value"""
+    def startQuery(self, columns, types=None):
+        """Writes column names of a new query"""
+        if self.header:
+            self.output.write("\t".join([self.__escape(column) for column in columns]) + "\n")
+
+    def writeRows(self, rows):
+        """Writes a batch of rows"""
+        lines = []
+        for row in rows:
+            lines.append("\t".join([self.__escape(formatValue(value)) for value in row]))
+        lines.append("")
+        self.output.write("\n".join(lines))
+
+    def __escape(self, value):
+        if value is None:
+            return ""
+        value = str(value).replace("\\", "\\\\").replace("\t", "\\t")
+        return value.replace("\n", "\\n").replace("\r", "\\r")
+
+
+class CsvWriter(Writer):
+    """Writes rows as comma separated values (RFC 4180 quoting)"""
+    def __init__(self, output, header=True):
+        Writer.__init__(self, output, header)
+        self.writer = csv.writer(output, lineterminator="\n")
+
+    def startQuery(self, columns, types=None):
+        """Writes column names of a new query"""
+        if self.header:
+            self.writer.writerow(columns)
+
+    def writeRows(self, rows):
+        """Writes a batch of rows"""
+        self.writer.writerows([[formatValue(value) for value in row] for row in rows])
+
+
+class JsonLinesWriter(Writer):
+    """Writes each row as a JSON object on its own line. Column names
+    are always written as object keys"""
+    def __init__(self, output, header=True):
+        Writer.__init__(self, output, header)
+        self.columns = []
+
+    def startQuery(self, columns, types=None):
+        """Column names of a new query are the keys of the next objects. Nothing is written"""
+        self.columns = columns
+
+    def writeRows(self, rows):
+        """Writes a batch of rows"""
+        lines = []
+        for row in rows:
+            lines.append(json.dumps(dict(zip(self.columns, [formatValue(value) for value in row])),
+                                    ensure_ascii=False))
+        lines.append("")
+        self.output.write("\n".join(lines))
+
+
+class ArrowWriter(Writer):
+    """Writes rows as Arrow IPC file. Each batch of rows becomes a record batch.
+    Column types come from Oracle column types. Needs pyarrow"""
+    binary = True
+
+    def __init__(self, output, header=True):
+        Writer.__init__(self, output, header)
+        try:
+            import pyarrow
+        except ImportError:
+            raise PysqlException(_("Format %s is not available because pyarrow module is not installed")
+                                 % self.getFormat())
+        self.pyarrow = pyarrow
+        self.schema = None
+        self.writer = None  # pyarrow writer, created with the schema of first query
+
+    def getFormat(self):
+        """@return: format name"""
+        return "arrow"
+
+    def startQuery(self, columns, types=None):
+        """Computes schema of query result. All queries must have the same schema"""
+        if types is None:
+            types = [("", None, None)] * len(columns)
+        schema = self.pyarrow.schema([(column, self.__arrowType(*columnType))
+                                      for (column, columnType) in zip(columns, types)])
+        if self.writer is None:
+            self.schema = schema
+            self.writer = self.newWriter(schema)
+        elif not schema.equals(self.schema):
+            raise PysqlException(_("All queries written to a %s file must have the same columns")
+                                 % self.getFormat())
+
+    def newWriter(self, schema):
+        """@return: pyarrow writer of schema to output"""
+        return self.pyarrow.ipc.new_file(self.output, schema)
+
+    def writeRows(self, rows):
+        """Writes a batch of rows as a record batch"""
+        if not rows:
+            return
+        arrays = []
+        for field, values in zip(self.schema, zip(*rows)):
+            if self.pyarrow.types.is_string(field.type):
+                values = [value if value is None or isinstance(value, str) else str(formatValue(value))
+                          for value in values]
+            arrays.append(self.pyarrow.array(values, type=field.type))
+        self.writer.write_table(self.pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        """Writes file footer"""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        Writer.close(self)
+
+    def __arrowType(self, typeName, precision, scale):
+        """@return: arrow type of an Oracle column type"""
+        pyarrow = self.pyarrow
+        if typeName == "NATIVE_INT" or (typeName == "NUMBER" and scale == 0 and 0 < (precision or 0) <= 18):
+            return pyarrow.int64()
+        elif typeName in ("NUMBER", "NATIVE_FLOAT", "BINARY_FLOAT", "BINARY_DOUBLE"):
+            return pyarrow.float64()
+        elif typeName in ("DATETIME", "DATE", "TIMESTAMP", "TIMESTAMP_TZ", "TIMESTAMP_LTZ"):
+            return pyarrow.timestamp("us")
+        elif typeName in ("BLOB", "BINARY", "RAW", "LONG_BINARY", "LONG_RAW"):
+            return pyarrow.binary()
+        else:
+            return pyarrow.string()
+
+
+class ParquetWriter(ArrowWriter):
+    """Writes rows as a Parquet file. Each batch of rows becomes a row group. Needs pyarrow"""
+    def getFormat(self):
+        """@return: format name"""
+        return "parquet"
+
+    def newWriter(self, schema):
+        """@return: pyarrow writer of schema to output"""
+        import pyarrow.parquet
+        return pyarrow.parquet.ParquetWriter(self.output, schema)
+
+
+WRITERS = {"tsv": TsvWriter, "csv": CsvWriter, "jsonl": JsonLinesWriter,
+           "arrow": ArrowWriter, "parquet": ParquetWriter}
+
+
+class CompressedOutput(io.RawIOBase):
+    """Binary file that compresses what is written to it. Compression can run in its
+    own thread, so that it overlaps with fetching and formatting rows"""
+    def __init__(self, fileName, compression, threaded=False):
+        """
+        @param fileName: file path
+        @param compression: gzip, zstd or xz (see COMPRESSIONS)
+        @param threaded: compresses in a separate thread"""
+        io.RawIOBase.__init__(self)
+        self.rawSize = 0  # Bytes before compression
+        self.file = open(fileName, mode="wb")
+        try:
+            self.compressor = self.__newCompressor(compression)
+        except PysqlException:
+            self.file.close()
+            raise
+        self.queue = None
+        self.error = None  # Exception raised by compression thread
+        if threaded:
+            self.queue = Queue(COMPRESS_QUEUE_SIZE)
+            self.thread = Thread(target=self.__compress, daemon=True)
+            self.thread.start()
+
+    def __newCompressor(self, compression):
+        """@return: file like object that compresses to self.file"""
+        if compression == "gzip":
+            import gzip
+            return gzip.GzipFile(fileobj=self.file, mode="wb", compresslevel=6)
+        elif compression == "xz":
+            import lzma
+            # Default preset is too slow to keep up with fetching
+            return lzma.LZMAFile(self.file, mode="wb", preset=3)
+        elif compression == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                raise PysqlException(_("Compression zstd is not available "
+                                       "because zstandard module is not installed"))
+            return zstandard.ZstdCompressor().stream_writer(self.file, closefd=False)
+        else:
+            raise PysqlException(_("Unknown compression %s") % compression)
+
+    def __compress(self):
+        """Compression thread: compresses data pieces from queue until None is found"""
+        while True:
+            data = self.queue.get()
+            if data is None:
+                break
+            if self.error is None:
+                try:
+                    self.compressor.write(data)
+                except Exception as e:
+                    # Reported to writer thread. Queue is still read so that writer is never blocked
+                    self.error = e
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        """Compresses data, or gives it to compression thread
+        @return: number of bytes written"""
+        if self.error is not None:
+            raise PysqlException(_("Cannot compress file: %s") % self.error)
+        size = len(data)
+        self.rawSize += size
+        if self.queue is None:
+            self.compressor.write(data)
+        else:
+            # Buffer may be reused by caller once write returns
+            self.queue.put(bytes(data))
+        return size
+
+    def flush(self):
+        """Does nothing: flushing compressor would degrade compression. Data is flushed by close"""
+        pass
+
+    def close(self):
+        """Waits for compression thread then ends compressed stream"""
+        if self.closed:
+            return
+        try:
+            if self.queue is not None:
+                self.queue.put(None)
+                self.thread.join()
+            self.compressor.close()
+        finally:
+            self.file.close()
+            io.RawIOBase.close(self)
+        if self.error is not None:
+            raise PysqlException(_("Cannot compress file: %s") % self.error)
+
+
+def getCompression(fileName):
+    """@return: compression guessed from file name extension, or None"""
+    return COMPRESSIONS.get(os.path.splitext(fileName)[1].lower())
+
+
+def getFormat(fileName, default="csv"):
+    """@return: export format guessed from file name extension, or default.
+    Compression extension is ignored (emp.csv.gz is a csv file)"""
+    if getCompression(fileName):
+        fileName = os.path.splitext(fileName)[0]
+    return EXTENSIONS.get(os.path.splitext(fileName)[1].lower(), default)
+
+
+def newWriter(format, output, header=True):
+    """Creates a writer to an output already opened
+    @param format: writer format (see WRITERS)
+    @param output: file like object. Text or binary according to writer
+    @return: Writer instance"""
+    if format not in WRITERS:
+        raise PysqlException(_("Unknown format %s. Use one of: %s") % (format, ", ".join(sorted(WRITERS))))
+    return WRITERS[format](output, header)
+
+
+def openWriter(fileName, format=None, header=True, threaded=False):
+    """Opens a file and creates a writer to it. The file is closed with the writer.
+    File is compressed if its name ends with a compression extension (see COMPRESSIONS)
+    @param fileName: file path
+    @param format: writer format (see WRITERS). Default is guessed from file name
+    @param threaded: compresses in a separate thread
+    @return: Writer instance"""
+    if format is None:
+        format = getFormat(fileName)
+    if format not in WRITERS:
+        raise PysqlException(_("Unknown format %s. Use one of: %s") % (format, ", ".join(sorted(WRITERS))))
+    compression = getCompression(fileName)
+    try:
+        if compression:
+            output = CompressedOutput(fileName, compression, threaded)
+            if not WRITERS[format].binary:
+                output = io.TextIOWrapper(output, encoding="utf-8", newline="")
+        elif WRITERS[format].binary:
+            output = open(fileName, mode="wb")
+        else:
+            output = open(fileName, mode="w", encoding="utf-8", newline="")
+    except IOError as e:
+        raise PysqlException(_("Cannot write file %s: %s") % (fileName, e))
+    except PysqlException:
+        os.remove(fileName)
+        raise
+    try:
+        writer = WRITERS[format](output, header)
+    except PysqlException:
+        output.close()
+        os.remove(fileName)
+        raise
+    writer.file = output
+    writer.fileName = fileName
+    return writer
+
+
+def writeQuery(db, sql, writer, fetchSize=EXPORT_FETCH_SIZE):
+    """Executes a statement and writes its result, if any, as it is fetched.
+    Next rows are fetched while current ones are written (see PysqlDb.fetchBatches)
+    @param db: connection used to execute statement
+    @type db: PysqlDb
+    @param sql: statement
+    @param writer: Writer instance
+    @param fetchSize: number of rows fetched by round trip
+    @return: number of rows written or None if statement is not a query"""
+    db.execute(sql, cursorSize=fetchSize, stream=True)
+    if db.getCursor().description is None:
+        return None
+    writer.startQuery(db.getDescription(), db.getColumnTypes())
+    nbRows = 0
+    for rows in db.fetchBatches(fetchSize):
+        writer.writeRows(rows)
+        writer.flush()
+        nbRows += len(rows)
+    return nbRows
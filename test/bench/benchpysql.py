@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Pysql client side benchmarks.
+Benchmarks run against the in process fake cx_Oracle driver of the fakeoracle
+directory, so no database is needed and only client throughput is measured
+(plus simulated network latency if asked).
+
+Usage: python benchpysql.py [options] [benchmark ...]
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license:GNU GPL V3
+"""
+
+# Python imports
+import os
+import re
+import sys
+from os.path import abspath, dirname, join, pardir
+from optparse import OptionParser
+from tempfile import mkdtemp
+from shutil import rmtree
+from time import perf_counter
+
+# Fake driver must shadow any real cx_Oracle
+sys.path.insert(0, join(abspath(dirname(__file__)), "fakeoracle"))
+sys.path.insert(0, join(abspath(dirname(__file__)), pardir))
+import cx_Oracle
+
+# Common test pysql tools
+import testhelpers
+testhelpers.setup()
+
+# Pysql imports
+from pysql import pysqlshell, pysqlfunctions
+from pysql.pysqldb import PysqlDb
+from pysql.pysqlcomplete import CompleteGatheringWorker, completeColumns
+from pysql.pysqlqueries import guessInfoSql, tabularSql, tableSql, gatherCompleteSql
+
+CONNECT_STRING = "bench/bench@fake"
+TABLES = {}  # Columns of tables known by the fake dictionary. Key is table name
+
+
+def registerTable(name, nbColumns):
+    """Registers dictionary queries needed to describe a table"""
+    TABLES[name] = [("COL%d" % (i + 1), i == 0 and "NUMBER(22)" or "VARCHAR2(%d)" % cx_Oracle.settings["width"],
+                     "Y", "") for i in range(nbColumns)]
+
+    def byName(response):
+        """@return: handler that answers response(table columns) if query is about a registered table"""
+        def handler(sql, params):
+            for param in params or []:
+                if param in TABLES:
+                    return response(TABLES[param])
+            return []
+        return handler
+    cx_Oracle.register(guessInfoSql["typeFromNameAndOwner"], byName(lambda columns: [("TABLE",)]))
+    cx_Oracle.register(guessInfoSql["objectStatusFromName"], [("VALID",)])
+    cx_Oracle.register(tabularSql["columnsFromOwnerAndName"], byName(lambda columns: columns))
+    cx_Oracle.register(tabularSql["columnsFromDBAAndName"], byName(lambda columns: columns))
+    cx_Oracle.register(tabularSql["numberOfColumnsFromOwnerAndName"], byName(lambda columns: [(len(columns),)]))
+    cx_Oracle.register(tableSql["primaryKeyFromOwnerAndName"], [("COL1",)])
+    cx_Oracle.register(tableSql["indexedColFromOwnerAndName"], [("COL1", "PK_" + name, 1)])
+
+
+def newShell():
+    """@return: connected pysql shell without background completion nor animation"""
+    shell = pysqlshell.PysqlShell(silent=True)
+    shell.useCompletion = False
+    shell.allowAnimatedCursor = False
+    shell.tty = False
+    shell.do_connect(CONNECT_STRING)
+    shell.preloop()
+    return shell
+
+
+def exeCmd(shell, line):
+    """Execute precmd, onecmd then postcmd shell method"""
+    line = shell.precmd(line)
+    stop = shell.onecmd(line)
+    shell.postcmd(stop, line)
+
+
+# Benchmarks. Each one prepares its data and returns (function to time, number of rows processed)
+def benchDisplayTab(options, tmpDir):
+    shell = newShell()
+    rows = cx_Oracle.syntheticRows()
+    header = ["COL%d" % (i + 1) for i in range(cx_Oracle.settings["columns"])]
+    return (lambda: shell._PysqlShell__displayTab(rows, header), len(rows))
+
+
+def benchCsv(options, tmpDir):
+    shell = newShell()
+    fileName = join(tmpDir, "bench.csv")
+    return (lambda: exeCmd(shell, "csv %s select * from bench;" % fileName), cx_Oracle.settings["rows"])
+
+
+def benchCompareTableData(options, tmpDir):
+    registerTable("BENCH_A", cx_Oracle.settings["columns"])
+    registerTable("BENCH_B", cx_Oracle.settings["columns"])
+    rowsB = cx_Oracle.syntheticRows()
+    for i in range(0, len(rowsB), 100):
+        # One row over 100 differs
+        rowsB[i] = (rowsB[i][0],) + tuple(str(value).upper() for value in rowsB[i][1:])
+    cx_Oracle.register("select * from BENCH_B", rowsB, ["COL%d" % (i + 1) for i in range(len(rowsB[0]))])
+    dbList = {"A": PysqlDb(CONNECT_STRING), "B": PysqlDb(CONNECT_STRING)}
+    return (lambda: pysqlfunctions.compareTableData(CONNECT_STRING, CONNECT_STRING, "BENCH_A", "BENCH_B", dbList),
+            2 * len(rowsB))
+
+
+def benchDesc(options, tmpDir):
+    nbColumns = max(1, cx_Oracle.settings["rows"] // 10)  # Wide table
+    registerTable("BENCH", nbColumns)
+    shell = newShell()
+    return (lambda: exeCmd(shell, "desc BENCH"), nbColumns)
+
+
+def benchCompletion(options, tmpDir):
+    nbObjects = cx_Oracle.settings["rows"]
+    for objectType, query in gatherCompleteSql.items():
+        cx_Oracle.register(query, [("%s_%d" % (objectType.upper(), i),) for i in range(nbObjects)])
+    registerTable("TABLE_1", cx_Oracle.settings["columns"])
+    completeLists = {}
+    worker = CompleteGatheringWorker(CONNECT_STRING, "", completeLists)
+    worker.db = PysqlDb(CONNECT_STRING)
+
+    def complete():
+        worker.gatherSimpleObjects()
+        completeColumns(worker.db, "select  from TABLE_1 where ", "C", completeLists["table"])
+    return (complete, nbObjects * len(gatherCompleteSql))
+
+
+def benchScript(options, tmpDir, parallel=0):
+    shell = newShell()
+    fileName = join(tmpDir, "bench.sql")
+    nbStatements = max(1, cx_Oracle.settings["rows"] // 10)
+    script = open(fileName, "w")
+    for i in range(nbStatements):
+        script.write("insert into bench values (%d, 'row %d');\n" % (i, i))
+        if i % 10 == 0:
+            script.write("select * from bench where id=%d;\n" % i)
+    script.write("commit;\n")
+    script.close()
+    cx_Oracle.register("select * from bench where", lambda sql, params: cx_Oracle.syntheticRows(1))
+    if parallel:
+        return (lambda: exeCmd(shell, "script -p %d %s" % (parallel, fileName)), nbStatements)
+    else:
+        return (lambda: exeCmd(shell, "script %s" % fileName), nbStatements)
+
+
+def benchParallelScript(options, tmpDir):
+    return benchScript(options, tmpDir, parallel=4)
+
+
+BENCHMARKS = (("displaytab", benchDisplayTab),
+              ("csv", benchCsv),
+              ("comparedata", benchCompareTableData),
+              ("desc", benchDesc),
+              ("completion", benchCompletion),
+              ("script", benchScript),
+              ("parallelscript", benchParallelScript))
+
+
+def run(name, bench, options):
+    """Runs one benchmark
+    @return: list of elapsed time of each run, number of rows by run and roundtrips by run"""
+    cx_Oracle.reset()
+    TABLES.clear()
+    # Unregistered dictionary queries return no rows
+    cx_Oracle.register(re.compile(r"\b(all|dba|user)_\w+|v\$", re.I), [])
+    cx_Oracle.configure(rows=options.rows, columns=options.columns, width=options.width)
+    tmpDir = mkdtemp(prefix="pysqlbench")
+    devnull = open(os.devnull, "w")
+    stdout = sys.stdout
+    try:
+        sys.stdout = devnull
+        function, nbRows = bench(options, tmpDir)
+        cx_Oracle.configure(latency=options.latency / 1000.0)
+        cx_Oracle.resetCounters()
+        timings = []
+        for i in range(options.repeat):
+            start = perf_counter()
+            function()
+            timings.append(perf_counter() - start)
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+        rmtree(tmpDir)
+    return (timings, nbRows, cx_Oracle.counters["roundtrips"] // options.repeat)
+
+
+def main():
+    parser = OptionParser(usage="%prog [options] [benchmark ...]",
+                          description="Available benchmarks: " + ", ".join(i[0] for i in BENCHMARKS))
+    parser.add_option("-n", "--repeat", dest="repeat", type="int", default=5,
+                      help="number of runs of each benchmark (default 5)")
+    parser.add_option("-r", "--rows", dest="rows", type="int", default=10000,
+                      help="number of rows of synthetic result sets (default 10000)")
+    parser.add_option("-c", "--columns", dest="columns", type="int", default=8,
+                      help="number of columns of synthetic result sets (default 8)")
+    parser.add_option("-w", "--width", dest="width", type="int", default=20,
+                      help="width of string columns (default 20)")
+    parser.add_option("-l", "--latency", dest="latency", type="float", default=0.0,
+                      help="simulated latency of each roundtrip in milliseconds (default 0)")
+    (options, args) = parser.parse_args()
+    benchmarks = [b for b in BENCHMARKS if not args or b[0] in args]
+    if not benchmarks:
+        parser.error("unknown benchmark")
+
+    print("%-15s %10s %10s %12s %10s" % ("benchmark", "min (ms)", "median (ms)", "rows/s", "roundtrips"))
+    for name, bench in benchmarks:
+        timings, nbRows, roundtrips = run(name, bench, options)
+        timings.sort()
+        best = timings[0]
+        print("%-15s %10.1f %10.1f %12.0f %10d" % (name, 1000 * best, 1000 * timings[len(timings) // 2],
+                                                   nbRows / best if best else 0, roundtrips))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+
+"""In process stand-in for the cx_Oracle module used by pysql benchmarks.
+Cursors return synthetic result sets and each roundtrip to the "server"
+can be delayed to simulate network latency.
+
+Queries are answered by the first registered response whose pattern matches
+(see register()). Other select queries get a synthetic result set sized by
+configure() parameters, other statements just process one row.
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license: GNU GPL V3
+"""
+
+# Python imports:
+import re
+from math import ceil
+from time import sleep
+
+version = "fake-1.0"
+apilevel = "2.0"
+threadsafety = 2
+paramstyle = "named"
+
+# Connection modes
+SYSDBA = 2
+SYSOPER = 4
+PRELIM_AUTH = 8
+DBSHUTDOWN_ABORT = 4
+DBSHUTDOWN_FINAL = 5
+DBSHUTDOWN_IMMEDIATE = 3
+DBSHUTDOWN_TRANSACTIONAL = 1
+
+
+# Column types. pysql only uses their names
+class STRING: pass
+class FIXED_CHAR: pass
+class NUMBER: pass
+class DATETIME: pass
+class TIMESTAMP: pass
+class ROWID: pass
+class LOB: pass
+class CLOB(LOB): pass
+class NCLOB(LOB): pass
+class BLOB(LOB): pass
+class LONG_STRING: pass
+class LONG_BINARY: pass
+class BINARY: pass
+
+
+# Exceptions
+class Error(Exception): pass
+class Warning(Exception): pass
+class InterfaceError(Error): pass
+class DatabaseError(Error): pass
+class DataError(DatabaseError): pass
+class OperationalError(DatabaseError): pass
+class IntegrityError(DatabaseError): pass
+class InternalError(DatabaseError): pass
+class ProgrammingError(DatabaseError): pass
+class NotSupportedError(DatabaseError): pass
+
+
+# Synthetic data settings (see configure())
+settings = {"rows": 1000,  # Number of rows of synthetic result sets
+            "columns": 5,  # Number of columns (first one is a number, others are strings)
+            "width": 20,  # Width of string columns
+            "latency": 0.0}  # Delay in seconds of each roundtrip (execute, fetch, commit...)
+
+# Registered responses: list of (pattern, columns, rows)
+responses = []
+
+# Counters of client/server exchanges
+counters = {"connections": 0, "roundtrips": 0, "executes": 0, "fetches": 0, "rows": 0,
+            "commits": 0, "rollbacks": 0}
+
+
+def configure(**kwargs):
+    """Changes synthetic data settings
+    @param rows: number of rows of synthetic result sets
+    @param columns: number of columns of synthetic result sets
+    @param width: width of string columns
+    @param latency: delay in seconds of each roundtrip"""
+    for key, value in kwargs.items():
+        if key not in settings:
+            raise ValueError("Unknown setting: %s" % key)
+        settings[key] = value
+
+
+def register(pattern, rows, columns=None):
+    """Registers the response of queries matching a pattern.
+    Latest registration wins if multiple patterns match.
+    @param pattern: query prefix (str) or compiled regular expression
+    @param rows: list of rows or callable taking (sql, params) and returning list of rows
+    @param columns: list of column names or (name, type) tuples. Guessed from first row if None"""
+    responses.insert(0, (pattern, columns, rows))
+
+
+def reset():
+    """Forgets registered responses, restores default settings and resets counters"""
+    del responses[:]
+    settings.update({"rows": 1000, "columns": 5, "width": 20, "latency": 0.0})
+    resetCounters()
+
+
+def resetCounters():
+    for key in counters:
+        counters[key] = 0
+
+
+def syntheticRows(nbRows=None, nbColumns=None, width=None):
+    """@return: synthetic rows. First column is the row number, other are strings"""
+    nbRows = settings["rows"] if nbRows is None else nbRows
+    nbColumns = settings["columns"] if nbColumns is None else nbColumns
+    width = settings["width"] if width is None else width
+    bases = [(chr(ord("a") + i % 26) * width) for i in range(1, nbColumns)]
+    rows = []
+    for i in range(nbRows):
+        number = str(i)
+        rows.append(tuple([i] + [base[:max(0, width - len(number))] + number for base in bases]))
+    return rows
+
+
+def _roundtrip():
+    """Simulates a client/server exchange"""
+    counters["roundtrips"] += 1
+    if settings["latency"]:
+        sleep(settings["latency"])
+
+
+def _description(columns, rows):
+    """@return: cursor description from column names or first row"""
+    if columns is None:
+        if rows:
+            columns = ["COL%d" % (i + 1) for i in range(len(rows[0]))]
+        else:
+            columns = ["COL1"]
+    description = []
+    for index, column in enumerate(columns):
+        if isinstance(column, tuple):
+            name, columnType = column
+        else:
+            name = column
+            if rows and isinstance(rows[0][index], (int, float)):
+                columnType = NUMBER
+            else:
+                columnType = STRING
+        description.append((name, columnType, settings["width"], settings["width"], None, None, True))
+    return description
+
+
+def _match(sql):
+    """@return: (columns, rows) of first response matching sql or None"""
+    for pattern, columns, rows in responses:
+        if isinstance(pattern, str):
+            matched = sql.startswith(pattern)
+        else:
+            matched = pattern.search(sql) is not None
+        if matched:
+            return (columns, rows)
+    return None
+
+
+class Variable:
+    """Bind variable"""
+    def __init__(self, varType, value=None):
+        self.type = varType
+        self.value = value
+
+    def getvalue(self):
+        return self.value
+
+    def setvalue(self, position, value):
+        self.value = value
+
+
+class Cursor:
+    """Synthetic cursor"""
+    def __init__(self, connection):
+        self.connection = connection
+        self.arraysize = 100
+        self.description = None
+        self.rowcount = 0
+        self.statement = None
+        self.rows = []
+        self.position = 0
+
+    def prepare(self, sql):
+        self.statement = sql
+
+    def var(self, varType, size=None):
+        return Variable(varType)
+
+    def execute(self, sql, params=None, **kwargs):
+        if sql is None:
+            sql = self.statement
+        self.statement = sql
+        self.connection._check()
+        _roundtrip()
+        counters["executes"] += 1
+        self.position = 0
+        self.rowcount = 0
+        response = _match(sql)
+        if response is not None:
+            columns, rows = response
+            if callable(rows):
+                rows = rows(sql, params or kwargs)
+            self.rows = list(rows)
+            self.description = _description(columns, self.rows)
+        elif re.match(r"\s*(select|with)\b", sql, re.I):
+            self.rows = syntheticRows()
+            self.description = _description(None, self.rows)
+        else:
+            self.rows = []
+            self.description = None
+            self.rowcount = 1
+        return self
+
+    def executemany(self, sql, paramsList):
+        for params in paramsList:
+            self.execute(sql, params)
+
+    def callproc(self, name, params=()):
+        self.execute("begin %s; end;" % name, params)
+        return params
+
+    def fetchmany(self, nbLines=None):
+        if self.description is None:
+            raise InterfaceError("not a query")
+        nbLines = nbLines or self.arraysize
+        _roundtrip()
+        counters["fetches"] += 1
+        result = self.rows[self.position:self.position + nbLines]
+        self.position += len(result)
+        self.rowcount = self.position
+        counters["rows"] += len(result)
+        return result
+
+    def fetchall(self):
+        if self.description is None:
+            raise InterfaceError("not a query")
+        result = self.rows[self.position:]
+        # One roundtrip for each arraysize chunk, at least one to know there's no more rows
+        for i in range(max(1, int(ceil((len(result) + 1) / float(self.arraysize))))):
+            _roundtrip()
+            counters["fetches"] += 1
+        self.position = len(self.rows)
+        self.rowcount = self.position
+        counters["rows"] += len(result)
+        return result
+
+    def fetchone(self):
+        result = self.fetchmany(1)
+        return result[0] if result else None
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany(self.arraysize)
+            if not rows:
+                return
+            for row in rows:
+                yield row
+
+    def close(self):
+        self.rows = []
+
+
+class Connection:
+    """Synthetic connection"""
+    def __init__(self, dsn, mode=0):
+        match = re.match(r"(.*?)/(.*?)@(.*)", dsn)
+        if match:
+            self.username, self.password, self.dsn = match.groups()
+        else:
+            self.username, self.password, self.dsn = dsn, "", "fake"
+        self.mode = mode
+        self.version = "11.2.0.4.0"
+        self.outputtypehandler = None
+        self.closed = False
+        counters["connections"] += 1
+
+    def _check(self):
+        if self.closed:
+            raise InterfaceError("not connected")
+
+    def cursor(self):
+        self._check()
+        return Cursor(self)
+
+    def begin(self):
+        self._check()
+
+    def commit(self):
+        self._check()
+        _roundtrip()
+        counters["commits"] += 1
+
+    def rollback(self):
+        self._check()
+        _roundtrip()
+        counters["rollbacks"] += 1
+
+    def cancel(self):
+        pass
+
+    def ping(self):
+        _roundtrip()
+
+    def startup(self, *args, **kwargs):
+        pass
+
+    def shutdown(self, *args, **kwargs):
+        pass
+
+    def close(self):
+        self._check()
+        self.closed = True
+
+
+def connect(dsn="", mode=0, threaded=False, **kwargs):
+    """@return: a new synthetic connection"""
+    _roundtrip()
+    return Connection(dsn, mode)
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pysqlbatch module test suite
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license:GNU GPL V3
+"""
+
+# Python imports
+import unittest
+
+# Common test pysql tools
+import testhelpers
+testhelpers.setup()
+
+# Pysql imports
+from pysql import pysqlbatch
+
+class TestReadStatements(unittest.TestCase):
+    def test_read_statements(self):
+        statements = pysqlbatch.readStatements("select 1 from dual;\nbegin\nnull;\nend;\n/\ncommit")
+        self.assertEqual(statements, [("sql", "select 1 from dual"), ("plsql", "begin\nnull;\nend;"),
+                                      ("sql", "commit")])
+
+
+if __name__ == "__main__":
+    unittest.main()
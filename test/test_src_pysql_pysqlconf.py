@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pysqlconf module test suite
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license:GNU GPL V3
+"""
+
+# Python imports
+import unittest
+
+# Common test pysql tools
+import testhelpers
+testhelpers.setup()
+
+# Pysql imports
+from pysql.pysqlconf import PysqlConf
+from pysql.pysqlexception import PysqlException
+
+
+class Follower:
+    """Records configuration changes"""
+    def __init__(self):
+        self.changes = []
+
+    def changed(self, key, value):
+        self.changes.append((key, value))
+
+
+class TestPysqlConf(unittest.TestCase):
+    def setUp(self):
+        self.conf = PysqlConf.getConfig()
+        self.fetchSize = self.conf.get("fetchsize")
+        self.changed = self.conf.isChanged()
+
+    def tearDown(self):
+        self.conf.set("fetchsize", self.fetchSize)
+        self.conf.setChanged(self.changed)
+
+    def test_verify(self):
+        self.assertTrue(self.conf.verify("fetchsize", "50"))
+        self.assertFalse(self.conf.verify("fetchsize", "1"))
+        self.assertFalse(self.conf.verify("fetchsize", "many"))
+        self.assertTrue(self.conf.verify("termwidth", "auto"))
+        self.assertTrue(self.conf.verify("transpose", "yes"))
+        self.assertFalse(self.conf.verify("transpose", "maybe"))
+        self.assertTrue(self.conf.verify("lob_preview", "0"))
+
+    def test_typed_values(self):
+        self.conf.set("fetchsize", "50")
+        self.assertEqual(self.conf.get("fetchsize"), 50)
+        self.assertEqual(self.conf.get("fetchSize"), 50)
+        self.assertEqual(self.conf.get("graph_fontsize"), 10.0)
+        self.assertRaises(PysqlException, self.conf.set, "fetchsize", "0")
+        self.assertEqual(self.conf.get("fetchsize"), 50)
+
+    def test_listener(self):
+        follower = Follower()
+        self.conf.addListener(follower.changed)
+        self.conf.set("fetchsize", "40")
+        self.assertEqual(follower.changes, [("fetchsize", 40)])
+        # Listeners are not kept alive by configuration
+        nbListeners = len(self.conf.listeners)
+        del follower
+        self.conf.set("fetchsize", "45")
+        self.assertEqual(len(self.conf.listeners), nbListeners - 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pysqldb module test suite
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license:GNU GPL V3
+"""
+
+# Python imports
+import unittest
+
+# Common test pysql tools
+import testhelpers
+testhelpers.setup()
+
+try:
+    from pysql.pysqldb import Fetcher
+    HAVE_CX_ORACLE = True
+except ImportError:
+    HAVE_CX_ORACLE = False
+
+
+class FakeCursor:
+    """Cursor that returns nbRows integers"""
+    def __init__(self, nbRows):
+        self.rows = list(range(nbRows))
+        self.nbFetches = 0
+
+    def fetchmany(self, nbRows):
+        self.nbFetches += 1
+        (result, self.rows) = (self.rows[:nbRows], self.rows[nbRows:])
+        return result
+
+
+@unittest.skipUnless(HAVE_CX_ORACLE, "cx_Oracle is needed")
+class TestFetcher(unittest.TestCase):
+    def fetchAll(self, cursor, batchSize):
+        """@return: batches fetched by a fetcher thread"""
+        fetcher = Fetcher(cursor, batchSize, 2)
+        fetcher.start()
+        batches = []
+        while True:
+            rows = fetcher.queue.get()
+            if rows is None:
+                break
+            batches.append(rows)
+        fetcher.join()
+        return batches
+
+    def test_batches(self):
+        cursor = FakeCursor(25)
+        batches = self.fetchAll(cursor, 10)
+        self.assertEqual([len(rows) for rows in batches], [10, 10, 5])
+        self.assertEqual(sum(batches, []), list(range(25)))
+        # Last short batch ends fetching without an extra round trip
+        self.assertEqual(cursor.nbFetches, 3)
+
+    def test_empty_result(self):
+        self.assertEqual(self.fetchAll(FakeCursor(0), 10), [])
+
+    def test_stop(self):
+        cursor = FakeCursor(1000)
+        fetcher = Fetcher(cursor, 10, 2)
+        fetcher.start()
+        self.assertEqual(len(fetcher.queue.get()), 10)
+        fetcher.stop()
+        self.assertFalse(fetcher.is_alive())
+        self.assertTrue(cursor.nbFetches < 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pysqlfunctions module test suite. Runs against the fake cx_Oracle driver
+of benchmarks when no Oracle client is installed
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license:GNU GPL V3
+"""
+
+# Python imports
+import os
+import unittest
+from shutil import rmtree
+from tempfile import mkdtemp, mkstemp
+
+# Common test pysql tools
+import testhelpers
+testhelpers.setup()
+FAKE_ORACLE = testhelpers.setupFakeOracle()
+
+# Pysql imports
+import cx_Oracle
+from pysql import pysqlfunctions, pysqlshell
+from pysql.pysqldb import PysqlDbPool
+from pysql.pysqlexception import PysqlException
+from pysql.pysqlqueries import flashbackSql
+
+CONNECT_STRING = "test/test@fake"
+
+
+def tableNotFound(sql, params):
+    """Fake driver response of a statement on a missing table"""
+    raise cx_Oracle.DatabaseError("ORA-00942: table or view does not exist")
+
+
+@unittest.skipUnless(FAKE_ORACLE, "fake cx_Oracle driver is needed")
+class TestExecuteParallel(unittest.TestCase):
+    def setUp(self):
+        cx_Oracle.reset()
+        cx_Oracle.register("insert into missing", tableNotFound)
+        cx_Oracle.register("select * from emp", [(1, "SCOTT"), (2, "KING")])
+        self.pool = PysqlDbPool(CONNECT_STRING, 3)
+
+    def tearDown(self):
+        self.pool.close()
+        cx_Oracle.reset()
+
+    def test_results(self):
+        statements = [(1, "insert into emp values (1)"), (2, "insert into missing values (1)"),
+                      (3, "select * from emp"), (4, "delete from emp")]
+        results = pysqlfunctions.executeParallel(self.pool, statements)
+        self.assertEqual([(i[0], i[1]) for i in results], statements)
+        self.assertEqual([i[3] for i in results], [1, 0, 2, 1])
+        self.assertEqual([i[4] is None for i in results], [True, False, True, True])
+        self.assertTrue(isinstance(results[1][4], PysqlException))
+        self.assertEqual(results[1][4].oraCode, "ORA-00942")
+
+    def test_sessions_are_released(self):
+        statements = [(i, "insert into emp values (%d)" % i) for i in range(20)]
+        self.assertEqual(len(pysqlfunctions.executeParallel(self.pool, statements)), 20)
+        # All sessions are back in pool
+        self.assertEqual(len(pysqlfunctions.executeParallel(self.pool, statements)), 20)
+        self.assertEqual(cx_Oracle.counters["connections"], 3)
+
+    def test_pool_transactions(self):
+        self.pool.commit()
+        self.assertEqual(cx_Oracle.counters["commits"], 3)
+        self.pool.rollback()
+        self.assertEqual(cx_Oracle.counters["rollbacks"], 3)
+
+
+@unittest.skipUnless(FAKE_ORACLE, "fake cx_Oracle driver is needed")
+class TestExportLobsParallel(unittest.TestCase):
+    def setUp(self):
+        cx_Oracle.reset()
+        cx_Oracle.register(flashbackSql["currentScn"], [(1234,)])
+        # Flashback calls are recorded with their parameters
+        self.flashback = []
+        cx_Oracle.register("begin dbms_flashback", lambda sql, params: self.flashback.append(params) or [])
+        cx_Oracle.register("select name, doc from docs", [("doc%d" % i, "content %d" % i) for i in range(20)])
+        cx_Oracle.register("select doc from docs", [("content %d" % i,) for i in range(20)])
+        cx_Oracle.register("select 'same', doc from docs", [("same", "content %d" % i) for i in range(20)])
+        self.pool = PysqlDbPool(CONNECT_STRING, 3)
+        self.directory = mkdtemp(prefix="pysqltest")
+
+    def tearDown(self):
+        self.pool.close()
+        rmtree(self.directory)
+        cx_Oracle.reset()
+
+    def test_export(self):
+        result = pysqlfunctions.exportLobsParallel(self.pool, "select name, doc from docs", self.directory)
+        self.assertEqual(result[0], 20)
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(["doc%d" % i for i in range(20)]))
+        # Each session enables then disables flashback at the same SCN
+        self.assertEqual(self.flashback, [[1234], {}] * 3)
+
+    def test_rows_without_name(self):
+        self.assertRaises(PysqlException, pysqlfunctions.exportLobsParallel,
+                          self.pool, "select doc from docs", self.directory)
+
+    def test_duplicate_names(self):
+        self.assertRaises(PysqlException, pysqlfunctions.exportLobsParallel,
+                          self.pool, "select 'same', doc from docs", self.directory)
+        self.assertEqual(os.listdir(self.directory), ["same"])
+
+
+@unittest.skipUnless(FAKE_ORACLE, "fake cx_Oracle driver is needed")
+class TestParallelScript(unittest.TestCase):
+    """Parallel mode of the script shell command, which runs on executeParallel"""
+    def setUp(self):
+        cx_Oracle.reset()
+        cx_Oracle.register("insert into missing", tableNotFound)
+        # Updates record the number of commits done when they run
+        self.updates = []
+        cx_Oracle.register("update emp", lambda sql, params: self.updates.append(cx_Oracle.counters["commits"]) or [])
+        self.capturedStdout = testhelpers.CapturedStdout()
+        self.shell = pysqlshell.PysqlShell(silent=True)
+        self.shell.allowAnimatedCursor = False
+        self.shell.tty = False
+        self.shell.do_connect(CONNECT_STRING)
+        self.shell.preloop()
+        (fd, self.fileName) = mkstemp(suffix=".sql")
+        os.close(fd)
+
+    def tearDown(self):
+        self.capturedStdout.restoreStdout()
+        os.remove(self.fileName)
+        self.shell.db.close()
+        cx_Oracle.reset()
+
+    def runScript(self, lines, parallel=2):
+        """Runs a script in parallel mode
+        @return: (statements, errors, groups) of report and True if uncommitted work warning was displayed"""
+        script = open(self.fileName, mode="w")
+        script.write("\n".join(lines) + "\n")
+        script.close()
+        self.capturedStdout.reset()
+        cx_Oracle.resetCounters()
+        line = self.shell.precmd("script -p %d %s" % (parallel, self.fileName))
+        self.shell.postcmd(self.shell.onecmd(line), line)
+        output = self.capturedStdout.readlines()
+        report = output[output.index("***** Parallel script report *****") + 3].split()
+        warning = "Warning: work not committed by the script has been rolled back" in output
+        return ([int(i) for i in report[:3]], warning)
+
+    def test_commit(self):
+        report, warning = self.runScript(["insert into emp values (1);", "insert into emp values (2);", "commit;"])
+        self.assertEqual(report, [3, 0, 1])
+        self.assertFalse(warning)
+        self.assertEqual(cx_Oracle.counters["commits"], 2)  # One by session
+
+    def test_rollback(self):
+        report, warning = self.runScript(["insert into emp values (1);", "rollback;"])
+        self.assertFalse(warning)
+        self.assertEqual(cx_Oracle.counters["rollbacks"], 2)
+        self.assertEqual(cx_Oracle.counters["commits"], 0)
+
+    def test_uncommitted_work(self):
+        report, warning = self.runScript(["insert into emp values (1);", "insert into emp values (2);"])
+        self.assertEqual(report, [2, 0, 1])
+        self.assertTrue(warning)
+
+    def test_errors(self):
+        report, warning = self.runScript(["insert into missing values (1);", "insert into emp values (1);",
+                                          "insert into missing values (2);", "commit;"])
+        self.assertEqual(report, [4, 2, 1])
+        self.assertEqual([e.oraCode for e in self.shell.exceptions], ["ORA-00942", "ORA-00942"])
+
+    def test_groups(self):
+        report, warning = self.runScript(["insert into emp values (1);", "insert into emp values (2);",
+                                          "-- pysql:barrier",
+                                          "insert into emp values (3);", "commit;",
+                                          "insert into emp values (4);", "commit;"])
+        self.assertEqual(report, [6, 0, 3])
+
+    def test_barrier_commits(self):
+        # Rows locked before barrier must be released for statements after it
+        report, warning = self.runScript(["update emp set sal=1 where id=5;", "-- pysql:barrier",
+                                          "update emp set sal=2 where id=5;"])
+        self.assertEqual(self.updates, [0, 2])
+        self.assertTrue(warning)
+
+    def test_ddl_commits(self):
+        report, warning = self.runScript(["insert into emp values (1);", "create table foo (id number);"])
+        self.assertEqual(report, [2, 0, 1])
+        self.assertEqual(cx_Oracle.counters["commits"], 2)
+        self.assertFalse(warning)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -49,7 +49,21 @@ class TestGetProg(unittest.TestCase):
 
 class TestItemLength(unittest.TestCase):
     def test_item_length(self):
-        pass
+        self.assertEqual(pysqlhelpers.itemLength(None), 0)
+        self.assertEqual(pysqlhelpers.itemLength(1234), 4)
+        self.assertEqual(pysqlhelpers.itemLength("abc"), 3)
+        self.assertEqual(pysqlhelpers.itemLength(b"ab"), 2)
+
+class TestLobPreview(unittest.TestCase):
+    def test_clob(self):
+        self.assertEqual(pysqlhelpers.lobPreview("a" * 20, 10), "a" * 10 + "...")
+        self.assertEqual(pysqlhelpers.lobPreview("short", 10), "short")
+        self.assertEqual(pysqlhelpers.lobPreview("a" * 20, 0), "a" * 20)
+        self.assertEqual(pysqlhelpers.lobPreview(None, 10), None)
+
+    def test_blob(self):
+        self.assertEqual(pysqlhelpers.lobPreview(b"\x01\xff", 10), "01ff")
+        self.assertEqual(pysqlhelpers.lobPreview(b"\x00" * 100, 4), "0000...")
 
 class TestGenerateWhere(unittest.TestCase):
     def test_result(self):
@@ -176,5 +190,28 @@ class TestGetKnownTablesViews(unittest.TestCase):
             result.sort()
             self.assertEqual(tables, result)
 
+class TestSplitScript(unittest.TestCase):
+    def test_sql_statements(self):
+        lines = ["select * from dual;", "update emp", "  set sal=sal*2 -- raise", "  where id=1;", "", "/"]
+        self.assertEqual(pysqlhelpers.splitScript(lines),
+                         [("sql", "select * from dual"), ("sql", "update emp set sal=sal*2 where id=1")])
+
+    def test_plsql_bloc(self):
+        lines = ["begin", "  foo;", "  bar;", "end;", "/", "delete from emp;"]
+        self.assertEqual(pysqlhelpers.splitScript(lines),
+                         [("plsql", "begin\nfoo;\nbar;\nend;"), ("sql", "delete from emp")])
+        lines = ["create or replace procedure foo is", "begin", "null;", "end;", "/"]
+        self.assertEqual(pysqlhelpers.splitScript(lines)[0][0], "plsql")
+
+    def test_commands_and_barriers(self):
+        lines = ["insert into emp values (1);", "-- pysql:barrier", "commit;", "@other.sql", "desc emp"]
+        self.assertEqual(pysqlhelpers.splitScript(lines, commands=("commit", "desc")),
+                         [("sql", "insert into emp values (1)"), ("barrier", ""), ("command", "commit"),
+                          ("command", "@other.sql"), ("command", "desc emp")])
+
+    def test_unterminated_statement(self):
+        self.assertEqual(pysqlhelpers.splitScript(["select 1", "from dual"]), [("sql", "select 1 from dual")])
+
+
 if __name__ == '__main__':
     unittest.main()
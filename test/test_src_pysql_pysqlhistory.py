@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pysqlhistory module test suite
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license:GNU GPL V3
+"""
+
+# Python imports
+import os
+import tempfile
+import unittest
+
+# Common test pysql tools
+import testhelpers
+testhelpers.setup()
+
+# Pysql imports
+from pysql.pysqlhistory import PysqlHistory
+
+STATEMENTS = ["select * from employees", "select count(*) from departments",
+              "update employees set salary=salary*2", "desc emp_100%"]
+
+
+class TestPysqlHistory(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.history = self.newHistory()
+
+    def tearDown(self):
+        self.history.close()
+        for fileName in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, fileName))
+        os.rmdir(self.directory)
+
+    def newHistory(self, fullText=True):
+        """@return: history filled with STATEMENTS"""
+        history = PysqlHistory(os.path.join(self.directory, "history%s.db" % fullText), fullText)
+        for statement in STATEMENTS:
+            history.add(statement, "base", "scott", 0.5, 10)
+        return history
+
+    def test_last(self):
+        entries = self.history.getLast(2)
+        self.assertEqual([entry[4] for entry in entries], STATEMENTS[2:])
+        self.assertEqual(entries[0][2:4], ("base", "scott"))
+        self.assertEqual(self.history.get(entries[0][0]), STATEMENTS[2])
+        self.assertEqual(self.history.get(1000), None)
+
+    def test_search(self):
+        for history in (self.history, self.newHistory(fullText=False)):
+            self.assertEqual([entry[4] for entry in history.search(["employees"], 10)],
+                             [STATEMENTS[0], STATEMENTS[2]])
+            self.assertEqual([entry[4] for entry in history.search(["select", "employees"], 10)],
+                             [STATEMENTS[0]])
+            self.assertEqual(len(history.search(["employees"], 1)), 1)
+            self.assertEqual(history.search(["nothing"], 10), [])
+        # Prefix search with full text index, substring search without
+        self.assertEqual(len(self.history.search(["depart"], 10)), 1)
+        self.assertEqual(len(history.search(["100%"], 10)), 1)
+        history.close()
+
+    def test_search_syntax(self):
+        # Words are never interpreted as search syntax
+        self.assertEqual(self.history.search(['"count', "NOT", "*"], 10), [])
+
+    def test_import_file(self):
+        history = PysqlHistory(os.path.join(self.directory, "imported.db"))
+        self.assertTrue(history.isEmpty())
+        fileName = os.path.join(self.directory, "pysqlhistory")
+        historyFile = open(fileName, mode="w")
+        historyFile.write("_HiStOrY_V2_\nselect 1 from dual\n\nlib\n")
+        historyFile.close()
+        self.assertEqual(history.importFile(fileName), 2)
+        self.assertEqual([entry[4] for entry in history.getLast(10)], ["select 1 from dual", "lib"])
+        history.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pysqllibrary module test suite
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license:GNU GPL V3
+"""
+
+# Python imports
+import os
+import tempfile
+import unittest
+
+# Common test pysql tools
+import testhelpers
+testhelpers.setup()
+
+# Pysql imports
+from pysql.pysqllibrary import PysqlLibrary
+
+
+class TestPysqlLibrary(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "library.db")
+        self.library = PysqlLibrary(self.path)
+        self.library.set("empCount", "select count(*) from emp", ["hr"])
+        self.library.set("empList", "select * from emp", ["hr", "report"])
+        self.library.set("locks", "select * from v$lock")
+
+    def tearDown(self):
+        self.library.close()
+        for fileName in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, fileName))
+        os.rmdir(self.directory)
+
+    def test_get_set(self):
+        self.assertEqual(self.library.get("locks"), "select * from v$lock")
+        self.assertEqual(self.library.get("nothing"), None)
+        # Replacing a request keeps its tags
+        self.library.set("empList", "select ename from emp")
+        self.assertEqual(self.library.getAll("empList"), [("empList", "hr,report", "select ename from emp")])
+
+    def test_prefix(self):
+        self.assertEqual(self.library.getNames("emp"), ["empCount", "empList"])
+        self.assertEqual(self.library.getNames(), ["empCount", "empList", "locks"])
+        self.assertEqual(self.library.getNames("x"), [])
+
+    def test_tags(self):
+        self.assertEqual([row[0] for row in self.library.getAll(tag="hr")], ["empCount", "empList"])
+        self.assertEqual(self.library.getAll(tag="report"), [("empList", "hr,report", "select * from emp")])
+        self.assertTrue(self.library.setTags("locks", ["dba"]))
+        self.assertFalse(self.library.setTags("nothing", ["dba"]))
+        self.assertEqual([row[0] for row in self.library.getAll(tag="dba")], ["locks"])
+
+    def test_remove(self):
+        self.assertTrue(self.library.remove("empList"))
+        self.assertFalse(self.library.remove("empList"))
+        self.assertEqual([row[0] for row in self.library.getAll(tag="hr")], ["empCount"])
+
+    def test_changes_are_saved_at_once(self):
+        # Another session sees changes without any explicit write
+        other = PysqlLibrary(self.path)
+        self.assertEqual(other.getNames(), ["empCount", "empList", "locks"])
+        other.close()
+
+    def test_import(self):
+        library = PysqlLibrary(os.path.join(self.directory, "imported.db"))
+        self.assertTrue(library.isEmpty())
+        self.assertEqual(library.importDict({"a": "select 1 from dual", "b": "select 2 from dual"}), 2)
+        self.assertEqual(library.get("b"), "select 2 from dual")
+        library.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
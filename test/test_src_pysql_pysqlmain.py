@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pysql startup test suite: checks that starting pysql stays cheap
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license:GNU GPL V3
+"""
+
+# Python imports
+import os
+import subprocess
+import sys
+import unittest
+from os.path import abspath, dirname, join, pardir
+
+# Common test pysql tools
+import testhelpers
+testhelpers.setup()
+
+try:
+    import cx_Oracle
+    HAVE_CX_ORACLE = True
+except ImportError:
+    HAVE_CX_ORACLE = False
+
+SRC_PATH = abspath(join(dirname(__file__), pardir, "src"))
+
+# Maximum import time of pysql modules, in microseconds (python -X importtime)
+IMPORT_BUDGET = 200000
+
+# Modules that must only be imported by the commands that need them
+LAZY_MODULES = ("pysql.pysqlgraphics", "pysql.pysqlaudit", "pysql.pysqlwatch",
+                "pysql.pysqlhistory", "pysql.pysqllibrary", "csv", "cProfile", "pstats", "difflib", "pickle", "sqlite3")
+
+
+def importModule(module, *options):
+    """Imports module in a new python interpreter
+    @return: (loaded modules, stderr output)"""
+    code = "import gettext, sys; gettext.install('pysql'); import %s; print(' '.join(sys.modules))" % module
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([SRC_PATH] + sys.path)
+    process = subprocess.run([sys.executable] + list(options) + ["-c", code], env=env,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    return (process.stdout.split(), process.stderr)
+
+
+def importTime(module):
+    """@return: cumulative import time of module in microseconds"""
+    modules, output = importModule(module, "-X", "importtime")
+    for line in output.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1])
+    raise AssertionError("No import time for %s" % module)
+
+
+class TestStartup(unittest.TestCase):
+    def test_main_is_light(self):
+        modules = importModule("pysql.pysqlmain")[0]
+        for module in LAZY_MODULES + ("pysql.pysqlshell", "pysql.pysqlconf"):
+            self.assertFalse(module in modules, module)
+        self.assertTrue(importTime("pysql.pysqlmain") < IMPORT_BUDGET)
+
+    @unittest.skipUnless(HAVE_CX_ORACLE, "cx_Oracle is needed to import the shell")
+    def test_shell_is_light(self):
+        modules = importModule("pysql.pysqlshell")[0]
+        for module in LAZY_MODULES:
+            self.assertFalse(module in modules, module)
+        self.assertTrue(importTime("pysql.pysqlshell") < IMPORT_BUDGET)
+
+
+if __name__ == "__main__":
+    unittest.main()
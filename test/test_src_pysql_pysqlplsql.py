@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pysqlplsql module test suite
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license:GNU GPL V3
+"""
+
+# Python imports
+import unittest
+from time import perf_counter
+
+# Common test pysql tools
+import testhelpers
+testhelpers.setup()
+
+# Pysql imports
+from pysql import pysqlplsql
+
+PACKAGE = """PACKAGE BODY pkg IS
+  g_count NUMBER := 0;
+
+  FUNCTION helper(p IN NUMBER) RETURN NUMBER;  -- forward declaration, helper(1)
+
+  PROCEDURE log(msg VARCHAR2) IS
+  BEGIN
+    dbms_output.put_line('call helper(1) in a string');
+  END log;
+
+  PROCEDURE log(msg VARCHAR2, lvl NUMBER) IS
+  BEGIN
+    log(msg); pkg.log(msg);
+  END;
+
+  FUNCTION helper(p IN NUMBER) RETURN NUMBER IS
+    v NUMBER := CASE WHEN p > 0 THEN 1 ELSE 0 END;
+    FUNCTION inner(x NUMBER) RETURN NUMBER IS
+    BEGIN
+      IF x > 0 THEN RETURN inner(x - 1); END IF;
+      RETURN x;
+    END inner;
+  BEGIN
+    /* log('commented call') */
+    FOR i IN 1..p LOOP
+      log(msg => 'loop');
+    END LOOP;
+    RETURN inner(p) + other_pkg.helper(p);
+  END helper;
+
+  PROCEDURE main IS
+  BEGIN
+    CASE g_count WHEN 0 THEN log('zero'); ELSE NULL; END CASE;
+    log('a'); g_count := helper(1) + helper(2);
+  END main;
+BEGIN
+  main;
+END pkg;
+"""
+
+
+class TestTokenize(unittest.TestCase):
+    def test_tokens(self):
+        tokens = list(pysqlplsql.tokenize("select q'[it's]', \"Mixed\" -- comment\n from /* a\n b */ dual"))
+        self.assertEqual([(kind, value) for kind, value, line in tokens],
+                         [("name", "SELECT"), ("string", "q'[it's]'"), ("symbol", ","),
+                          ("name", "Mixed"), ("name", "FROM"), ("name", "DUAL")])
+        self.assertEqual([line for kind, value, line in tokens], [1, 1, 1, 1, 2, 3])
+
+    def test_escaped_quote(self):
+        tokens = list(pysqlplsql.tokenize("x := 'it''s'; y"))
+        self.assertEqual(tokens[2], ("string", "'it''s'", 1))
+        self.assertEqual(tokens[-1], ("name", "Y", 1))
+
+
+class TestExtractCalls(unittest.TestCase):
+    def test_subprograms(self):
+        subprograms, calls = pysqlplsql.extractCalls(PACKAGE, "pkg")
+        self.assertEqual(sorted(subprograms), ["HELPER", "HELPER.INNER", "LOG", "MAIN"])
+        self.assertEqual(len(subprograms["LOG"]), 2)  # Overloaded
+        self.assertEqual(subprograms["MAIN"], [31])
+
+    def test_calls(self):
+        subprograms, calls = pysqlplsql.extractCalls(PACKAGE.splitlines(True), "pkg")
+        self.assertEqual(sorted(calls), [("HELPER", "HELPER.INNER"),
+                                         ("HELPER", "LOG"),
+                                         ("HELPER.INNER", "HELPER.INNER"),
+                                         ("LOG", "LOG"),
+                                         ("MAIN", "HELPER"),
+                                         ("MAIN", "LOG")])
+
+    def test_large_package(self):
+        source = ["PACKAGE BODY big IS\n"]
+        for i in range(2000):
+            source.append("PROCEDURE p%d(a NUMBER) IS\n" % i)
+            source.append("  v VARCHAR2(30) := 'p%d';\n" % (i + 1))
+            source.append("BEGIN\n")
+            for j in range(20):
+                source.append("  IF a > %d THEN p%d(a); p%d(a); END IF;\n" % (j, (i + j) % 2000, i))
+            source.append("END p%d;\n" % i)
+        source.append("END big;\n")
+        start = perf_counter()
+        subprograms, calls = pysqlplsql.extractCalls(source)
+        self.assertTrue(perf_counter() - start < 10)
+        self.assertEqual(len(subprograms), 2000)
+        self.assertEqual(len(calls), 2000 * 20)
+
+
+class TestCallGraph(unittest.TestCase):
+    def setUp(self):
+        self.graph = pysqlplsql.CallGraph()
+        self.graph.addSource("PKG", PACKAGE)
+        self.graph.addSource("AUDIT", "PROCEDURE audit IS BEGIN pkg.main; END;")
+        self.graph.addSource("TRG", "TRIGGER trg BEFORE INSERT ON t BEGIN audit; END;")
+        self.graph.addCall("PKG.MAIN", "OTHER.PROC")
+        self.graph.resolve()
+
+    def test_nodes(self):
+        self.assertEqual(self.graph.find("pkg"), ["PKG", "PKG.HELPER", "PKG.HELPER.INNER", "PKG.LOG", "PKG.MAIN"])
+        self.assertEqual(self.graph.find("audit"), ["AUDIT"])
+        self.assertRaises(pysqlplsql.PysqlException, self.graph.find, "unknown")
+
+    def test_who_calls(self):
+        self.assertEqual(self.graph.whoCalls("PKG.HELPER"),
+                         [(1, "PKG.MAIN", "PKG.HELPER"), (2, "AUDIT", "PKG.MAIN"),
+                          (2, "PKG", "PKG.MAIN"),  # Package initialization
+                          (3, "TRG", "AUDIT")])
+        self.assertEqual(self.graph.whoCalls("PKG.HELPER", maxDepth=1), [(1, "PKG.MAIN", "PKG.HELPER")])
+
+    def test_reach(self):
+        self.assertEqual([node for depth, node, caller in self.graph.reach("TRG")],
+                         ["AUDIT", "PKG.MAIN", "OTHER.PROC", "PKG.HELPER", "PKG.LOG", "PKG.HELPER.INNER"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pysqlsession module test suite
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license:GNU GPL V3
+"""
+
+# Python imports
+import unittest
+
+# Common test pysql tools
+import testhelpers
+testhelpers.setup()
+
+# Pysql imports
+from pysql import pysqlsession
+from pysql.pysqlexception import PysqlException
+
+
+def sampleRow(sid, cpu, reads, status="ACTIVE"):
+    """@return: sample query row of session sid"""
+    return (sid, 1, cpu, reads, reads // 10, cpu // 2, "SCOTT", "sqlplus", status, "ON CPU", "abc")
+
+
+class TestRingBuffer(unittest.TestCase):
+    def test_oldest_items_are_dropped(self):
+        ring = pysqlsession.RingBuffer(3)
+        for i in range(5):
+            ring.append(i)
+        self.assertEqual(ring.getItems(), [2, 3, 4])
+        self.assertEqual(len(ring), 3)
+
+    def test_capacity(self):
+        self.assertRaises(PysqlException, pysqlsession.RingBuffer, 0)
+
+
+class TestSessionSampler(unittest.TestCase):
+    def setUp(self):
+        self.sampler = pysqlsession.SessionSampler("", 5, 10)
+        self.sampler.buffer.append(pysqlsession.SessionSample(100, [sampleRow(1, 100, 1000), sampleRow(2, 50, 10)]))
+        self.sampler.buffer.append(pysqlsession.SessionSample(105, [sampleRow(1, 110, 5000, "INACTIVE"),
+                                                                  sampleRow(2, 150, 20), sampleRow(3, 5, 0)]))
+
+    def test_sample(self):
+        sample = self.sampler.buffer.getItems()[0]
+        self.assertEqual(len(sample), 2)
+        self.assertEqual(sample.getKeys(), [(1, 1), (2, 1)])
+        self.assertEqual(sample.columns["cpu"].typecode, "q")
+
+    def test_top_by_cpu(self):
+        header, result, elapsed, nbSamples = self.sampler.top("cpu", 2)
+        self.assertEqual(elapsed, 5)
+        self.assertEqual(nbSamples, 2)
+        self.assertEqual([(row[0], row[4]) for row in result], [(2, 1000), (1, 100)])
+        self.assertEqual(len(result[0]), len(header))
+
+    def test_top_by_reads_and_activity(self):
+        result = self.sampler.top("reads")[1]
+        self.assertEqual([row[0] for row in result], [1, 2, 3])
+        result = self.sampler.top("activity")[1]
+        self.assertEqual([(row[0], row[8]) for row in result], [(2, 100), (3, 100), (1, 0)])
+
+    def test_not_enough_samples(self):
+        self.assertRaises(PysqlException, self.sampler.top, "cpu", 10, 1)
+        self.assertRaises(PysqlException, self.sampler.top, "unknown")
+
+
+class TestSessionTrace(unittest.TestCase):
+    def setUp(self):
+        self.trace = pysqlsession.SessionTrace(["12", "3", "12"])
+        self.trace.addSnapshot(pysqlsession.SessionSnapshot(10, [
+            (3, "statistic", "session logical reads", 100), (3, "statistic", "user calls", 5),
+            (12, "wait (ms)", "db file sequential read", 40)]))
+        self.trace.addSnapshot(pysqlsession.SessionSnapshot(12, [
+            (3, "statistic", "session logical reads", 300), (3, "statistic", "user calls", 5),
+            (3, "statistic", "redo size", 50), (12, "wait (ms)", "db file sequential read", 60)]))
+
+    def test_name(self):
+        self.assertEqual(self.trace.getName(), "3,12")
+        self.assertRaises(PysqlException, pysqlsession.SessionTrace, ["abc"])
+
+    def test_deltas(self):
+        header, result, elapsed = self.trace.deltas()
+        self.assertEqual(elapsed, 2)
+        self.assertEqual(result, [[3, "statistic", "session logical reads", 200, 100.0],
+                                  [3, "statistic", "redo size", 50, 25.0],
+                                  [12, "wait (ms)", "db file sequential read", 20, 10.0]])
+        self.assertEqual(len(self.trace.deltas(nbLines=1)[1]), 2)
+
+    def test_last_deltas(self):
+        for timestamp in range(13, 100):
+            self.trace.addSnapshot(pysqlsession.SessionSnapshot(timestamp, [
+                (3, "statistic", "session logical reads", 300 + timestamp)]))
+        self.assertEqual(self.trace.getNbSnapshots(), 89)
+        self.assertEqual(len(self.trace.lastSnapshots), 2)
+        self.assertEqual(self.trace.deltas(sinceStart=False)[1:],
+                         ([[3, "statistic", "session logical reads", 1, 1.0]], 1))
+        header, result, elapsed = self.trace.deltas()
+        self.assertEqual(elapsed, 89)
+        self.assertEqual(result[0], [3, "statistic", "session logical reads", 299, 3.4])
+
+    def test_not_enough_snapshots(self):
+        trace = pysqlsession.SessionTrace(["3"])
+        self.assertRaises(PysqlException, trace.deltas)
+        trace.addSnapshot(pysqlsession.SessionSnapshot(10, [(3, "statistic", "user calls", 5)]))
+        self.assertRaises(PysqlException, trace.deltas)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -17,6 +17,7 @@ testhelpers.setup()
 # Pysql imports
 from pysql import pysqlshell
 from pysql.pysqlexception import PysqlException
+from pysql.pysqlhistory import PysqlHistory
 
 CONNECT_STRING = ""
 
@@ -192,19 +193,16 @@ class TestNotConnectedShellCommands(TestShellCommands):
         self.assertFalse(self.capturedStdout.gotPsyqlException())
 
     def test_do_history(self):
-        self.exeCmd("history")
-        self.assertFalse(self.capturedStdout.gotPsyqlException())
-
-        if READLINE:
-            # This will match the "help" command position
-            position = int(readline.get_current_history_length())
-            readline.replace_history_item(position - 1, "help")
-            self.exeCmd("history")
+        # Tests are not interactive: history must be given to shell
+        self.shell.history = PysqlHistory(":memory:")
+        for cmd in ("help", "history", "history -n 5", "history -s hel", "history 1"):
+            self.exeCmd(cmd)
             self.assertFalse(self.capturedStdout.gotPsyqlException())
 
-        for cmd in ("history a", "history -1", "history 10.5", "history 10,5", "history 2 4"):
+        for cmd in ("history a", "history -1", "history 10.5", "history 10,5", "history 2 4", "history 1000"):
             self.exeCmd(cmd)
             self.assertTrue(self.capturedStdout.gotPsyqlException())
+        self.shell.history.close()
 
     def test_do_library(self):
         for line in ("lib", "library", "lib gabuzomeu poupou", "lib gabuzomeu poupoupoupou", "lib gabuzomeu remove"):
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pysqlstats module test suite
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license:GNU GPL V3
+"""
+
+# Python imports
+import unittest
+
+# Common test pysql tools
+import testhelpers
+testhelpers.setup()
+
+# Pysql imports
+from pysql import pysqlstats
+
+
+class TestStatementHash(unittest.TestCase):
+    def test_literals_are_ignored(self):
+        self.assertEqual(pysqlstats.statementHash("select * from emp where id=1"),
+                         pysqlstats.statementHash("SELECT *  from emp\nwhere id=42;"))
+        self.assertEqual(pysqlstats.statementHash("select * from emp where name='foo'"),
+                         pysqlstats.statementHash("select * from emp where name='bar'"))
+        self.assertNotEqual(pysqlstats.statementHash("select * from emp"),
+                            pysqlstats.statementHash("select * from dept"))
+
+
+class TestCommandTimer(unittest.TestCase):
+    def test_phases(self):
+        timer = pysqlstats.CommandTimer()
+        timer.enter("execute")
+        timer.enter("fetch")
+        timer.leave()
+        timer.leave()
+        timer.leave()  # Extra leave does not remove base phase
+        timer.enter("render")
+        elapsed = timer.stop()
+        self.assertAlmostEqual(sum(timer.phases.values()), elapsed, places=3)
+        self.assertEqual(timer.stack, ["parse", "render"])
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_buckets(self):
+        histogram = pysqlstats.LatencyHistogram()
+        for elapsed in (0.0005, 0.003, 0.003, 0.1, 10000):
+            histogram.add(elapsed)
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.buckets[0], 1)
+        self.assertEqual(histogram.buckets[2], 2)  # 2 - 3 ms
+        self.assertEqual(histogram.buckets[-1], 1)
+        self.assertEqual(histogram.percentile(50), 4.0)
+        self.assertEqual(histogram.percentile(100), 10000000.0)
+        self.assertEqual(histogram.getBucketLabel(2), "2 - 3 ms")
+
+    def test_empty(self):
+        self.assertEqual(pysqlstats.LatencyHistogram().percentile(95), 0.0)
+
+
+class TestStatsCollector(unittest.TestCase):
+    def test_summary(self):
+        collector = pysqlstats.StatsCollector()
+        for i in range(3):
+            timer = pysqlstats.CommandTimer()
+            timer.stop()
+            collector.record("select %d from dual" % i, timer)
+        header, result = collector.getSummary()
+        self.assertEqual(len(result), 1)
+        self.assertEqual(len(header), len(result[0]))
+        self.assertEqual(result[0][1], 3)
+        self.assertEqual(result[0][-1], "select ? from dual")
+        collector.reset()
+        self.assertEqual(collector.getSummary()[1], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
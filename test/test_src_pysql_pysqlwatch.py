@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pysqlwatch module test suite
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license:GNU GPL V3
+"""
+
+# Python imports
+import sys
+import unittest
+from io import StringIO
+
+# Common test pysql tools
+import testhelpers
+testhelpers.setup()
+
+# Pysql imports
+from pysql import pysqlwatch
+
+HEADER = ["ID", "NAME", "VALUE"]
+
+
+class TestWatchScreen(unittest.TestCase):
+    def setUp(self):
+        self.minRefresh = pysqlwatch.WATCH_MIN_REFRESH
+        pysqlwatch.WATCH_MIN_REFRESH = 0
+        self.stdout = sys.stdout
+
+    def tearDown(self):
+        pysqlwatch.WATCH_MIN_REFRESH = self.minRefresh
+        sys.stdout = self.stdout
+
+    def draw(self, screen, rows):
+        """@return: what screen wrote to draw rows"""
+        sys.stdout = StringIO()
+        try:
+            screen.draw([(HEADER, rows)], "")
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = self.stdout
+
+    def test_no_tty(self):
+        screen = pysqlwatch.WatchScreen("watch", False)
+        output = self.draw(screen, [[1, "a", 10], [2, None, 5]])
+        self.assertEqual(output.splitlines()[1:], ["ID NAME VALUE ", "-- ---- ----- ",
+                                                   " 1 a       10 ", " 2 NULL     5 "])
+
+    def test_only_changed_cells_are_redrawn(self):
+        screen = pysqlwatch.WatchScreen("watch", True)
+        output = self.draw(screen, [[1, "a", 10], [2, "b", 5]])
+        self.assertTrue(output.startswith(pysqlwatch.CLEAR_SCREEN))
+        output = self.draw(screen, [[1, "a", 12], [2, "b", 5]])
+        self.assertFalse(pysqlwatch.CLEAR_SCREEN in output)
+        self.assertTrue(pysqlwatch.MOVE_TO % (4, 9) in output)  # Value of first row
+        self.assertFalse(pysqlwatch.MOVE_TO % (5, 9) in output)  # Second row did not change
+        self.assertEqual(screen.values[(0, 1)], [1, "a", 12])
+
+    def test_rows_are_identified_by_first_columns(self):
+        screen = pysqlwatch.WatchScreen("watch", True)
+        self.draw(screen, [[1, 1, 10], [1, 2, 5]])
+        self.draw(screen, [[1, 2, 6], [1, 1, 10]])
+        self.assertEqual(sorted(screen.values.keys()), [(0, 1, 1), (0, 1, 2)])
+
+    def test_wider_value_redraws_screen(self):
+        screen = pysqlwatch.WatchScreen("watch", True)
+        self.draw(screen, [[1, "a", 10]])
+        output = self.draw(screen, [[1, "a very long name", 10]])
+        self.assertTrue(output.startswith(pysqlwatch.CLEAR_SCREEN))
+
+
+if __name__ == "__main__":
+    unittest.main()
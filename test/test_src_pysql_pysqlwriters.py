@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pysqlwriters module test suite
+@author: Sébastien Renard (sebastien.renard@digitalfox.org)
+@license:GNU GPL V3
+"""
+
+# Python imports
+import datetime
+import gzip
+import lzma
+import os
+import tempfile
+import unittest
+from io import StringIO
+
+# Common test pysql tools
+import testhelpers
+testhelpers.setup()
+
+# Pysql imports
+from pysql import pysqlwriters
+from pysql.pysqlexception import PysqlException, PysqlNotImplemented
+
+try:
+    import pyarrow
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+COLUMNS = ["ID", "NAME", "CREATED"]
+TYPES = [("NUMBER", 10, 0), ("VARCHAR", 0, 0), ("DATETIME", 0, 0)]
+ROWS = [(1, "a\tb", datetime.datetime(2010, 5, 1, 12, 30)), (2, None, None)]
+
+
+class TestWriters(unittest.TestCase):
+    def write(self, format, header=True):
+        """@return: what writer of format wrote for COLUMNS and ROWS"""
+        output = StringIO()
+        writer = pysqlwriters.newWriter(format, output, header)
+        writer.startQuery(COLUMNS, TYPES)
+        writer.writeRows(ROWS[:1])
+        writer.writeRows(ROWS[1:])
+        writer.close()
+        return output.getvalue()
+
+    def test_tsv(self):
+        self.assertEqual(self.write("tsv"), "ID\tNAME\tCREATED\n1\ta\\tb\t2010-05-01T12:30:00\n2\t\t\n")
+        self.assertEqual(self.write("tsv", header=False).splitlines()[0], "1\ta\\tb\t2010-05-01T12:30:00")
+
+    def test_csv(self):
+        self.assertEqual(self.write("csv"), "ID,NAME,CREATED\n1,a\tb,2010-05-01T12:30:00\n2,,\n")
+
+    def test_jsonl(self):
+        self.assertEqual(self.write("jsonl", header=False),
+                         '{"ID": 1, "NAME": "a\\tb", "CREATED": "2010-05-01T12:30:00"}\n'
+                         '{"ID": 2, "NAME": null, "CREATED": null}\n')
+
+    def test_unknown_format(self):
+        self.assertRaises(PysqlException, pysqlwriters.newWriter, "xml", StringIO())
+
+    def test_base_writer(self):
+        self.assertRaises(PysqlNotImplemented, pysqlwriters.Writer(StringIO()).writeRows, [(1,)])
+
+    def test_get_format(self):
+        self.assertEqual(pysqlwriters.getFormat("emp.parquet"), "parquet")
+        self.assertEqual(pysqlwriters.getFormat("EMP.JSONL"), "jsonl")
+        self.assertEqual(pysqlwriters.getFormat("emp.dat"), "csv")
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for fileName in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, fileName))
+        os.rmdir(self.directory)
+
+    def write(self, fileName, threaded=False):
+        """Writes ROWS many times to fileName
+        @return: writer"""
+        writer = pysqlwriters.openWriter(os.path.join(self.directory, fileName), threaded=threaded)
+        writer.startQuery(COLUMNS, TYPES)
+        for i in range(100):
+            writer.writeRows(ROWS)
+            writer.flush()
+        writer.close()
+        return writer
+
+    def test_get_format(self):
+        self.assertEqual(pysqlwriters.getFormat("emp.jsonl.gz"), "jsonl")
+        self.assertEqual(pysqlwriters.getCompression("emp.jsonl.gz"), "gzip")
+        self.assertEqual(pysqlwriters.getCompression("emp.jsonl"), None)
+
+    def test_gzip(self):
+        expected = open(self.write("emp.csv").fileName, newline="").read()
+        for threaded in (False, True):
+            writer = self.write("emp.csv.gz", threaded)
+            self.assertEqual(gzip.open(writer.fileName, mode="rt", newline="").read(), expected)
+            (rawSize, diskSize) = writer.sizes
+            self.assertEqual(rawSize, len(expected.encode("utf-8")))
+            self.assertTrue(diskSize < rawSize)
+
+    def test_xz(self):
+        writer = self.write("emp.jsonl.xz", threaded=True)
+        self.assertEqual(len(lzma.open(writer.fileName, mode="rt").readlines()), 200)
+
+
+class TestArrowWriters(unittest.TestCase):
+    def setUp(self):
+        (handle, self.fileName) = tempfile.mkstemp()
+        os.close(handle)
+
+    def tearDown(self):
+        if os.path.exists(self.fileName):
+            os.remove(self.fileName)
+
+    def write(self, format):
+        writer = pysqlwriters.openWriter(self.fileName, format)
+        writer.startQuery(COLUMNS, TYPES)
+        writer.writeRows(ROWS)
+        writer.writeRows(ROWS)
+        writer.close()
+
+    @unittest.skipIf(HAVE_PYARROW, "pyarrow is installed")
+    def test_without_pyarrow(self):
+        self.assertRaises(PysqlException, pysqlwriters.openWriter, self.fileName, "arrow")
+        # No empty file is left behind
+        self.assertFalse(os.path.exists(self.fileName))
+
+    @unittest.skipUnless(HAVE_PYARROW, "pyarrow is needed")
+    def test_arrow(self):
+        import pyarrow.ipc
+        self.write("arrow")
+        table = pyarrow.ipc.open_file(self.fileName).read_all()
+        self.assertEqual(table.num_rows, 4)
+        self.assertEqual(table.schema.field("ID").type, pyarrow.int64())
+        self.assertEqual(table.column("CREATED")[0].as_py(), ROWS[0][2])
+
+    @unittest.skipUnless(HAVE_PYARROW, "pyarrow is needed")
+    def test_parquet(self):
+        import pyarrow.parquet
+        self.write("parquet")
+        table = pyarrow.parquet.read_table(self.fileName)
+        self.assertEqual(table.column("NAME").to_pylist(), ["a\tb", None, "a\tb", None])
+
+
+if __name__ == "__main__":
+    unittest.main()
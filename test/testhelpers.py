@@ -32,6 +32,18 @@ def setup():
     pysqlmain.setLocale(conf)
 
 
+def setupFakeOracle():
+    """Uses the in process fake cx_Oracle driver of benchmarks (bench/fakeoracle)
+    if no real driver is installed. Must be called before pysql modules are imported
+    @return: True if the fake driver is used"""
+    try:
+        import cx_Oracle
+    except ImportError:
+        sys.path.insert(0, join(abspath(dirname(__file__)), "bench", "fakeoracle"))
+        import cx_Oracle
+    return hasattr(cx_Oracle, "register")
+
+
 class CapturedStdout:
     """Capture sys.out output in temp file to allow function result testing
     Thanks to Catherine Devlin (catherinedevlin.blogspot.com) for the idea"""